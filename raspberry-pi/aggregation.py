@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Running aggregation of sensor readings between publishes.
+
+Each numeric field keeps only a count, total, minimum and maximum, plus an
+optional P-square percentile estimate (five markers per percentile), so
+memory use does not grow with the number of readings in a window.
+
+Used by ms430-dual-mqtt.py ("aggregate" sampling policy) and by the BME280,
+Si7021 and Enviro pHAT publishers when sample_period < period. Histogram
+keeps fixed buckets for latency reporting (ms430-async-mqtt.py).
+"""
+
+import bisect
+
+
+class RunningStats(object):
+    """
+    Count, minimum, maximum and mean of a stream of numbers.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+class P2Quantile(object):
+    """
+    Streaming estimate of one quantile (0 < p < 1) using the P-square
+    algorithm (Jain & Chlamtac, 1985): five markers, O(1) memory and time
+    per value. Exact for the first five values.
+    """
+
+    __slots__ = ("p", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        self.p = p
+        self.reset()
+
+    def reset(self):
+        p = self.p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, value):
+        q = self.heights
+        if len(q) < 5:
+            q.append(value)
+            q.sort()
+            return
+
+        n = self.positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic prediction out of order; fall back to linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    @property
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            # Nearest-rank on the few values seen so far
+            return q[min(len(q) - 1, int(self.p * len(q)))]
+        return q[2]
+
+
+# Upper bucket edges for latencies in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram. bounds are the bucket upper edges (inclusive);
+    larger values go into a final overflow bucket. Quantiles are reported
+    as the upper edge of the bucket they fall in, so they are upper bounds.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.stats = RunningStats()
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def reset(self):
+        self.stats.reset()
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def add(self, value):
+        self.stats.add(value)
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def quantile(self, p):
+        if self.stats.count == 0:
+            return None
+        rank = p * self.stats.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index == len(self.bounds):
+                    return self.stats.maximum
+                return min(self.bounds[index], self.stats.maximum)
+        return self.stats.maximum
+
+    def buckets(self):
+        """
+        [(upper edge, count), ...] with None as the overflow bucket's edge.
+        """
+
+        return list(zip(self.bounds + (None,), self.counts))
+
+    def summary_line(self, unit="ms"):
+        if self.stats.count == 0:
+            return "no samples"
+        return (
+            f"n={self.stats.count} min {self.stats.minimum:.1f} mean {self.stats.mean:.1f}"
+            f" p50 <={self.quantile(0.5):.1f} p95 <={self.quantile(0.95):.1f}"
+            f" p99 <={self.quantile(0.99):.1f} max {self.stats.maximum:.1f} {unit}"
+        )
+
+
+def percentile_name(p):
+    # 0.95 -> "p95", 0.5 -> "p50", 0.999 -> "p99.9"
+    return "p" + f"{p * 100:g}"
+
+
+def is_number(value):
+    # bool is an int subclass, but on/off flags should not be averaged
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class WindowAggregator(object):
+    """
+    Aggregates flat dictionaries of readings, e.g. the Home Assistant payload
+    fields, over a publish window.
+
+    keys limits aggregation to those fields; by default every numeric field
+    is aggregated. Non-numeric fields (labels, flags) keep their latest value.
+    percentiles maps a field to the quantiles to estimate for it, e.g.
+    {"sound_pressure": [0.5, 0.95]}.
+    """
+
+    def __init__(self, keys=None, percentiles=None):
+        self.keys = keys
+        self.percentiles = percentiles or {}
+        self.stats = {}
+        self.sketches = {}
+        self.latest = {}
+
+    def add(self, values):
+        self.latest = values
+        for key, value in values.items():
+            if self.keys is not None and key not in self.keys:
+                continue
+            if not is_number(value):
+                continue
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = RunningStats()
+                self.sketches[key] = [P2Quantile(p) for p in self.percentiles.get(key, [])]
+            stats.add(value)
+            for sketch in self.sketches[key]:
+                sketch.add(value)
+
+    @property
+    def count(self):
+        return max([stats.count for stats in self.stats.values()] or [0])
+
+    def summary(self):
+        """
+        Return {key: {"min": .., "max": .., "mean": .., "count": ..}} for
+        every aggregated field, plus "p50"/"p95"/... for fields with
+        percentiles.
+        """
+
+        summary = {}
+        for key, stats in self.stats.items():
+            if stats.count == 0:
+                continue
+            field = {
+                "min": stats.minimum,
+                "max": stats.maximum,
+                "mean": stats.mean,
+                "count": stats.count,
+            }
+            for sketch in self.sketches[key]:
+                field[percentile_name(sketch.p)] = sketch.value
+            summary[key] = field
+        return summary
+
+    def means(self, digits=None):
+        """
+        {key: window mean}, rounded to digits (an int, or a dict of key -> int).
+        """
+
+        return {
+            key: _round(field["mean"], key, digits)
+            for key, field in self.summary().items()
+        }
+
+    def summary_fields(self, digits=None, names=None):
+        """
+        Flat summary fields for a payload: <name>_min, <name>_max and any
+        <name>_pNN for every aggregated field. names optionally renames
+        fields (e.g. to the legacy InfluxDB names); digits as for means().
+        """
+
+        fields = {}
+        for key, field in self.summary().items():
+            name = names.get(key, key) if names else key
+            for stat, value in field.items():
+                if stat in ("mean", "count"):
+                    continue
+                fields[f"{name}_{stat}"] = _round(value, key, digits)
+        return fields
+
+    def reset(self):
+        for stats in self.stats.values():
+            stats.reset()
+        for sketches in self.sketches.values():
+            for sketch in sketches:
+                sketch.reset()
+        self.latest = {}
+
+
+def _round(value, key, digits):
+    if isinstance(digits, dict):
+        digits = digits.get(key)
+    if digits is None or value is None:
+        return value
+    return round(value, digits)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BME280 read path benchmark.
+
+Runs the BME280 driver against a simulated I2C bus (see fake_hardware.py) and
+reports bus transactions, bytes on the bus and wall time per sample for:
+
+- uncached: calibration re-read and control registers rewritten every sample,
+            fixed worst-case conversion sleep (what readBME280All() used to do)
+- cached:   calibration read once by the BME280 object, fixed sleep
+- polled:   cached, waiting on the status register measuring bit
+- polled, 1x and 16x oversampling to show the latency range
+- normal:   normal mode at 62.5 ms standby, one data read per sample
+
+Usage: python3 bme280-benchmark.py [samples]
+"""
+
+import sys
+import time
+
+import bme280
+from fake_hardware import FakeSMBus, attach_bme280
+
+
+def uncached_sample(device):
+    device.refresh_calibration()
+    device.configure(force=True)
+    return device.read()
+
+
+def cached_sample(device):
+    return device.read()
+
+
+def normal_samples(device, samples):
+    for _ in device.samples(samples):
+        pass
+
+
+def run(label, sample, samples, **settings):
+    i2c_bus = FakeSMBus(simulate_timing=True)
+    attach_bme280(i2c_bus, bme280.DEVICE)
+    device = bme280.BME280(bme280.DEVICE, i2c_bus, **settings)
+    i2c_bus.reset_counters()
+
+    start = time.perf_counter()
+    if sample is normal_samples:
+        normal_samples(device, samples)
+    else:
+        for _ in range(samples):
+            sample(device)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{label:<12} {i2c_bus.transactions / samples:>6.1f} transactions"
+        f"  {i2c_bus.bytes_transferred / samples:>6.1f} bytes"
+        f"  {elapsed * 1000 / samples:>7.3f} ms/sample",
+        flush=True,
+    )
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print(f"BME280 read benchmark, {samples} samples per path", flush=True)
+    run("uncached", uncached_sample, samples, poll=False)
+    run("cached", cached_sample, samples, poll=False)
+    run("polled", cached_sample, samples)
+
+    x1 = bme280.OVERSAMPLE_X1
+    x16 = bme280.OVERSAMPLE_X16
+    run("polled 1x", cached_sample, samples, osrs_t=x1, osrs_p=x1, osrs_h=x1)
+    run("polled 16x", cached_sample, samples, osrs_t=x16, osrs_p=x16, osrs_h=x16)
+    run("normal", normal_samples, samples, standby=bme280.STANDBY_62_5_MS)
+
+
+if __name__ == "__main__":
+    main()
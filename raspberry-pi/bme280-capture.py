@@ -4,9 +4,9 @@
 # This script will pull data from the BME280 sensor and send it to a MQTT broker.
 
 import time
-import smbus
 import bme280
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from line_protocol import LINE_FORMAT_COMPAT, LINE_FORMAT_MULTI_FIELD, build_payload, timestamp_ns
 
 # MQTT details
 brokerAddress = "192.168.1.24"  # Update accordingly
@@ -15,6 +15,19 @@ clientName = "EnviroPi"         # Update accordingly
 # Define the time between sending data to MQTT broker - default is 60 seconds
 period = 60
 
+# All values are sent in one MQTT publish per reading. LINE_FORMAT_COMPAT keeps the
+# old "temperature,room=..,floor=.. value=.." measurements (one line each);
+# LINE_FORMAT_MULTI_FIELD sends a single "bme280,room=..,floor=.. temperature=..,..." line.
+line_format = LINE_FORMAT_COMPAT
+measurement = "bme280"
+tags = {"room" : "living-room-bme280", "floor" : "downstairs"}
+
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+client = connection.client
+
 # Main code
 def run():
   while True:
@@ -23,11 +36,8 @@ def run():
     if temperature is not None and pressure is not None and humidity is not None:
         try:
             # Send data to MQTT
-            client = mqtt.Client(clientName)
-            client.connect(brokerAddress)
-            client.publish("sensors", "temperature,room=living-room-bme280,floor=downstairs value=" +str(temperature))
-            client.publish("sensors", "humidity,room=living-room-bme280,floor=downstairs value=" +str(humidity))
-            client.publish("sensors", "pressure,room=living-room-bme280,floor=downstairs value=" +str(pressure))
+            fields = {"temperature" : temperature, "humidity" : humidity, "pressure" : pressure}
+            client.publish("sensors", build_payload(line_format, measurement, tags, fields, timestamp_ns()))
         except Exception:
           # Process exception here
           print ("Error while sending to MQTT broker")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BME280 compensation engine benchmark and cross-check.
+
+Compensates the same set of raw ADC values with:
+
+- bme280.compensate()       double-precision datasheet formulas
+- bme280.compensateInt()    32/64-bit integer datasheet formulas
+- bme280.compensateBatch()  the integer formulas vectorised with NumPy
+
+then reports the time per sample of each and the largest difference between
+them. The engines must agree within the datasheet output resolution
+(0.01 C, 0.01 hPa, 0.01 %RH, with a little headroom for the float path)
+and the batch results must match the scalar integer ones exactly.
+
+Usage: python3 bme280-compensation-benchmark.py [samples] [calibration.json]
+
+The calibration file, if given, is a JSON object of dig_T1..dig_H6 values,
+e.g. as printed by bme280.getCalibration(); otherwise the datasheet example
+trimming values are used.
+"""
+
+import json
+import random
+import sys
+import time
+
+import bme280
+from fake_hardware import BME280_EXAMPLE_CALIBRATION
+
+# Maximum allowed float vs integer difference per channel
+TOLERANCE = {"temperature": 0.01, "pressure": 0.02, "humidity": 0.02}
+
+
+def random_raw(samples, seed=1):
+    rng = random.Random(seed)
+    pres = [rng.randint(250000, 500000) for _ in range(samples)]
+    temp = [rng.randint(420000, 600000) for _ in range(samples)]
+    hum = [rng.randint(15000, 45000) for _ in range(samples)]
+    return pres, temp, hum
+
+
+def time_scalar(function, cal, pres, temp, hum):
+    start = time.perf_counter()
+    results = [function(cal, p, t, h) for p, t, h in zip(pres, temp, hum)]
+    return time.perf_counter() - start, results
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as cal_file:
+            cal = json.load(cal_file)
+    else:
+        cal = BME280_EXAMPLE_CALIBRATION
+
+    pres, temp, hum = random_raw(samples)
+
+    float_time, float_results = time_scalar(bme280.compensate, cal, pres, temp, hum)
+    int_time, int_results = time_scalar(bme280.compensateInt, cal, pres, temp, hum)
+
+    start = time.perf_counter()
+    batch_results = bme280.compensateBatch(cal, pres, temp, hum)
+    batch_time = time.perf_counter() - start
+
+    print(f"BME280 compensation, {samples} samples", flush=True)
+    for label, elapsed in [("float", float_time), ("integer", int_time), ("numpy batch", batch_time)]:
+        print(f"{label:<12} {elapsed * 1e6 / samples:>8.3f} us/sample", flush=True)
+
+    failed = False
+    for channel, name in enumerate(["temperature", "pressure", "humidity"]):
+        float_vs_int = max(abs(f[channel] - i[channel]) for f, i in zip(float_results, int_results))
+        batch_vs_int = max(
+            abs(float(b) - i[channel]) for b, i in zip(batch_results[channel], int_results)
+        )
+        ok = float_vs_int <= TOLERANCE[name] and batch_vs_int == 0
+        failed = failed or not ok
+        print(
+            f"{name:<12} max |float - integer| = {float_vs_int:.5f}"
+            f"  max |batch - integer| = {batch_vs_int:.5f}  {'OK' if ok else 'FAIL'}",
+            flush=True,
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,15 @@
 import time
 import datetime
 import sys
-import smbus
 import bme280
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+from local_store import LocalStore
 import json
+import compact_codec
+from aggregation import WindowAggregator
+from deadband import DeadbandFilter
+from raw_capture import RawCaptureWriter
 
 # MQTT details - Update accordingly
 brokerAddress = "192.168.1.24"  # IP or URL of your MQTT broker
@@ -22,46 +27,91 @@ sensor = "bme280"               # The type of sensor used
 # Define the time between sending data to MQTT broker - default is 60 seconds
 period = 60
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
-
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+# Optionally keep readings on disk while the broker is unreachable and send them once it is back -
+# i.e. "/home/pi/mqtt-buffer". Payloads then also carry a top-level "timestamp" (Unix time of the
+# reading) so Telegraf can store late ones at the right time (json_time_key = "timestamp").
+offline_buffer_dir = None
+
+# "cbor" publishes compact CBOR payloads on <channel>/cbor instead of JSON, for nodes on weak Wi-Fi.
+# Run cbor-bridge.py next to the broker to republish them as the usual JSON on channel.
+payload_encoding = "json"
+
+# Optionally keep every reading in an SQLite file on the Pi, rolled up per minute and per hour, for local
+# history while the NAS is down - i.e. "/home/pi/readings.db" (see local_store.py)
+local_store_file = None
+
+# Optionally read the sensor more often than it publishes - i.e. every 5 seconds - and
+# publish the mean with _min/_max fields over each period. None reads once per period.
+sample_period = None
+
+# Optionally only send the fields that moved more than a deadband since they were last sent -
+# i.e. {"temperature" : 0.2, "humidity" : 1.0, "pressure" : 0.5}. None sends every field every period.
+deadbands = None
+# With deadbands set, every field is still re-sent at least this often (seconds)
+heartbeat = 15 * 60
+
+# Optionally record the raw sensor data to a file for raw-replay.py - i.e. "/home/pi/bme280.rawcap"
+raw_capture_file = None
+
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+
+# Readings go through the offline buffer when one is configured
+publisher = BufferedPublisher(connection, offline_buffer_dir)
+publisher.start()
+
+# Local history when a store file is set
+store = LocalStore(local_store_file) if local_store_file else None
+
+# Start recording raw data if enabled
+capture = None
+if raw_capture_file:
+    capture = RawCaptureWriter(raw_capture_file)
+    bme280.getDevice().set_capture(capture)
+
+# Readings between publishes when sample_period is set
+aggregator = WindowAggregator()
+last_publish = 0.0
+
+# Report-by-exception filter when deadbands are set
+deadband = DeadbandFilter(deadbands, heartbeat) if deadbands else None
 
 # Main code
 while True:
     try:
         # Get the readings from the BME280 sensor
         temperature,pressure,humidity = bme280.readBME280All()
+        if capture:
+            capture.flush()
+        readings = {
+            "temperature" : temperature,
+            "humidity" : humidity,
+            "pressure" : pressure,
+        }
+        if store:
+            # Every reading goes into the local history, before any aggregation or deadband
+            store.add(readings, sensor=sensor)
+        if sample_period:
+            # Aggregate until the next publish is due
+            aggregator.add(readings)
+            if time.monotonic() - last_publish < period:
+                time.sleep(sample_period)
+                continue
+            last_publish = time.monotonic()
+            readings = aggregator.means()
+            readings.update(aggregator.summary_fields())
+            aggregator.reset()
+        if deadband:
+            # Only send the fields that moved, or everything on the heartbeat
+            readings = deadband.filter(readings)
         # Sort the data for JSON - variables set earlier used here
         ## New structure
         raw_mqtt_data = {
             zone : {
                 room : {
-                    sensor : {
-                        "temperature" : temperature,
-                        "humidity" : humidity,
-                        "pressure" : pressure
-                    },
+                    sensor : readings,
                 },
             },
         }
@@ -77,13 +127,18 @@ while True:
         #    "sensor" : "BME280",
         #    "level" : zone
         #}
-        JSON_mqtt_data = json.dumps(raw_mqtt_data)
+        if offline_buffer_dir:
+            raw_mqtt_data["timestamp"] = round(time.time(), 3)
+        if payload_encoding == "cbor":
+            topic, mqtt_data = channel + "/cbor", compact_codec.encode(raw_mqtt_data)
+        else:
+            topic, mqtt_data = channel, json.dumps(raw_mqtt_data)
         # Now try sending the data to MQTT broker
-        if temperature is not None and pressure is not None and humidity is not None:
+        if readings and temperature is not None and pressure is not None and humidity is not None:
             try:
                 # Send data to MQTT
                 now = datetime.datetime.now()
-                client.publish(channel, JSON_mqtt_data, qos=0, retain=True)
+                publisher.publish(topic, mqtt_data, qos=1, retain=True)
                 sys.stdout.flush()
             except Exception:
                 # Error
@@ -95,9 +150,12 @@ while True:
                 sys.stdout.flush()
 
         # Sleep and then repeat
-        time.sleep(period)
+        time.sleep(sample_period or period)
 
     # Allow a graceful exit if run manually
     except (KeyboardInterrupt, SystemExit):
+        publisher.stop()
+        if store:
+            store.close()
         sys.exit("Goodbye!")
         pass
\ No newline at end of file
@@ -2,12 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import bme280
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
 import time
 import datetime
 import sys
-import httplib, urllib
-from microdotphat import write_string, set_decimal, clear, show, set_brightness
+from mdot_display import LatestValues, MicroDotDisplay
 
 # MQTT details
 brokerAddress = "192.168.1.24"  # Update accordingly
@@ -15,69 +14,59 @@ clientName = "PiZeroThomas"     # Update accordingly
 room = "thomas-room"            # Update accordingly
 zone = "upstairs"               # Update accordingly
 
-# Global brightness on Microdot pHAT
-set_brightness(0.25)
+# Define the time between sending data to MQTT broker - default is 60 seconds
+period = 60
+
+# How often to read the sensor for the display (seconds) - the latest reading is published every period
+sample_period = 10
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
+# Micro Dot pHAT - pages shown in turn (add "pressure" to show it too), seconds each page stays up,
+# and how often the current page is redrawn (keeps the clock current)
+display_pages = ["time", "temperature", "humidity"]
+display_page_seconds = 20
+display_refresh = 1
+
+# Global brightness on Microdot pHAT
+display_brightness = 0.25
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+client = connection.client
 
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+# The display runs on its own thread from the latest reading, so sampling and publishing never wait on it;
+# a reading missed for three sample periods shows as "----"
+latest = LatestValues()
+display = MicroDotDisplay(
+    latest,
+    pages=display_pages,
+    page_seconds=display_page_seconds,
+    refresh=display_refresh,
+    stale_after=3 * sample_period,
+    brightness=display_brightness,
+)
+display.start()
+last_publish = 0.0
 
 # Run the main code in a loop
 while True:
     try:
         # Get readings from the BME280 sensor
         temperature,pressure,humidity = bme280.readBME280All()
-        now = datetime.datetime.now()
-        client.publish("sensors", "temperature,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(temperature))
-        client.publish("sensors", "humidity,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(humidity))
-        client.publish("sensors", "pressure,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(pressure))
-        print("Data sent at: " +(now.strftime("%H:%M:%S on %d/%m/%Y")))
-        sys.stdout.flush()
-        # Microdot pHAT stuff
-        zzz = 20
-        # Display the time
-        clear()
-        t = datetime.datetime.now()
-        write_string(t.strftime('%H:%M'), kerning=False)
-        show()
-        time.sleep(zzz)
-        # Display the temperature
-        clear()
-        write_string( "%.1f" % temperature + "C", kerning=False)
-        show()
-        time.sleep(zzz)
-        # Uncomment to display pressure if needed
-        #clear()
-        #write_string( "%.0f" % pressure + "hPa", kerning=False)
-        #show()
-        #time.sleep(zzz)
-        # Display the humidity
-        clear()
-        write_string( "%.0f" % humidity + "% RH", kerning=False)
-        show()
-        time.sleep(zzz)
+        if temperature is not None and pressure is not None and humidity is not None:
+            latest.update({"temperature" : temperature, "humidity" : humidity, "pressure" : pressure})
+            if time.monotonic() - last_publish >= period:
+                last_publish = time.monotonic()
+                now = datetime.datetime.now()
+                client.publish("sensors", "temperature,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(temperature))
+                client.publish("sensors", "humidity,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(humidity))
+                client.publish("sensors", "pressure,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(pressure))
+                print("Data sent at: " +(now.strftime("%H:%M:%S on %d/%m/%Y")))
+                sys.stdout.flush()
+        time.sleep(sample_period)
 
     except (KeyboardInterrupt, SystemExit):
+        display.stop()
         sys.exit("Goodbye!")
-        pass
\ No newline at end of file
+        pass
@@ -2,13 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import bme280
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+from local_store import LocalStore
 import time
 import datetime
 import sys
-import httplib, urllib
 import json
-from microdotphat import write_string, set_decimal, clear, show, set_brightness
+import compact_codec
+from mdot_display import LatestValues, MicroDotDisplay
 
 # MQTT details - Update accordingly
 brokerAddress = "192.168.1.24"  # IP or URL of your MQTT broker
@@ -18,39 +20,73 @@ room = "thomas_room"            # The room your sensor is in - i.e. living-room
 zone = "upstairs"               # The zone your sensor is in - i.e. upstairs
 sensor = "bme280"               # The type of sensor used
 
+# Optionally keep readings on disk while the broker is unreachable and send them once it is back -
+# i.e. "/home/pi/mqtt-buffer". Payloads then also carry a top-level "timestamp" (Unix time of the
+# reading) so Telegraf can store late ones at the right time (json_time_key = "timestamp").
+offline_buffer_dir = None
+
+# "cbor" publishes compact CBOR payloads on <channel>/cbor instead of JSON, for nodes on weak Wi-Fi.
+# Run cbor-bridge.py next to the broker to republish them as the usual JSON on channel.
+payload_encoding = "json"
+
+# Optionally keep every reading in an SQLite file on the Pi, rolled up per minute and per hour, for local
+# history while the NAS is down - i.e. "/home/pi/readings.db" (see local_store.py)
+local_store_file = None
+
+# Define the time between sending data to MQTT broker - default is 60 seconds
+period = 60
+
+# How often to read the sensor for the display (seconds) - the latest reading is published every period
+sample_period = 10
+
+# Micro Dot pHAT - pages shown in turn (add "pressure" to show it too), seconds each page stays up,
+# and how often the current page is redrawn (keeps the clock current)
+display_pages = ["time", "temperature", "humidity"]
+display_page_seconds = 20
+display_refresh = 1
+
 # Global brightness on Microdot pHAT
-set_brightness(0.25)
-
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
-
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+display_brightness = 0.25
+
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+
+# Readings go through the offline buffer when one is configured
+publisher = BufferedPublisher(connection, offline_buffer_dir)
+publisher.start()
+
+# Local history when a store file is set
+store = LocalStore(local_store_file) if local_store_file else None
+
+# The display runs on its own thread from the latest reading, so sampling and publishing never wait on it;
+# a reading missed for three sample periods shows as "----"
+latest = LatestValues()
+display = MicroDotDisplay(
+    latest,
+    pages=display_pages,
+    page_seconds=display_page_seconds,
+    refresh=display_refresh,
+    stale_after=3 * sample_period,
+    brightness=display_brightness,
+)
+display.start()
+last_publish = 0.0
 
 # Run the main code in a loop
 while True:
     try:
         # Get readings from the BME280 sensor
         temperature,pressure,humidity = bme280.readBME280All()
+        if temperature is not None and pressure is not None and humidity is not None:
+            latest.update({"temperature" : temperature, "humidity" : humidity, "pressure" : pressure})
+        if store:
+            store.add({"temperature" : temperature, "humidity" : humidity, "pressure" : pressure}, sensor=sensor)
+        if time.monotonic() - last_publish < period:
+            time.sleep(sample_period)
+            continue
+        last_publish = time.monotonic()
         # Sort the data for JSON - variables set earlier used here
         ## New structure
         raw_mqtt_data = {
@@ -76,42 +112,31 @@ while True:
         #    "sensor" : "BME280",
         #    "level" : zone
         #}
-        JSON_mqtt_data = json.dumps(raw_mqtt_data)
-        # Now try sending the data to MQTT broker and dusplay on Micro Dot pHAT
+        if offline_buffer_dir:
+            raw_mqtt_data["timestamp"] = round(time.time(), 3)
+        if payload_encoding == "cbor":
+            topic, mqtt_data = channel + "/cbor", compact_codec.encode(raw_mqtt_data)
+        else:
+            topic, mqtt_data = channel, json.dumps(raw_mqtt_data)
+        # Now try sending the data to MQTT broker
         if temperature is not None and pressure is not None and humidity is not None:
             try:
                 now = datetime.datetime.now()
-                client.publish(channel, JSON_mqtt_data, qos=0, retain=True)
+                publisher.publish(topic, mqtt_data, qos=1, retain=True)
                 print("Data sent to MQTT broker " + str(brokerAddress) + " at " + (now.strftime("%H:%M:%S on %d/%m/%Y")))
                 sys.stdout.flush()
-                # Microdot pHAT stuff
-                zzz = 20
-                # Display the time
-                clear()
-                t = datetime.datetime.now()
-                write_string(t.strftime('%H:%M'), kerning=False)
-                show()
-                time.sleep(zzz)
-                # Display the temperature
-                clear()
-                write_string( "%.1f" % temperature + "C", kerning=False)
-                show()
-                time.sleep(zzz)
-                # Uncomment to display pressure if needed
-                #clear()
-                #write_string( "%.0f" % pressure + "hPa", kerning=False)
-                #show()
-                #time.sleep(zzz)
-                # Display the humidity
-                clear()
-                write_string( "%.0f" % humidity + "% RH", kerning=False)
-                show()
-                time.sleep(zzz)
             except Exception:
                 # Error
                 print("Error while sending to MQTT broker")
                 sys.stdout.flush()
 
+        # Sleep and then repeat
+        time.sleep(sample_period)
+
     except (KeyboardInterrupt, SystemExit):
+        display.stop()
+        publisher.stop()
+        if store:
+            store.close()
         sys.exit("Goodbye!")
         pass
\ No newline at end of file
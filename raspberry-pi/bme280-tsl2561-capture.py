@@ -6,12 +6,18 @@
 import time
 import datetime
 import sys
-import smbus
+import i2c_manager
 import bme280
-import paho.mqtt.client as mqtt
+import tsl2561
+from read_cycle import ReadCycle, bme280_stage, tsl2561_stage
+from mqtt_connection import MQTTConnection
+from line_protocol import LINE_FORMAT_COMPAT, LINE_FORMAT_MULTI_FIELD, build_payload, timestamp_ns
 
-# Initialise the TSL2561 sensor
-bus = smbus.SMBus(1)
+# Initialise the TSL2561 sensor, switching between 16x and 1x gain with the light. 101 ms integration
+# resolves about 0.1 lux; INTEGRATION_402MS is finer for dark rooms, INTEGRATION_13MS quicker still.
+# Both sensors share one locked handle on I2C bus 1 (see i2c_manager.py)
+bus = i2c_manager.get_bus(1)
+light_sensor = tsl2561.TSL2561(bus, integration=tsl2561.INTEGRATION_101MS, auto_gain=True)
 
 # MQTT details
 brokerAddress = "192.168.1.24"  # Update accordingly
@@ -22,58 +28,50 @@ zone = "downstairs"             # Update accordingly
 # Define the time between sending data to MQTT broker - default is 60 seconds
 period = 60
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
+# Print when each sensor was started, ready and read in every cycle, and the I2C bus counters and
+# latencies so far, to debug slow reads
+print_read_timings = False
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
+# All values are sent in one MQTT publish per reading. LINE_FORMAT_COMPAT keeps the
+# old "temperature,room=..,floor=.. value=.." measurements (one line each);
+# LINE_FORMAT_MULTI_FIELD sends one "bme280,..." and one "tsl2561,..." multi-field line.
+line_format = LINE_FORMAT_COMPAT
 
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+client = connection.client
 
-# Get ambient light level from the TSL2561 sensor
-def get_light():
-    bus.write_byte_data(0x39, 0x00 | 0x80, 0x03)
-    bus.write_byte_data(0x39, 0x01 | 0x80, 0x02)
-    time.sleep(0.5)
-    full_data = bus.read_i2c_block_data(0x39, 0x0C | 0x80, 2)
-    ir_data = bus.read_i2c_block_data(0x39, 0x0E | 0x80, 2)
-    full_spectrum = full_data[1] * 256 + full_data[0]
-    infrared = ir_data[1] * 256 + ir_data[0]
-    visible = full_spectrum - infrared
-    return visible
+# Both sensors convert at the same time; a cycle takes about as long as the slower one
+read_cycle = ReadCycle([bme280_stage(bme280.getDevice()), tsl2561_stage(light_sensor)])
 
 # Main code
 while True:
     try:
-         # Get the readings from the BME280 sensor
-        temperature,pressure,humidity = bme280.readBME280All()
-        # Get the lux level from the TSL2561 sensor
-        lux = get_light()
-        if temperature is not None and pressure is not None and humidity is not None and lux is not None:
+        # Start both sensors converting, then collect each as it finishes
+        results = read_cycle.run()
+        if print_read_timings:
+            print(read_cycle.report())
+            print(bus.report())
+        temperature,pressure,humidity = results["bme280"] or (None, None, None)
+        lux = results["tsl2561"]
+        if temperature is not None and pressure is not None and humidity is not None:
             try:
                 # Send data to MQTT
                 now = datetime.datetime.now()
-                client.publish("sensors", "temperature,room=" + str(room) + "-bme280,floor=" + str(zone) + " value=" + str(temperature))
-                client.publish("sensors", "humidity,room=" + str(room) + "-bme280,floor=" + str(zone) + " value=" + str(humidity))
-                client.publish("sensors", "pressure,room=" + str(room) + "-bme280,floor=" + str(zone) + " value=" + str(pressure))
-                client.publish("sensors", "lux,room=" + str(room) + "-tsl2561,floor=" + str(zone) + " value=" + str(lux))
+                # Each sensor keeps its own room tag; both go out in one publish
+                timestamp = timestamp_ns()
+                bme280_fields = {"temperature" : temperature, "humidity" : humidity, "pressure" : pressure}
+                bme280_tags = {"room" : str(room) + "-bme280", "floor" : zone}
+                tsl2561_tags = {"room" : str(room) + "-tsl2561", "floor" : zone}
+                lines = [build_payload(line_format, "bme280", bme280_tags, bme280_fields, timestamp)]
+                # lux is None when the light sensor is saturated (above about 70 klx, i.e. direct sun)
+                # or failed to read; the BME280 values are still sent
+                if lux is not None:
+                    lines.append(build_payload(line_format, "tsl2561", tsl2561_tags, {"lux" : lux}, timestamp))
+                payload = "\n".join(lines)
+                client.publish("sensors", payload)
                 sys.stdout.flush()
             except Exception:
                 # Process exception here
@@ -6,13 +6,21 @@
 import time
 import datetime
 import sys
-import smbus
+import i2c_manager
 import bme280
-import paho.mqtt.client as mqtt
+import tsl2561
+from read_cycle import ReadCycle, bme280_stage, tsl2561_stage
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+from local_store import LocalStore
 import json
+import compact_codec
 
-# Initialise the TSL2561 sensor
-bus = smbus.SMBus(1)
+# Initialise the TSL2561 sensor, switching between 16x and 1x gain with the light. 101 ms integration
+# resolves about 0.1 lux; INTEGRATION_402MS is finer for dark rooms, INTEGRATION_13MS quicker still.
+# Both sensors share one locked handle on I2C bus 1 (see i2c_manager.py)
+bus = i2c_manager.get_bus(1)
+light_sensor = tsl2561.TSL2561(bus, integration=tsl2561.INTEGRATION_101MS, auto_gain=True)
 
 # MQTT details - Update accordingly
 brokerAddress = "192.168.1.24"  # IP or URL of your MQTT broker
@@ -26,50 +34,51 @@ sensor_2 = "tsl2561"
 # Define the time between sending data to MQTT broker - default is 60 seconds
 period = 60
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
-
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
-
-# Get ambient light level from the TSL2561 sensor
-def get_light():
-    bus.write_byte_data(0x39, 0x00 | 0x80, 0x03)
-    bus.write_byte_data(0x39, 0x01 | 0x80, 0x02)
-    time.sleep(0.5)
-    full_data = bus.read_i2c_block_data(0x39, 0x0C | 0x80, 2)
-    ir_data = bus.read_i2c_block_data(0x39, 0x0E | 0x80, 2)
-    full_spectrum = full_data[1] * 256 + full_data[0]
-    infrared = ir_data[1] * 256 + ir_data[0]
-    visible = full_spectrum - infrared
-    return visible
+# Print when each sensor was started, ready and read in every cycle, and the I2C bus counters and
+# latencies so far, to debug slow reads
+print_read_timings = False
+
+# Optionally keep readings on disk while the broker is unreachable and send them once it is back -
+# i.e. "/home/pi/mqtt-buffer". Payloads then also carry a top-level "timestamp" (Unix time of the
+# reading) so Telegraf can store late ones at the right time (json_time_key = "timestamp").
+offline_buffer_dir = None
+
+# "cbor" publishes compact CBOR payloads on <channel>/cbor instead of JSON, for nodes on weak Wi-Fi.
+# Run cbor-bridge.py next to the broker to republish them as the usual JSON on channel.
+payload_encoding = "json"
+
+# Optionally keep every reading in an SQLite file on the Pi, rolled up per minute and per hour, for local
+# history while the NAS is down - i.e. "/home/pi/readings.db" (see local_store.py)
+local_store_file = None
+
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+connection.wait_connected()
+
+# Readings go through the offline buffer when one is configured
+publisher = BufferedPublisher(connection, offline_buffer_dir)
+publisher.start()
+
+# Local history when a store file is set
+store = LocalStore(local_store_file) if local_store_file else None
+
+# Both sensors convert at the same time; a cycle takes about as long as the slower one
+read_cycle = ReadCycle([bme280_stage(bme280.getDevice()), tsl2561_stage(light_sensor)])
 
 # Main code
 while True:
     try:
-        # Get the readings from the BME280 sensor
-        temperature,pressure,humidity = bme280.readBME280All()
-        # Get the reading from the TSL2561 sensor
-        lux = get_light()
+        # Start both sensors converting, then collect each as it finishes
+        results = read_cycle.run()
+        if print_read_timings:
+            print(read_cycle.report())
+            print(bus.report())
+        temperature,pressure,humidity = results["bme280"] or (None, None, None)
+        lux = results["tsl2561"]
+        if store:
+            store.add({"temperature" : temperature, "humidity" : humidity, "pressure" : pressure}, sensor=sensor_1)
+            store.add({"lux" : lux}, sensor=sensor_2)
         # Sort the data for JSON - variables set earlier used here
         ## New structure (UNTESTED)
         raw_mqtt_data = {
@@ -80,12 +89,13 @@ while True:
                         "humidity" : humidity,
                         "pressure" : pressure
                     },
-                    sensor_2 : {
-                        "lux" : lux
-                    },
                 },
             },
         }
+        # lux is None when the light sensor is saturated (above about 70 klx, i.e. direct sun) or
+        # failed to read; the BME280 values are still sent, without the light reading
+        if lux is not None:
+            raw_mqtt_data[zone][room][sensor_2] = {"lux" : lux}
 
         ## Previous structure
         #raw_mqtt_data = {
@@ -104,13 +114,18 @@ while True:
         #    "device" : room,
         #    "level" : zone
         #}
-        JSON_mqtt_data = json.dumps(raw_mqtt_data)
+        if offline_buffer_dir:
+            raw_mqtt_data["timestamp"] = round(time.time(), 3)
+        if payload_encoding == "cbor":
+            topic, mqtt_data = channel + "/cbor", compact_codec.encode(raw_mqtt_data)
+        else:
+            topic, mqtt_data = channel, json.dumps(raw_mqtt_data)
         # Now try sending the data to MQTT broker
-        if temperature is not None and pressure is not None and humidity is not None and lux is not None:
+        if temperature is not None and pressure is not None and humidity is not None:
             try:
                 # Send data to MQTT
                 now = datetime.datetime.now()
-                client.publish(channel, JSON_mqtt_data, qos=0, retain=True)
+                publisher.publish(topic, mqtt_data, qos=1, retain=True)
                 sys.stdout.flush()
             except Exception:
                 # Error
@@ -126,5 +141,8 @@ while True:
 
     # Allow a graceful exit if run manually
     except (KeyboardInterrupt, SystemExit):
+        publisher.stop()
+        if store:
+            store.close()
         sys.exit("Goodbye!")
         pass
\ No newline at end of file
@@ -4,17 +4,22 @@
 # This is imported by all BME280 related examples! #
 ####################################################
 
-import smbus
 import time
 from ctypes import c_short
 from ctypes import c_byte
 from ctypes import c_ubyte
 
+import i2c_manager
+
 DEVICE = 0x76 # Default device I2C address
 
+BUS = 1 # Rev 2 Pi, Pi 2 & Pi 3 uses bus 1
+        # Rev 1 Pi uses bus 0
 
-bus = smbus.SMBus(1) # Rev 2 Pi, Pi 2 & Pi 3 uses bus 1
-                     # Rev 1 Pi uses bus 0
+# The shared, locked handle for BUS (see i2c_manager.py), opened on first
+# use rather than at import time
+def getBus():
+  return i2c_manager.get_bus(BUS)
 
 def getShort(data, index):
   # return two bytes from data as a signed 16-bit value
@@ -39,101 +44,181 @@ def getUChar(data,index):
 def readBME280ID(addr=DEVICE):
   # Chip ID Register Address
   REG_ID     = 0xD0
-  (chip_id, chip_version) = bus.read_i2c_block_data(addr, REG_ID, 2)
+  (chip_id, chip_version) = getBus().read_i2c_block_data(addr, REG_ID, 2)
   return (chip_id, chip_version)
 
-def readBME280All(addr=DEVICE):
-  # Register Addresses
-  REG_DATA = 0xF7
-  REG_CONTROL = 0xF4
-  REG_CONFIG  = 0xF5
-
-  REG_CONTROL_HUM = 0xF2
-  REG_HUM_MSB = 0xFD
-  REG_HUM_LSB = 0xFE
-
-  # Oversample setting - page 27
-  OVERSAMPLE_TEMP = 2
-  OVERSAMPLE_PRES = 2
-  MODE = 1
-
-  # Oversample setting for humidity register - page 26
-  OVERSAMPLE_HUM = 2
-  bus.write_byte_data(addr, REG_CONTROL_HUM, OVERSAMPLE_HUM)
-
-  control = OVERSAMPLE_TEMP<<5 | OVERSAMPLE_PRES<<2 | MODE
-  bus.write_byte_data(addr, REG_CONTROL, control)
-
+# Register Addresses
+REG_DATA = 0xF7
+REG_CONTROL = 0xF4
+REG_CONFIG  = 0xF5
+REG_STATUS = 0xF3
+
+REG_CONTROL_HUM = 0xF2
+REG_HUM_MSB = 0xFD
+REG_HUM_LSB = 0xFE
+
+# Status register bit set while a conversion is running - page 29
+STATUS_MEASURING = 0x08
+
+# Oversampling register values - pages 26/27
+OVERSAMPLE_SKIP = 0
+OVERSAMPLE_X1 = 1
+OVERSAMPLE_X2 = 2
+OVERSAMPLE_X4 = 3
+OVERSAMPLE_X8 = 4
+OVERSAMPLE_X16 = 5
+
+# Register value -> number of samples averaged
+OVERSAMPLE_FACTOR = {0: 0, 1: 1, 2: 2, 3: 4, 4: 8, 5: 16}
+
+# IIR filter coefficient - page 29
+FILTER_OFF = 0
+FILTER_2 = 1
+FILTER_4 = 2
+FILTER_8 = 3
+FILTER_16 = 4
+
+# Normal mode standby time between conversions - page 29
+STANDBY_0_5_MS = 0
+STANDBY_62_5_MS = 1
+STANDBY_125_MS = 2
+STANDBY_250_MS = 3
+STANDBY_500_MS = 4
+STANDBY_1000_MS = 5
+STANDBY_10_MS = 6
+STANDBY_20_MS = 7
+
+# Standby register value -> standby time in ms
+STANDBY_TIME_MS = {0: 0.5, 1: 62.5, 2: 125.0, 3: 250.0, 4: 500.0, 5: 1000.0, 6: 10.0, 7: 20.0}
+
+# Sensor modes
+MODE_SLEEP = 0
+MODE_FORCED = 1
+MODE_NORMAL = 3
+
+# Default oversample setting - page 27
+OVERSAMPLE_TEMP = OVERSAMPLE_X2
+OVERSAMPLE_PRES = OVERSAMPLE_X2
+MODE = MODE_FORCED
+
+# Default oversample setting for humidity register - page 26
+OVERSAMPLE_HUM = OVERSAMPLE_X2
+
+# Delay between status register polls while a conversion is running
+POLL_INTERVAL = 0.0005
+
+def measurementTime(osrs_t, osrs_p, osrs_h, typical=False):
+  # Conversion time in ms for the given oversampling register values
+  # (Datasheet Appendix B: Measurement time and current calculation)
+  t = OVERSAMPLE_FACTOR[osrs_t]
+  p = OVERSAMPLE_FACTOR[osrs_p]
+  h = OVERSAMPLE_FACTOR[osrs_h]
+  if typical:
+    return 1.0 + (2.0 * t) + ((2.0 * p + 0.5) if p else 0) + ((2.0 * h + 0.5) if h else 0)
+  return 1.25 + (2.3 * t) + ((2.3 * p + 0.575) if p else 0) + ((2.3 * h + 0.575) if h else 0)
+
+def _sleep_until(deadline):
+  delay = deadline - time.time()
+  if delay > 0:
+    time.sleep(delay)
+
+# Decoded calibration coefficients, keyed by I2C address. The EEPROM
+# contents never change, so they are only read again on an explicit refresh.
+_calibration_cache = {}
+
+# Calibration blocks as read from the EEPROM, keyed by I2C address, so a
+# raw capture can store them alongside the data
+_calibration_raw = {}
+
+# Calibration block register addresses and lengths - page 22
+CALIBRATION_BLOCKS = ((0x88, 24), (0xA1, 1), (0xE1, 7))
+
+def readCalibration(addr=DEVICE, i2c_bus=None):
   # Read blocks of calibration data from EEPROM
   # See Page 22 data sheet
-  cal1 = bus.read_i2c_block_data(addr, 0x88, 24)
-  cal2 = bus.read_i2c_block_data(addr, 0xA1, 1)
-  cal3 = bus.read_i2c_block_data(addr, 0xE1, 7)
+  if i2c_bus is None:
+    i2c_bus = getBus()
+  blocks = [i2c_bus.read_i2c_block_data(addr, reg, length) for reg, length in CALIBRATION_BLOCKS]
+  _calibration_raw[addr] = blocks
+  return decodeCalibration(*blocks)
 
+def decodeCalibration(cal1, cal2, cal3):
   # Convert byte data to word values
-  dig_T1 = getUShort(cal1, 0)
-  dig_T2 = getShort(cal1, 2)
-  dig_T3 = getShort(cal1, 4)
-
-  dig_P1 = getUShort(cal1, 6)
-  dig_P2 = getShort(cal1, 8)
-  dig_P3 = getShort(cal1, 10)
-  dig_P4 = getShort(cal1, 12)
-  dig_P5 = getShort(cal1, 14)
-  dig_P6 = getShort(cal1, 16)
-  dig_P7 = getShort(cal1, 18)
-  dig_P8 = getShort(cal1, 20)
-  dig_P9 = getShort(cal1, 22)
-
-  dig_H1 = getUChar(cal2, 0)
-  dig_H2 = getShort(cal3, 0)
-  dig_H3 = getUChar(cal3, 2)
+  cal = {}
+  cal['dig_T1'] = getUShort(cal1, 0)
+  cal['dig_T2'] = getShort(cal1, 2)
+  cal['dig_T3'] = getShort(cal1, 4)
+
+  cal['dig_P1'] = getUShort(cal1, 6)
+  cal['dig_P2'] = getShort(cal1, 8)
+  cal['dig_P3'] = getShort(cal1, 10)
+  cal['dig_P4'] = getShort(cal1, 12)
+  cal['dig_P5'] = getShort(cal1, 14)
+  cal['dig_P6'] = getShort(cal1, 16)
+  cal['dig_P7'] = getShort(cal1, 18)
+  cal['dig_P8'] = getShort(cal1, 20)
+  cal['dig_P9'] = getShort(cal1, 22)
+
+  cal['dig_H1'] = getUChar(cal2, 0)
+  cal['dig_H2'] = getShort(cal3, 0)
+  cal['dig_H3'] = getUChar(cal3, 2)
 
   dig_H4 = getChar(cal3, 3)
   dig_H4 = (dig_H4 << 24) >> 20
-  dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
+  cal['dig_H4'] = dig_H4 | (getChar(cal3, 4) & 0x0F)
 
   dig_H5 = getChar(cal3, 5)
   dig_H5 = (dig_H5 << 24) >> 20
-  dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
+  cal['dig_H5'] = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
 
-  dig_H6 = getChar(cal3, 6)
+  cal['dig_H6'] = getChar(cal3, 6)
+  return cal
 
-  # Wait in ms (Datasheet Appendix B: Measurement time and current calculation)
-  wait_time = 1.25 + (2.3 * OVERSAMPLE_TEMP) + ((2.3 * OVERSAMPLE_PRES) + 0.575) + ((2.3 * OVERSAMPLE_HUM)+0.575)
-  time.sleep(wait_time/1000)  # Wait the required time
+def getCalibration(addr=DEVICE, i2c_bus=None, refresh=False):
+  # Return the cached calibration for addr, reading the EEPROM only
+  # the first time (or when refresh=True)
+  if refresh or addr not in _calibration_cache:
+    _calibration_cache[addr] = readCalibration(addr, i2c_bus)
+  return _calibration_cache[addr]
 
-  # Read temperature/pressure/humidity
-  data = bus.read_i2c_block_data(addr, REG_DATA, 8)
+def splitRawData(data):
+  # Split the 8-byte data block (0xF7..0xFE) into the raw ADC values
   pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
   temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
   hum_raw = (data[6] << 8) | data[7]
+  return pres_raw, temp_raw, hum_raw
+
+def compensate(cal, pres_raw, temp_raw, hum_raw):
+  # Convert raw ADC values into temperature (C), pressure (hPa) and humidity (%)
+  dig_T1 = cal['dig_T1']
+  dig_P1 = cal['dig_P1']
+  dig_H1 = cal['dig_H1']
 
   #Refine temperature
-  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
-  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
+  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(cal['dig_T2'])) >> 11
+  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (cal['dig_T3'])) >> 14
   t_fine = var1+var2
   temperature = float(((t_fine * 5) + 128) >> 8);
 
   # Refine pressure and adjust for temperature
   var1 = t_fine / 2.0 - 64000.0
-  var2 = var1 * var1 * dig_P6 / 32768.0
-  var2 = var2 + var1 * dig_P5 * 2.0
-  var2 = var2 / 4.0 + dig_P4 * 65536.0
-  var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
+  var2 = var1 * var1 * cal['dig_P6'] / 32768.0
+  var2 = var2 + var1 * cal['dig_P5'] * 2.0
+  var2 = var2 / 4.0 + cal['dig_P4'] * 65536.0
+  var1 = (cal['dig_P3'] * var1 * var1 / 524288.0 + cal['dig_P2'] * var1) / 524288.0
   var1 = (1.0 + var1 / 32768.0) * dig_P1
   if var1 == 0:
     pressure=0
   else:
     pressure = 1048576.0 - pres_raw
     pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-    var1 = dig_P9 * pressure * pressure / 2147483648.0
-    var2 = pressure * dig_P8 / 32768.0
-    pressure = pressure + (var1 + var2 + dig_P7) / 16.0
+    var1 = cal['dig_P9'] * pressure * pressure / 2147483648.0
+    var2 = pressure * cal['dig_P8'] / 32768.0
+    pressure = pressure + (var1 + var2 + cal['dig_P7']) / 16.0
 
   # Refine humidity
   humidity = t_fine - 76800.0
-  humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
+  humidity = (hum_raw - (cal['dig_H4'] * 64.0 + cal['dig_H5'] / 16384.0 * humidity)) * (cal['dig_H2'] / 65536.0 * (1.0 + cal['dig_H6'] / 67108864.0 * humidity * (1.0 + cal['dig_H3'] / 67108864.0 * humidity)))
   humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
   if humidity > 100:
     humidity = 100
@@ -142,17 +227,326 @@ def readBME280All(addr=DEVICE):
 
   return temperature/100.0,pressure/100.0,humidity
 
+
+def compensateInt(cal, pres_raw, temp_raw, hum_raw):
+  # Datasheet 32/64-bit integer compensation (section 4.2.3 and 8.2) for
+  # all three channels. Same units as compensate().
+  dig_T1 = cal['dig_T1']
+
+  # Temperature in 0.01 C
+  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(cal['dig_T2'])) >> 11
+  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (cal['dig_T3'])) >> 14
+  t_fine = var1+var2
+  temperature = ((t_fine * 5) + 128) >> 8
+
+  # Pressure in Q24.8 Pa
+  var1 = t_fine - 128000
+  var2 = var1 * var1 * cal['dig_P6']
+  var2 = var2 + ((var1 * cal['dig_P5']) << 17)
+  var2 = var2 + (cal['dig_P4'] << 35)
+  var1 = ((var1 * var1 * cal['dig_P3']) >> 8) + ((var1 * cal['dig_P2']) << 12)
+  var1 = (((1 << 47) + var1) * cal['dig_P1']) >> 33
+  if var1 == 0:
+    pressure = 0
+  else:
+    pressure = 1048576 - pres_raw
+    pressure = _cDiv(((pressure << 31) - var2) * 3125, var1)
+    var1 = (cal['dig_P9'] * (pressure >> 13) * (pressure >> 13)) >> 25
+    var2 = (cal['dig_P8'] * pressure) >> 19
+    pressure = ((pressure + var1 + var2) >> 8) + (cal['dig_P7'] << 4)
+
+  # Humidity in Q22.10 %RH
+  v_x1 = t_fine - 76800
+  v_x1 = (((((hum_raw << 14) - (cal['dig_H4'] << 20) - (cal['dig_H5'] * v_x1)) + 16384) >> 15) *
+          (((((((v_x1 * cal['dig_H6']) >> 10) * (((v_x1 * cal['dig_H3']) >> 11) + 32768)) >> 10) +
+             2097152) * cal['dig_H2'] + 8192) >> 14))
+  v_x1 = v_x1 - (((((v_x1 >> 15) * (v_x1 >> 15)) >> 7) * cal['dig_H1']) >> 4)
+  v_x1 = min(max(v_x1, 0), 419430400)
+  humidity = v_x1 >> 12
+
+  return temperature/100.0, pressure/25600.0, humidity/1024.0
+
+def _cDiv(a, b):
+  # Integer division truncating toward zero, as in the C reference code
+  q = abs(a) // abs(b)
+  return q if (a < 0) == (b < 0) else -q
+
+def compensateBatch(cal, pres_raw, temp_raw, hum_raw):
+  # Vectorised compensateInt() over NumPy arrays (or sequences) of raw
+  # values, returning float arrays of temperature, pressure and humidity.
+  # Useful for replaying captured raw data; requires numpy.
+  try:
+    import numpy as np
+  except ImportError:
+    raise ImportError('compensateBatch() requires numpy\nInstall with: sudo pip3 install numpy')
+
+  pres_raw = np.asarray(pres_raw, dtype=np.int64)
+  temp_raw = np.asarray(temp_raw, dtype=np.int64)
+  hum_raw = np.asarray(hum_raw, dtype=np.int64)
+  c = dict((k, np.int64(v)) for k, v in cal.items())
+
+  var1 = (((temp_raw>>3) - (c['dig_T1']<<1)) * c['dig_T2']) >> 11
+  var2 = (((((temp_raw>>4) - c['dig_T1']) * ((temp_raw>>4) - c['dig_T1'])) >> 12) * c['dig_T3']) >> 14
+  t_fine = var1+var2
+  temperature = ((t_fine * 5) + 128) >> 8
+
+  var1 = t_fine - 128000
+  var2 = var1 * var1 * c['dig_P6']
+  var2 = var2 + ((var1 * c['dig_P5']) << 17)
+  var2 = var2 + (c['dig_P4'] << 35)
+  var1 = ((var1 * var1 * c['dig_P3']) >> 8) + ((var1 * c['dig_P2']) << 12)
+  var1 = (((np.int64(1) << 47) + var1) * c['dig_P1']) >> 33
+  valid = var1 != 0
+  divisor = np.where(valid, var1, 1)
+  numerator = (((1048576 - pres_raw) << 31) - var2) * 3125
+  # Truncating division, as in the C reference code
+  pressure = np.abs(numerator) // np.abs(divisor)
+  pressure = np.where((numerator < 0) != (divisor < 0), -pressure, pressure)
+  var1 = (c['dig_P9'] * (pressure >> 13) * (pressure >> 13)) >> 25
+  var2 = (c['dig_P8'] * pressure) >> 19
+  pressure = ((pressure + var1 + var2) >> 8) + (c['dig_P7'] << 4)
+  pressure = np.where(valid, pressure, 0)
+
+  v_x1 = t_fine - 76800
+  v_x1 = (((((hum_raw << 14) - (c['dig_H4'] << 20) - (c['dig_H5'] * v_x1)) + 16384) >> 15) *
+          (((((((v_x1 * c['dig_H6']) >> 10) * (((v_x1 * c['dig_H3']) >> 11) + 32768)) >> 10) +
+             2097152) * c['dig_H2'] + 8192) >> 14))
+  v_x1 = v_x1 - (((((v_x1 >> 15) * (v_x1 >> 15)) >> 7) * c['dig_H1']) >> 4)
+  v_x1 = np.clip(v_x1, 0, 419430400)
+  humidity = v_x1 >> 12
+
+  return temperature/100.0, pressure/25600.0, humidity/1024.0
+
+# Compensation engines selectable with BME280(engine=...)
+ENGINE_FLOAT = 'float'
+ENGINE_INTEGER = 'integer'
+COMPENSATION_ENGINES = {ENGINE_FLOAT: compensate, ENGINE_INTEGER: compensateInt}
+
+
+class BME280(object):
+  # A BME280 at one I2C address. Calibration is read and decoded once when
+  # the object is created and the settings registers are written once, so
+  # a steady-state forced-mode sample is one control write, a status poll
+  # and one 8-byte data read.
+  #
+  # osrs_t/osrs_p/osrs_h take the OVERSAMPLE_* values, iir_filter the
+  # FILTER_* values and standby the STANDBY_* values (normal mode only).
+  # engine selects the double-precision (ENGINE_FLOAT) or datasheet
+  # integer (ENGINE_INTEGER) compensation formulas.
+  #
+  # For continuous sampling call start_normal() once and iterate over
+  # samples(); the sensor then converts on its own every cycle_time ms and
+  # each sample is a single 8-byte data read.
+
+  def __init__(self, addr=DEVICE, i2c_bus=None, osrs_t=OVERSAMPLE_TEMP, osrs_p=OVERSAMPLE_PRES,
+               osrs_h=OVERSAMPLE_HUM, iir_filter=FILTER_OFF, standby=STANDBY_0_5_MS, poll=True,
+               engine=ENGINE_FLOAT):
+    self.addr = addr
+    self.compensate = COMPENSATION_ENGINES[engine]
+    self.bus = i2c_bus if i2c_bus is not None else getBus()
+    self.calibration = getCalibration(addr, self.bus)
+    self.poll = poll
+    self.capture = None
+    self.mode = MODE_FORCED
+    self.triggered = None
+    self.configure(osrs_t, osrs_p, osrs_h, iir_filter, standby)
+
+  def configure(self, osrs_t=None, osrs_p=None, osrs_h=None, iir_filter=None, standby=None, force=False):
+    # Apply new settings; any left as None keep their current value.
+    # Nothing is written if the settings are unchanged, unless force=True.
+    previous = self.settings() if hasattr(self, 'control') else None
+    if osrs_t is not None:
+      self.osrs_t = osrs_t
+    if osrs_p is not None:
+      self.osrs_p = osrs_p
+    if osrs_h is not None:
+      self.osrs_h = osrs_h
+    if iir_filter is not None:
+      self.iir_filter = iir_filter
+    if standby is not None:
+      self.standby = standby
+    if not force and self.settings() == previous:
+      return
+
+    # Config is only guaranteed to be written in sleep mode, which a
+    # forced-mode sensor returns to after each conversion
+    self.bus.write_byte_data(self.addr, REG_CONFIG, self.standby<<5 | self.iir_filter<<2)
+    # ctrl_hum only takes effect after the next ctrl_meas write, which
+    # every forced-mode read performs anyway
+    self.bus.write_byte_data(self.addr, REG_CONTROL_HUM, self.osrs_h)
+    self.control = self.osrs_t<<5 | self.osrs_p<<2 | MODE_FORCED
+    # Wait in ms (Datasheet Appendix B: Measurement time and current calculation)
+    self.wait_time = measurementTime(self.osrs_t, self.osrs_p, self.osrs_h)
+    self.typical_time = measurementTime(self.osrs_t, self.osrs_p, self.osrs_h, typical=True)
+    # Time between conversions in normal mode
+    self.cycle_time = self.wait_time + STANDBY_TIME_MS[self.standby]
+    if self.mode == MODE_NORMAL:
+      self._enter_normal()
+
+  def set_capture(self, writer):
+    # Record every raw data block read from now on to a
+    # raw_capture.RawCaptureWriter, starting with the calibration blocks
+    # needed to replay them
+    self.capture = writer
+    if writer is not None:
+      for (reg, length), block in zip(CALIBRATION_BLOCKS, _calibration_raw[self.addr]):
+        writer.write_frame(self.addr, reg, block)
+
+  def settings(self):
+    return (self.osrs_t, self.osrs_p, self.osrs_h, self.iir_filter, self.standby)
+
+  def refresh_calibration(self):
+    # Re-read the EEPROM, e.g. after the sensor has been swapped or power-cycled
+    self.calibration = getCalibration(self.addr, self.bus, refresh=True)
+    if self.capture is not None:
+      self.set_capture(self.capture)
+    return self.calibration
+
+  def is_measuring(self):
+    return (self.bus.read_byte_data(self.addr, REG_STATUS) & STATUS_MEASURING) != 0
+
+  def wait_for_conversion(self, started=None):
+    # Sleep until the typical conversion time after started (default now),
+    # then poll the measuring bit until it clears. Never waits longer than
+    # the datasheet maximum.
+    if started is None:
+      started = time.time()
+    deadline = started + self.wait_time/1000
+    if not self.poll:
+      _sleep_until(deadline)
+      return
+    _sleep_until(started + self.typical_time/1000)
+    while self.is_measuring():
+      if time.time() >= deadline:
+        break
+      time.sleep(POLL_INTERVAL)
+
+  def start_normal(self, standby=None, iir_filter=None):
+    # Switch to normal mode: the sensor converts continuously, waiting
+    # standby between conversions, with the IIR filter applied
+    self.configure(standby=standby, iir_filter=iir_filter)
+    if self.mode != MODE_NORMAL:
+      self._enter_normal()
+
+  def _enter_normal(self):
+    # Config writes are ignored in normal mode, so drop to sleep first
+    self.bus.write_byte_data(self.addr, REG_CONTROL, self.osrs_t<<5 | self.osrs_p<<2 | MODE_SLEEP)
+    self.bus.write_byte_data(self.addr, REG_CONFIG, self.standby<<5 | self.iir_filter<<2)
+    self.bus.write_byte_data(self.addr, REG_CONTROL, self.osrs_t<<5 | self.osrs_p<<2 | MODE_NORMAL)
+    self.mode = MODE_NORMAL
+    self.started = time.time()
+
+  def stop(self):
+    # Return to sleep mode; the next read() is a forced-mode shot again
+    self.bus.write_byte_data(self.addr, REG_CONTROL, self.osrs_t<<5 | self.osrs_p<<2 | MODE_SLEEP)
+    self.mode = MODE_FORCED
+
+  def trigger(self):
+    # Start a forced-mode conversion and return without waiting for it, so
+    # other devices can be started or read meanwhile; collect() waits for
+    # and returns the result. Returns the time.time() the typical
+    # conversion should be done. Does nothing in normal mode.
+    if self.mode == MODE_FORCED:
+      self.bus.write_byte_data(self.addr, REG_CONTROL, self.control)
+      self.triggered = time.time()
+      return self.triggered + self.typical_time/1000
+    return time.time()
+
+  def collect_raw(self):
+    # The raw 8-byte data block of the conversion started by trigger(),
+    # or in normal mode the latest completed one
+    if self.triggered is not None:
+      self.wait_for_conversion(self.triggered)
+      self.triggered = None
+    data = self.bus.read_i2c_block_data(self.addr, REG_DATA, 8)
+    if self.capture is not None:
+      self.capture.write_frame(self.addr, REG_DATA, data)
+    return data
+
+  def collect(self):
+    pres_raw, temp_raw, hum_raw = splitRawData(self.collect_raw())
+    return self.compensate(self.calibration, pres_raw, temp_raw, hum_raw)
+
+  def read_raw(self):
+    # Return the raw 8-byte data block. In forced mode this triggers a
+    # conversion first; in normal mode it is the latest completed one.
+    self.trigger()
+    return self.collect_raw()
+
+  def read(self):
+    pres_raw, temp_raw, hum_raw = splitRawData(self.read_raw())
+    return self.compensate(self.calibration, pres_raw, temp_raw, hum_raw)
+
+  def samples(self, count=None):
+    # Generator yielding (temperature, pressure, humidity, timestamp) once
+    # per normal-mode cycle, forever or for count samples. Starts normal
+    # mode if it isn't already running.
+    if self.mode != MODE_NORMAL:
+      self.start_normal()
+    period = self.cycle_time/1000
+    # First result is ready one conversion after the mode change
+    next_read = self.started + self.wait_time/1000
+    taken = 0
+    while count is None or taken < count:
+      delay = next_read - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      data = self.bus.read_i2c_block_data(self.addr, REG_DATA, 8)
+      timestamp = time.time()
+      if self.capture is not None:
+        self.capture.write_frame(self.addr, REG_DATA, data, timestamp)
+      pres_raw, temp_raw, hum_raw = splitRawData(data)
+      temperature, pressure, humidity = self.compensate(self.calibration, pres_raw, temp_raw, hum_raw)
+      yield temperature, pressure, humidity, timestamp
+      taken += 1
+      next_read += period
+      if next_read < time.time():
+        # The consumer fell behind; skip the missed cycles rather than
+        # reading the same conversion several times in a burst
+        next_read = time.time() + period
+
+
+# One BME280 object per address, shared by readBME280All()
+_devices = {}
+
+def getDevice(addr=DEVICE):
+  if addr not in _devices:
+    _devices[addr] = BME280(addr)
+  return _devices[addr]
+
+def streamBME280(addr=DEVICE, standby=STANDBY_62_5_MS, iir_filter=FILTER_4, count=None, **settings):
+  # Put the sensor at addr into normal mode and yield
+  # (temperature, pressure, humidity, timestamp) at its native rate, e.g.
+  #   for t, p, h, ts in streamBME280(standby=STANDBY_62_5_MS): ...
+  device = getDevice(addr)
+  previous = device.settings()
+  device.configure(standby=standby, iir_filter=iir_filter, **settings)
+  try:
+    for sample in device.samples(count):
+      yield sample
+  finally:
+    device.stop()
+    device.configure(*previous)
+
+def readBME280All(addr=DEVICE, **settings):
+  # settings are any of the BME280.configure() keyword arguments, e.g.
+  # readBME280All(osrs_t=OVERSAMPLE_X1, osrs_p=OVERSAMPLE_X1, osrs_h=OVERSAMPLE_X1)
+  device = getDevice(addr)
+  if settings:
+    device.configure(**settings)
+  return device.read()
+
 def main():
 
   (chip_id, chip_version) = readBME280ID()
-  print "Chip ID     :", chip_id
-  print "Version     :", chip_version
+  print("Chip ID     : " + str(chip_id))
+  print("Version     : " + str(chip_version))
 
   temperature,pressure,humidity = readBME280All()
 
-  print "Temperature : ", temperature, "C"
-  print "Pressure : ", pressure, "hPa"
-  print "Humidity : ", humidity, "%"
+  print("Temperature : " + str(temperature) + " C")
+  print("Pressure : " + str(pressure) + " hPa")
+  print("Humidity : " + str(humidity) + " %")
 
 if __name__=="__main__":
    main()
\ No newline at end of file
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Republishes compact CBOR payloads as the usual JSON.
+
+Nodes running a *-json-mqtt.py script with payload_encoding = "cbor"
+publish compact_codec payloads on "<channel>/cbor". Run this next to the
+broker (e.g. on the NAS, or as a service alongside mosquitto) and it
+decodes each one and publishes the same nested JSON the script would have
+sent, retained, on "<channel>" - so Telegraf and Home Assistant need no
+changes. Only this short hop on the wired side carries the full JSON.
+
+Payloads that do not decode are logged and dropped.
+
+Usage:
+    python3 cbor-bridge.py [--host localhost] [--port 1883]
+                           [--subscribe +/cbor ...] [--no-retain]
+                           [--report 3600]
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import compact_codec
+from mqtt_connection import MQTTConnection
+
+SUFFIX = "/cbor"
+
+
+class Bridge(object):
+    def __init__(self, subscriptions, retain=True):
+        self.subscriptions = subscriptions
+        self.retain = retain
+        self.lock = threading.Lock()
+        self.received = 0
+        self.received_bytes = 0
+        self.published_bytes = 0
+        self.failed = 0
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            for topic in self.subscriptions:
+                client.subscribe(topic, qos=1)
+
+    def on_message(self, client, userdata, message):
+        if not message.topic.endswith(SUFFIX):
+            return
+        try:
+            payload = json.dumps(compact_codec.decode(message.payload))
+        except ValueError as error:
+            with self.lock:
+                self.failed += 1
+            print(f"Dropped undecodable payload on {message.topic}: {error}", flush=True)
+            return
+
+        client.publish(message.topic[:-len(SUFFIX)], payload, qos=message.qos, retain=self.retain)
+        with self.lock:
+            self.received += 1
+            self.received_bytes += len(message.payload)
+            self.published_bytes += len(payload)
+
+    def stats_line(self):
+        with self.lock:
+            saved = 1 - self.received_bytes / self.published_bytes if self.published_bytes else 0.0
+            return (
+                f"{self.received} payloads bridged, {self.failed} dropped; "
+                f"{self.received_bytes} bytes CBOR -> {self.published_bytes} bytes JSON ({saved:.0%} smaller)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Republish compact CBOR sensor payloads as JSON.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--client-id", default="cbor-bridge")
+    parser.add_argument(
+        "--subscribe",
+        action="append",
+        help=f"topic filter for compact payloads, ending in {SUFFIX} (default +{SUFFIX}; repeatable)",
+    )
+    parser.add_argument("--no-retain", dest="retain", action="store_false", help="publish the JSON unretained")
+    parser.add_argument("--report", type=float, default=3600, help="print counters every N seconds")
+    args = parser.parse_args()
+
+    subscriptions = args.subscribe or [f"+{SUFFIX}"]
+    for topic in subscriptions:
+        if not topic.endswith(SUFFIX):
+            parser.error(f"--subscribe {topic}: must end in {SUFFIX}")
+
+    bridge = Bridge(subscriptions, args.retain)
+    connection = MQTTConnection(
+        args.host,
+        args.client_id,
+        port=args.port,
+        username=args.username,
+        password=args.password,
+        on_connect=bridge.on_connect,
+    )
+    connection.client.on_message = bridge.on_message
+
+    print(f"Bridging {', '.join(subscriptions)} on {args.host}:{args.port} (CBOR codec: {compact_codec.BACKEND})", flush=True)
+    connection.start()
+    try:
+        while True:
+            time.sleep(args.report)
+            print(bridge.stats_line(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(bridge.stats_line(), flush=True)
+        connection.stop()
+
+
+if __name__ == "__main__":
+    main()
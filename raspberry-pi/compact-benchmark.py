@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bytes on the wire and encode time: json.dumps vs compact_codec (CBOR).
+
+For one payload of each *-json-mqtt.py script's shape, prints
+
+- the payload size as JSON (what the scripts send by default) and as
+  compact CBOR (payload_encoding = "cbor")
+- the size of the whole MQTT PUBLISH packet carrying it (fixed header,
+  topic, packet ID for QoS 1), since on a small payload the topic is a
+  fair share of what goes over the air
+- microseconds to encode one reading each way
+
+and checks that every CBOR payload decodes back to the JSON one at the
+fields' digits, with integers still integers. Run it on the Pi or ESP-class board itself for real
+timings.
+
+Usage:
+    python3 compact-benchmark.py [cycles]
+"""
+
+import argparse
+import json
+import time
+
+import compact_codec
+
+CHANNEL = "homedev"
+
+# Readings as the scripts read them, at the drivers' full precision
+PAYLOADS = [
+    ("ms430", {
+        "upstairs": {"office": {"ms430": {
+            "temperature": 21.44, "humidity": 45.22, "pressure": 1009.56, "lux": 300.52,
+            "airquality": 42.3, "airqual_accuracy": 3, "breath_voc": 0.62, "est_co2": 543.7,
+            "gas_resistance": 200013, "peak_amplitude": 12.43, "dba": 38.41,
+        }}},
+    }),
+    ("bme280", {
+        "downstairs": {"living-room": {"bme280": {
+            "temperature": 21.437285156250002, "humidity": 45.21660864738818, "pressure": 1009.5634716796875,
+        }}},
+    }),
+    ("bme280+buffer", {
+        "downstairs": {"living-room": {"bme280": {
+            "temperature": 21.437285156250002, "humidity": 45.21660864738818, "pressure": 1009.5634716796875,
+        }}},
+        "timestamp": 1714572201.123,
+    }),
+    ("bme280+tsl2561", {
+        "downstairs": {"living-room": {
+            "bme280": {"temperature": 21.437285156250002, "humidity": 45.21660864738818, "pressure": 1009.5634716796875},
+            "tsl2561": {"lux": 300.517},
+        }},
+    }),
+    ("si7021 sampled", {
+        "downstairs": {"living-room": {"si7021": {
+            "temperature": 21.43, "humidity": 45.2,
+            "temperature_min": 21.1, "temperature_max": 21.7, "humidity_min": 44.9, "humidity_max": 45.6,
+        }}},
+    }),
+]
+
+
+def publish_packet_size(topic, payload, qos=1):
+    remaining = 2 + len(topic) + (2 if qos else 0) + len(payload)
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes:
+        length_bytes += 1
+    return 1 + length_bytes + remaining
+
+
+def time_encode(encode, payload, cycles):
+    encode(payload)
+    start = time.perf_counter()
+    for _ in range(cycles):
+        encode(payload)
+    return (time.perf_counter() - start) / cycles
+
+
+def rounded_like_codec(obj):
+    digits = {name: digits for field_id, name, digits in compact_codec.FIELDS}
+    result = {}
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            result[key] = rounded_like_codec(value)
+        elif digits.get(key) == 0:
+            result[key] = round(value)
+        elif digits.get(key) is not None:
+            result[key] = round(value, digits[key])
+        else:
+            result[key] = value
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and compact CBOR payloads.")
+    parser.add_argument("cycles", nargs="?", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"CBOR codec: {compact_codec.BACKEND}, {args.cycles} cycles each\n")
+    print(
+        f"{'payload':<16} {'JSON B':>7} {'CBOR B':>7} {'saved':>6}   "
+        f"{'packet JSON':>11} {'packet CBOR':>11}   {'json us':>8} {'cbor us':>8}"
+    )
+
+    for name, payload in PAYLOADS:
+        text = json.dumps(payload)
+        data = compact_codec.encode(payload)
+        # Compared as JSON so that 3.0 for 3 counts as a mismatch
+        if json.dumps(compact_codec.decode(data)) != json.dumps(rounded_like_codec(payload)):
+            raise SystemExit(f"{name}: CBOR payload does not decode to the JSON one")
+
+        json_packet = publish_packet_size(CHANNEL, text.encode())
+        cbor_packet = publish_packet_size(CHANNEL + "/cbor", data)
+        json_seconds = time_encode(json.dumps, payload, args.cycles)
+        cbor_seconds = time_encode(compact_codec.encode, payload, args.cycles)
+        print(
+            f"{name:<16} {len(text):>7} {len(data):>7} {1 - len(data) / len(text):>6.0%}   "
+            f"{json_packet:>11} {cbor_packet:>11}   {json_seconds * 1e6:>8.1f} {cbor_seconds * 1e6:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact CBOR payloads for sensors on weak links.
+
+The *-json-mqtt.py scripts publish nested JSON such as
+
+    {"upstairs":{"office":{"ms430":{"temperature":21.44,"humidity":45.22,...}}}}
+
+With payload_encoding = "cbor" they publish the same object as CBOR
+(RFC 8949) instead, on "<channel>/cbor", and cbor-bridge.py on the broker
+side turns it back into the JSON above on "<channel>" for Telegraf and
+Home Assistant. Two things make it smaller than the JSON:
+
+- field names in the innermost objects are sent as small integer IDs from
+  FIELDS, the shared table below (CBOR keys 0-23 take one byte)
+- fields with declared digits are sent as integers scaled by 10**digits,
+  e.g. 21.44 degC as 2144 (three bytes), and decoded back to floats, or
+  to integers for digits 0
+
+The zone, room and sensor keys stay strings, and any field that is not in
+FIELDS (e.g. the _min/_max fields from sample_period) is sent under its
+name as a plain CBOR value, so every payload the scripts build can be
+encoded. The top-level "timestamp" added with offline_buffer_dir is ID 1,
+in milliseconds.
+
+Readings are sent at each field's digits, the precision the sensors
+resolve; bme280.py and the like return more digits than that, which the
+JSON payloads carried and these do not. The MS430 air quality index and
+estimated CO2 have no digits: the MS430 gives them to 0.1, which the JSON
+payloads carry, so they go as CBOR floats (usually nine bytes) rather
+than be rounded to integers.
+
+FIELDS is part of the wire format: add new fields with new IDs, and never
+reuse or renumber one, or older nodes and the bridge will disagree.
+
+dumps()/loads() use cbor2 when installed, else the small built-in codec
+below (maps, arrays, text, bytes, integers, floats, true/false/null - all
+these payloads use). BACKEND names the one in use. See
+compact-benchmark.py for bytes and encode time against json.dumps.
+"""
+
+import math
+import struct
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+# (ID, name, digits). IDs 2-23 encode in one byte; digits None sends the
+# value unscaled. The MS430 digits match sensor_schema.ms430_schema(),
+# except airquality and est_co2, which the JSON payloads carry unrounded.
+# Those two were once sent at digits 0; such integers still decode as they are.
+FIELDS = (
+    (1, "timestamp", 3),
+    (2, "temperature", 2),
+    (3, "humidity", 2),
+    (4, "pressure", 2),
+    (5, "lux", 2),
+    (6, "airquality", None),
+    (7, "airqual_accuracy", 0),
+    (8, "breath_voc", 3),
+    (9, "est_co2", None),
+    (10, "gas_resistance", 0),
+    (11, "peak_amplitude", 2),
+    (12, "dba", 2),
+)
+
+_BY_NAME = {name: (field_id, 10 ** digits if digits is not None else None) for field_id, name, digits in FIELDS}
+# Integers of digits 0 fields are already the value
+_BY_ID = {field_id: (name, 10 ** digits if digits else None) for field_id, name, digits in FIELDS}
+
+
+# ----------------------------------------------------------------------
+# Payloads
+
+def _pack_fields(obj):
+    packed = {}
+    for name, value in obj.items():
+        if type(value) is dict:
+            packed[name] = _pack_fields(value)
+            continue
+        field = _BY_NAME.get(name)
+        if field is None:
+            packed[name] = value
+            continue
+        field_id, scale = field
+        if scale is not None and type(value) in (float, int):
+            value = round(value * scale) if math.isfinite(value) else None
+        packed[field_id] = value
+    return packed
+
+
+def _unpack_fields(obj):
+    unpacked = {}
+    for key, value in obj.items():
+        if type(value) is dict:
+            unpacked[key] = _unpack_fields(value)
+            continue
+        field = _BY_ID.get(key)
+        if field is None:
+            unpacked[key] = value
+            continue
+        name, scale = field
+        if scale is not None and type(value) is int:
+            value = value / scale
+        unpacked[name] = value
+    return unpacked
+
+
+def encode(payload):
+    """
+    CBOR bytes for a nested payload dict as the *-json-mqtt.py scripts
+    build it.
+    """
+
+    return dumps(_pack_fields(payload))
+
+
+def decode(data):
+    """
+    The payload dict encode() was given, with scaled fields as floats at
+    their digits (integers for digits 0). Raises ValueError for data that is not valid CBOR.
+    """
+
+    obj = loads(data)
+    if type(obj) is not dict:
+        raise ValueError("Compact payload is not a CBOR map")
+    return _unpack_fields(obj)
+
+
+# ----------------------------------------------------------------------
+# CBOR
+
+_MAJOR_UINT = 0x00
+_MAJOR_NEGINT = 0x20
+_MAJOR_BYTES = 0x40
+_MAJOR_TEXT = 0x60
+_MAJOR_ARRAY = 0x80
+_MAJOR_MAP = 0xA0
+
+_HALF = struct.Struct(">e")
+_SINGLE = struct.Struct(">f")
+_DOUBLE = struct.Struct(">d")
+
+
+# Single-byte heads, for every major type and argument 0-23
+_SMALL_HEADS = [bytes((initial,)) for initial in range(256)]
+
+
+def _head(major, length):
+    if length < 24:
+        return _SMALL_HEADS[major | length]
+    if length < 0x100:
+        return bytes((major | 24, length))
+    if length < 0x10000:
+        return bytes((major | 25,)) + length.to_bytes(2, "big")
+    if length < 0x100000000:
+        return bytes((major | 26,)) + length.to_bytes(4, "big")
+    return bytes((major | 27,)) + length.to_bytes(8, "big")
+
+
+# Encoded text strings: the zone, room, sensor and field names repeat in
+# every payload
+_TEXT_CACHE_SIZE = 256
+_text_cache = {}
+
+
+def _float(value):
+    # The shortest of half, single and double precision that holds the value exactly
+    if value != value:
+        return b"\xf9\x7e\x00"
+    for prefix, packer in ((b"\xf9", _HALF), (b"\xfa", _SINGLE)):
+        try:
+            packed = packer.pack(value)
+        except OverflowError:
+            continue
+        if packer.unpack(packed)[0] == value:
+            return prefix + packed
+    return b"\xfb" + _DOUBLE.pack(value)
+
+
+def _encode(obj, out):
+    obj_type = type(obj)
+    if obj_type is int:
+        if 0 <= obj < 24:
+            out.append(_SMALL_HEADS[obj])
+        elif obj >= 0:
+            out.append(_head(_MAJOR_UINT, obj))
+        else:
+            out.append(_head(_MAJOR_NEGINT, -1 - obj))
+    elif obj_type is str:
+        data = _text_cache.get(obj)
+        if data is None:
+            data = obj.encode("utf-8")
+            data = _head(_MAJOR_TEXT, len(data)) + data
+            if len(_text_cache) < _TEXT_CACHE_SIZE:
+                _text_cache[obj] = data
+        out.append(data)
+    elif obj_type is float:
+        out.append(_float(obj))
+    elif obj_type is dict:
+        out.append(_head(_MAJOR_MAP, len(obj)))
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    elif obj is None:
+        out.append(b"\xf6")
+    elif obj is True:
+        out.append(b"\xf5")
+    elif obj is False:
+        out.append(b"\xf4")
+    elif obj_type in (list, tuple):
+        out.append(_head(_MAJOR_ARRAY, len(obj)))
+        for item in obj:
+            _encode(item, out)
+    elif obj_type in (bytes, bytearray):
+        out.append(_head(_MAJOR_BYTES, len(obj)))
+        out.append(bytes(obj))
+    else:
+        raise TypeError(f"Cannot CBOR-encode {obj_type.__name__}")
+
+
+def _builtin_dumps(obj):
+    out = []
+    _encode(obj, out)
+    return b"".join(out)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self, length):
+        end = self.offset + length
+        if end > len(self.data):
+            raise ValueError("Truncated CBOR data")
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def argument(self, info):
+        if info < 24:
+            return info
+        if info > 27:
+            raise ValueError(f"Unsupported CBOR additional info {info}")
+        return int.from_bytes(self.take(1 << (info - 24)), "big")
+
+    def item(self):
+        initial = self.take(1)[0]
+        major, info = initial >> 5, initial & 0x1F
+
+        if major == 7:
+            if info == 20:
+                return False
+            if info == 21:
+                return True
+            if info in (22, 23):
+                return None
+            if info == 25:
+                return _HALF.unpack(self.take(2))[0]
+            if info == 26:
+                return _SINGLE.unpack(self.take(4))[0]
+            if info == 27:
+                return _DOUBLE.unpack(self.take(8))[0]
+            raise ValueError(f"Unsupported CBOR simple value {info}")
+
+        value = self.argument(info)
+        if major == 0:
+            return value
+        if major == 1:
+            return -1 - value
+        if major == 2:
+            return bytes(self.take(value))
+        if major == 3:
+            return str(self.take(value), "utf-8")
+        if major == 4:
+            return [self.item() for _ in range(value)]
+        if major == 5:
+            result = {}
+            for _ in range(value):
+                key = self.item()
+                if type(key) is list:
+                    raise ValueError("Unsupported CBOR map key")
+                result[key] = self.item()
+            return result
+        # major 6: a tag - skip it and keep the tagged item
+        return self.item()
+
+
+def _builtin_loads(data):
+    reader = _Reader(data)
+    try:
+        obj = reader.item()
+    except (UnicodeDecodeError, TypeError) as error:
+        raise ValueError(f"Invalid CBOR data: {error}")
+    if reader.offset != len(reader.data):
+        raise ValueError("Trailing bytes after CBOR data")
+    return obj
+
+
+if cbor2 is not None:
+    BACKEND = "cbor2"
+
+    def dumps(obj):
+        return cbor2.dumps(obj, canonical=True)
+
+    def loads(data):
+        try:
+            return cbor2.loads(data)
+        except cbor2.CBORDecodeError as error:
+            raise ValueError(str(error))
+
+else:
+    BACKEND = "builtin"
+    dumps = _builtin_dumps
+    loads = _builtin_loads
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Report-by-exception filtering of sensor readings.
+
+A field is due to be sent when it has never been sent, when it has moved
+more than its deadband since the value last sent, or when it has not been
+sent for heartbeat seconds (so subscribers and InfluxDB still see a point
+during long quiet spells, e.g. overnight). Fields without a configured
+deadband are sent whenever they change at all.
+
+Used by the BME280, Si7021 and Enviro pHAT publishers (deadbands setting)
+and by ms430-dual-mqtt.py (REPORT_BY_EXCEPTION and the "on-change" policy).
+"""
+
+import time
+
+from aggregation import is_number
+
+
+class DeadbandFilter(object):
+    """
+    deadbands maps a field name to the change needed before it is re-sent,
+    e.g. {"temperature": 0.2, "humidity": 1.0}. heartbeat is the longest a
+    field may go unsent, in seconds; None disables the heartbeat.
+    """
+
+    def __init__(self, deadbands=None, heartbeat=None):
+        self.deadbands = deadbands or {}
+        self.heartbeat = heartbeat
+        self.last_sent = {}
+        self.fields_sent = 0
+        self.fields_suppressed = 0
+
+    def _moved(self, key, value, last):
+        if is_number(value) and is_number(last):
+            return abs(value - last) > self.deadbands.get(key, 0)
+        return value != last
+
+    def is_due(self, key, value, now=None):
+        sent = self.last_sent.get(key)
+        if sent is None:
+            return True
+
+        last, sent_at = sent
+        if self.heartbeat is not None:
+            if now is None:
+                now = time.monotonic()
+            if now - sent_at >= self.heartbeat:
+                return True
+
+        return self._moved(key, value, last)
+
+    def due(self, values, now=None):
+        """
+        The subset of values that should be sent now.
+        """
+
+        if now is None:
+            now = time.monotonic()
+        return {
+            key: value
+            for key, value in values.items()
+            if self.is_due(key, value, now)
+        }
+
+    def record(self, values, now=None):
+        """
+        Remember values as sent at now.
+        """
+
+        if now is None:
+            now = time.monotonic()
+        for key, value in values.items():
+            self.last_sent[key] = (value, now)
+
+    def filter(self, values, now=None):
+        """
+        due() and record() in one step: returns the fields to send and
+        treats them as sent. An empty dict means nothing needs sending.
+        """
+
+        if now is None:
+            now = time.monotonic()
+        due = self.due(values, now)
+        self.record(due, now)
+        self.fields_sent += len(due)
+        self.fields_suppressed += len(values) - len(due)
+        return due
+
+    def changed(self, values):
+        """
+        True if any field with a configured deadband has moved beyond it
+        (or has never been sent). Ignores the heartbeat.
+        """
+
+        for key in self.deadbands:
+            value = values.get(key)
+            if value is None:
+                continue
+            sent = self.last_sent.get(key)
+            if sent is None or self._moved(key, value, sent[0]):
+                return True
+        return False
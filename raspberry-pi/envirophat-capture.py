@@ -6,8 +6,8 @@
 import time
 import datetime
 import sys
-from envirophat import light, weather
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from line_protocol import LINE_FORMAT_COMPAT, LINE_FORMAT_MULTI_FIELD, build_payload, timestamp_ns
 
 # MQTT details
 brokerAddress = "192.168.1.24"  # Update accordingly
@@ -18,30 +18,21 @@ zone = "downstairs"             # Update accordingly
 # Define the time between sending data to MQTT broker - default is 60 seconds
 period = 60
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
+# All values are sent in one MQTT publish per reading. LINE_FORMAT_COMPAT keeps the
+# old "temperature,room=..,floor=.. value=.." measurements (one line each);
+# LINE_FORMAT_MULTI_FIELD sends a single "enviro-phat,room=..,floor=.. temperature=..,..." line.
+line_format = LINE_FORMAT_COMPAT
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+
+# Initialise the Enviro pHAT while the connection comes up - importing envirophat opens the I2C bus and
+# sets up every sensor on the board, so it waits until the settings are read and the connection is started
+from envirophat import light, weather
 
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+connection.wait_connected()
+client = connection.client
 
 while True:
   try:
@@ -53,9 +44,9 @@ while True:
         try:
             # Send data to MQTT
             now = datetime.datetime.now()
-            client.publish("sensors", "temperature,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(temperature))
-            client.publish("sensors", "pressure,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(pressure))
-            client.publish("sensors", "lux,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(lux))
+            fields = {"temperature" : temperature, "pressure" : pressure, "lux" : lux}
+            tags = {"room" : room, "floor" : zone}
+            client.publish("sensors", build_payload(line_format, "enviro-phat", tags, fields, timestamp_ns()))
             print("Data sent to MQTT broker " + str(brokerAddress) + " at " + (now.strftime("%H:%M:%S on %d/%m/%Y")))
             sys.stdout.flush()
         except Exception:
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Simulated I2C hardware for benchmarks and for running the scripts without a Pi.
+
+FakeSMBus implements the subset of the smbus.SMBus API used in this repo
+against an in-memory register map per device address, counts every bus
+transaction and can optionally sleep for the time the transfer would take
+on a real 100 kHz bus.
+"""
+
+import errno
+import struct
+import threading
+import time
+
+
+# ---------------------------------------------------------------------------
+# Fake SMBus
+# ---------------------------------------------------------------------------
+
+# Roughly 9 clock cycles per byte on a 100 kHz bus
+I2C_SECONDS_PER_BYTE = 9 / 100000.0
+
+# Fixed cost of each transaction: ioctl, start/stop conditions and bus
+# turnaround. An assumed figure for a Pi Zero; adjust to match your hardware.
+I2C_TRANSACTION_OVERHEAD = 0.00015
+
+
+def check_rdwr_messages(messages):
+    """
+    Reject combined transfers the Pi's i2c-bcm2835 driver rejects: it
+    supports only one read message, and only as the last message.
+    """
+
+    reads = [index for index, message in enumerate(messages) if message.flags & 0x0001]
+    if len(reads) > 1 or (reads and reads[0] != len(messages) - 1):
+        raise OSError(errno.EOPNOTSUPP, "i2c-bcm2835: only one read message supported, has to be last")
+
+
+class FakeSMBus(object):
+    """
+    In-memory stand-in for smbus.SMBus.
+
+    registers maps an I2C address to a dict of register -> byte value.
+    Set simulate_timing=True to make each transaction take as long as it
+    would on a real bus.
+    """
+
+    def __init__(self, registers=None, simulate_timing=False):
+        self.registers = registers if registers is not None else {}
+        self.simulate_timing = simulate_timing
+        self.transactions = 0
+        self.bytes_transferred = 0
+        self.write_hooks = {}
+        self.read_hooks = {}
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_transferred = 0
+
+    def _transfer(self, nbytes):
+        # Address byte + register byte + payload
+        self.transactions += 1
+        self.bytes_transferred += nbytes + 2
+        if self.simulate_timing:
+            time.sleep(I2C_TRANSACTION_OVERHEAD + (nbytes + 2) * I2C_SECONDS_PER_BYTE)
+
+    def _device(self, addr):
+        return self.registers.setdefault(addr, {})
+
+    def _write(self, addr, register, values):
+        device = self._device(addr)
+        for offset, value in enumerate(values):
+            device[register + offset] = value & 0xFF
+        hook = self.write_hooks.get(addr)
+        if hook is not None:
+            hook(register, values)
+
+    def _read_device(self, addr):
+        device = self._device(addr)
+        hook = self.read_hooks.get(addr)
+        if hook is not None:
+            hook(device)
+        return device
+
+    def read_byte_data(self, addr, register):
+        self._transfer(1)
+        return self._read_device(addr).get(register, 0)
+
+    def read_i2c_block_data(self, addr, register, length):
+        self._transfer(length)
+        device = self._read_device(addr)
+        return [device.get(register + i, 0) for i in range(length)]
+
+    def write_byte(self, addr, value):
+        self._transfer(0)
+        hook = self.write_hooks.get(addr)
+        if hook is not None:
+            hook(value, [])
+
+    def write_byte_data(self, addr, register, value):
+        self._transfer(1)
+        self._write(addr, register, [value])
+
+    def write_i2c_block_data(self, addr, register, values):
+        self._transfer(len(values))
+        self._write(addr, register, list(values))
+
+    def i2c_rdwr(self, *messages):
+        """
+        Combined transaction, as smbus2.SMBus.i2c_rdwr(): each write message
+        selects a register and each read message is filled from the last
+        selected register. Costs one transaction. Raises OSError for
+        transfers the Pi's I2C driver would reject (check_rdwr_messages).
+        """
+
+        check_rdwr_messages(messages)
+        self.transactions += 1
+        nbytes = 0
+        register = 0
+        for message in messages:
+            nbytes += message.len + 1
+            if message.flags & 0x0001:
+                device = self._read_device(message.addr)
+                for i in range(message.len):
+                    message.buf[i] = bytes([device.get(register + i, 0)])
+            else:
+                data = list(message)
+                register = data[0]
+                if len(data) > 1:
+                    self._write(message.addr, register, data[1:])
+        self.bytes_transferred += nbytes + 1
+        if self.simulate_timing:
+            time.sleep(I2C_TRANSACTION_OVERHEAD + nbytes * I2C_SECONDS_PER_BYTE)
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Fake GPIO
+# ---------------------------------------------------------------------------
+
+class FakeGPIO(object):
+    """
+    Stand-in for the RPi.GPIO module. Input pins read low unless set with
+    set_input(). falling_edge() simulates an edge, and start_clock() fires
+    one on a pin every period seconds from a background thread, like the
+    MS430 READY line in cycle mode.
+    """
+
+    BOARD = 10
+    BCM = 11
+    IN = 1
+    OUT = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.detect = {}
+        self.callbacks = {}
+        self.events = {}
+        self.condition = threading.Condition()
+        self.clocks = []
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, **kwargs):
+        self.levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def set_input(self, pin, level):
+        with self.condition:
+            self.levels[pin] = level
+            self.condition.notify_all()
+
+    def falling_edge(self, pin):
+        with self.condition:
+            self.levels[pin] = 0
+            self.events[pin] = True
+            self.condition.notify_all()
+        for callback in list(self.callbacks.get(pin, [])):
+            callback(pin)
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        with self.condition:
+            if self.levels.get(pin, 0) == 1:
+                self.condition.wait(None if timeout is None else timeout / 1000.0)
+            return pin if self.levels.get(pin, 0) == 0 else None
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.detect[pin] = edge
+        if callback is not None:
+            self.add_event_callback(pin, callback)
+
+    def add_event_callback(self, pin, callback):
+        self.callbacks.setdefault(pin, []).append(callback)
+
+    def remove_event_detect(self, pin):
+        self.detect.pop(pin, None)
+        self.callbacks.pop(pin, None)
+
+    def event_detected(self, pin):
+        with self.condition:
+            return self.events.pop(pin, False)
+
+    def start_clock(self, pin, period):
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(period):
+                self.falling_edge(pin)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.clocks.append(stop)
+        return stop
+
+    def cleanup(self):
+        for stop in self.clocks:
+            stop.set()
+        self.clocks = []
+
+
+# ---------------------------------------------------------------------------
+# BME280 register image
+# ---------------------------------------------------------------------------
+
+# Example trimming values from the Bosch BME280 datasheet / reference driver
+BME280_EXAMPLE_CALIBRATION = {
+    "dig_T1": 27504, "dig_T2": 26435, "dig_T3": -1000,
+    "dig_P1": 36477, "dig_P2": -10685, "dig_P3": 3024,
+    "dig_P4": 2855, "dig_P5": 140, "dig_P6": -7,
+    "dig_P7": 15500, "dig_P8": -14600, "dig_P9": 6000,
+    "dig_H1": 75, "dig_H2": 362, "dig_H3": 0,
+    "dig_H4": 313, "dig_H5": 50, "dig_H6": 30,
+}
+
+# Raw ADC values that compensate to roughly 25 C, 1006 hPa, 35 %RH
+BME280_EXAMPLE_RAW = (415148, 519888, 26500)
+
+
+def bme280_registers(cal=BME280_EXAMPLE_CALIBRATION, raw=BME280_EXAMPLE_RAW):
+    """
+    Build a BME280 register map holding the given calibration and raw
+    pres/temp/hum ADC values.
+    """
+
+    c = cal
+    cal1 = struct.pack(
+        "<HhhHhhhhhhhh",
+        c["dig_T1"], c["dig_T2"], c["dig_T3"],
+        c["dig_P1"], c["dig_P2"], c["dig_P3"], c["dig_P4"], c["dig_P5"],
+        c["dig_P6"], c["dig_P7"], c["dig_P8"], c["dig_P9"],
+    )
+    cal3 = struct.pack(
+        "<hBBBBb",
+        c["dig_H2"], c["dig_H3"],
+        (c["dig_H4"] >> 4) & 0xFF,
+        (c["dig_H4"] & 0x0F) | ((c["dig_H5"] & 0x0F) << 4),
+        (c["dig_H5"] >> 4) & 0xFF,
+        c["dig_H6"],
+    )
+
+    registers = {0xD0: 0x60, 0xD1: 0x00}
+    for i, value in enumerate(cal1):
+        registers[0x88 + i] = value
+    registers[0xA1] = c["dig_H1"]
+    for i, value in enumerate(cal3):
+        registers[0xE1 + i] = value
+
+    set_bme280_raw(registers, raw)
+    return registers
+
+
+def attach_bme280(i2c_bus, addr=0x76, registers=None):
+    """
+    Add a simulated BME280 to a FakeSMBus. Writing a forced or normal mode
+    to ctrl_meas sets the status measuring bit for the typical conversion
+    time of the selected oversampling.
+    """
+
+    import bme280
+
+    registers = registers if registers is not None else bme280_registers()
+    i2c_bus.registers[addr] = registers
+    state = {"busy_until": 0.0}
+
+    def on_write(register, values):
+        if register == bme280.REG_CONTROL and values and values[0] & 0x03:
+            ctrl_meas = values[0]
+            conversion_ms = bme280.measurementTime(
+                ctrl_meas >> 5, (ctrl_meas >> 2) & 0x07,
+                registers.get(bme280.REG_CONTROL_HUM, 0) & 0x07, typical=True,
+            )
+            state["busy_until"] = time.time() + conversion_ms / 1000.0
+
+    def on_read(device):
+        measuring = time.time() < state["busy_until"]
+        device[bme280.REG_STATUS] = bme280.STATUS_MEASURING if measuring else 0
+
+    i2c_bus.write_hooks[addr] = on_write
+    i2c_bus.read_hooks[addr] = on_read
+    return registers
+
+
+def set_bme280_raw(registers, raw):
+    """
+    Store raw (pres_raw, temp_raw, hum_raw) ADC values in the data registers.
+    """
+
+    pres_raw, temp_raw, hum_raw = raw
+    registers[0xF7] = (pres_raw >> 12) & 0xFF
+    registers[0xF8] = (pres_raw >> 4) & 0xFF
+    registers[0xF9] = (pres_raw << 4) & 0xF0
+    registers[0xFA] = (temp_raw >> 12) & 0xFF
+    registers[0xFB] = (temp_raw >> 4) & 0xFF
+    registers[0xFC] = (temp_raw << 4) & 0xF0
+    registers[0xFD] = (hum_raw >> 8) & 0xFF
+    registers[0xFE] = hum_raw & 0xFF
+
+
+# ---------------------------------------------------------------------------
+# TSL2561
+# ---------------------------------------------------------------------------
+
+# Channel counts at 402 ms and 16x gain for an office at roughly 300 lux
+TSL2561_EXAMPLE_COUNTS = (11000, 2500)
+
+
+def attach_tsl2561(i2c_bus, addr=0x39, counts=TSL2561_EXAMPLE_COUNTS):
+    """
+    Add a simulated TSL2561 to a FakeSMBus. counts is (channel 0, channel 1)
+    at 402 ms and 16x gain; change state["counts"] to change the light.
+    The data registers read zero until one integration time after power-up
+    and otherwise hold counts scaled to the selected gain and integration
+    time, clipped at saturation.
+    """
+
+    import tsl2561
+
+    registers = i2c_bus.registers.setdefault(addr, {})
+    registers[tsl2561.COMMAND | tsl2561.REG_ID] = 0x50
+    state = {"counts": counts, "powered_at": None}
+
+    def on_write(register, values):
+        register &= 0x0F
+        if register == tsl2561.REG_CONTROL and values:
+            powered = values[0] & 0x03 == tsl2561.POWER_ON
+            state["powered_at"] = time.monotonic() if powered else None
+
+    def on_read(device):
+        timing = device.get(tsl2561.COMMAND | tsl2561.REG_TIMING, tsl2561.INTEGRATION_402MS)
+        integration = timing & 0x03
+        channels = (0, 0)
+        powered_at = state["powered_at"]
+        if powered_at is not None and time.monotonic() - powered_at >= tsl2561.INTEGRATION_TIME[integration]:
+            scale = tsl2561.INTEGRATION_SCALE[integration] * (1 if timing & tsl2561.GAIN_16X else 16)
+            limit = tsl2561.SATURATION[integration]
+            channels = [min(int(count / scale), limit) for count in state["counts"]]
+        for register, value in zip((tsl2561.REG_DATA0, tsl2561.REG_DATA1), channels):
+            device[tsl2561.COMMAND | register] = value & 0xFF
+            device[tsl2561.COMMAND | register + 1] = value >> 8
+
+    i2c_bus.write_hooks[addr] = on_write
+    i2c_bus.read_hooks[addr] = on_read
+    return state
+
+
+# ---------------------------------------------------------------------------
+# MS430
+# ---------------------------------------------------------------------------
+
+# One raw data block per category read register, decoding to plausible values
+MS430_EXAMPLE_DATA = {
+    0x10: [21, 4, 0x5C, 0x8A, 0x01, 0x00, 45, 2, 0x40, 0x0D, 0x03, 0x00],
+    0x11: [42, 0, 5, 0x1F, 0x02, 3, 0, 0, 62, 3],
+    0x12: [0x2C, 0x01, 50, 0x90, 0x01],
+    0x13: [38, 4, 30, 32, 35, 33, 29, 25, 2, 5, 1, 7, 3, 0, 0x0C, 0x00, 40, 1],
+    0x14: [0, 0, 0, 0, 0, 0],
+}
+
+
+class FakeMS430Bus(FakeSMBus):
+    """
+    FakeSMBus with an MS430 at addr. Unlike a plain register map, each MS430
+    category register returns its whole data block.
+    """
+
+    def __init__(self, addr=0x71, data=MS430_EXAMPLE_DATA, simulate_timing=False):
+        FakeSMBus.__init__(self, simulate_timing=simulate_timing)
+        self.ms430_addr = addr
+        self.ms430_data = dict((register, list(block)) for register, block in data.items())
+
+    def read_i2c_block_data(self, addr, register, length):
+        if addr != self.ms430_addr:
+            return FakeSMBus.read_i2c_block_data(self, addr, register, length)
+        self._transfer(length)
+        return self.ms430_data[register][:length]
+
+    def i2c_rdwr(self, *messages):
+        check_rdwr_messages(messages)
+        self.transactions += 1
+        nbytes = 0
+        block = []
+        for message in messages:
+            nbytes += message.len + 1
+            if message.flags & 0x0001:
+                for i in range(message.len):
+                    message.buf[i] = bytes([block[i]])
+            else:
+                block = self.ms430_data.get(list(message)[0], [])
+        self.bytes_transferred += nbytes + 1
+        if self.simulate_timing:
+            time.sleep(I2C_TRANSACTION_OVERHEAD + nbytes * I2C_SECONDS_PER_BYTE)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cost and counters of the shared I2C bus manager.
+
+On a simulated I2C bus (see fake_hardware.py):
+
+- overhead:  time per read_i2c_block_data() straight on FakeSMBus vs
+             through i2c_manager.I2CBus (lock, timing and counters)
+- threads:   a BME280 and a TSL2561 read from two threads at once through
+             one I2CBus with bus timing simulated, then the bus report:
+             transactions per operation and address, latency and lock
+             wait percentiles, and utilization
+
+Usage: python3 i2c-bus-benchmark.py [reads] [seconds]
+"""
+
+import sys
+import threading
+import time
+
+import bme280
+import i2c_manager
+import tsl2561
+from fake_hardware import FakeSMBus, attach_bme280, attach_tsl2561
+
+
+def time_reads(bus, reads):
+    start = time.perf_counter()
+    for _ in range(reads):
+        bus.read_i2c_block_data(bme280.DEVICE, bme280.REG_DATA, 8)
+    return (time.perf_counter() - start) / reads
+
+
+def overhead(reads):
+    raw = FakeSMBus()
+    attach_bme280(raw, bme280.DEVICE)
+    direct = time_reads(raw, reads)
+    managed = time_reads(i2c_manager.I2CBus(raw, 1), reads)
+    print(f"{'direct FakeSMBus':<18} {direct * 1e6:>7.2f} us/read")
+    print(f"{'I2CBus wrapper':<18} {managed * 1e6:>7.2f} us/read  (+{(managed - direct) * 1e6:.2f} us)", flush=True)
+
+
+def threads(seconds):
+    raw = FakeSMBus(simulate_timing=True)
+    attach_bme280(raw, bme280.DEVICE)
+    attach_tsl2561(raw)
+    bus = i2c_manager.I2CBus(raw, 1)
+    weather = bme280.BME280(bme280.DEVICE, bus)
+    light = tsl2561.TSL2561(bus, integration=tsl2561.INTEGRATION_13MS)
+    bus.reset_stats()
+
+    stopping = threading.Event()
+    cycles = {"bme280": 0, "tsl2561": 0}
+
+    def reader(name, read):
+        while not stopping.is_set():
+            read()
+            cycles[name] += 1
+
+    workers = [
+        threading.Thread(target=reader, args=("bme280", weather.read)),
+        threading.Thread(target=reader, args=("tsl2561", light.read)),
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stopping.set()
+    for worker in workers:
+        worker.join()
+
+    print(f"{seconds:.0f} s: {cycles['bme280']} BME280 reads, {cycles['tsl2561']} TSL2561 reads")
+    print(bus.report(), flush=True)
+
+
+def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    overhead(reads)
+    print()
+    threads(seconds)
+
+
+if __name__ == "__main__":
+    main()
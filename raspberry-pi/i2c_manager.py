@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+One shared, locked handle per I2C bus.
+
+bme280.py, the TSL2561 scripts and new_sensor_functions.SensorHardwareSetup()
+each used to open their own SMBus(1), with nothing stopping two threads from
+interleaving transactions on the same wires. get_bus() instead returns one
+I2CBus per bus number, which:
+
+- wraps an smbus2/smbus SMBus (or any object with the same methods, e.g.
+  fake_hardware.FakeSMBus) and offers the same methods, so drivers take it
+  wherever they took an SMBus
+- holds a lock for the duration of every transaction; hold bus.lock
+  yourself (it is re-entrant) to keep a sequence of transactions together
+- counts transactions, bytes and errors per operation and per address,
+  and keeps aggregation.Histogram latency histograms per operation plus
+  one for time spent waiting for the lock, so bus utilization and
+  contention can be measured:
+
+      bus = i2c_manager.get_bus(1)
+      weather = bme280.BME280(i2c_bus=bus)
+      light = tsl2561.TSL2561(bus)
+      ...
+      print(bus.report())
+
+The drivers use get_bus(1) when no bus is passed in. Call
+use_bus(number, handle) before creating them to put something other than a
+real SMBus behind a bus number, e.g. a FakeSMBus when there is no sensor.
+"""
+
+import threading
+import time
+
+from aggregation import Histogram
+
+
+DEFAULT_BUS = 1  # Rev 2 Pi, Pi 2 & Pi 3 onwards; Rev 1 Pi uses bus 0
+
+# Upper bucket edges for I2C latencies in milliseconds: most transactions
+# on a 100 kHz bus take well under a millisecond
+I2C_LATENCY_BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _open_smbus(number):
+    try:
+        import smbus2 as smbus
+    except ImportError:
+        import smbus
+    return smbus.SMBus(number)
+
+
+def _message_bytes(messages):
+    # Address byte plus payload of each i2c_msg
+    return sum(getattr(message, "len", 0) + 1 for message in messages)
+
+
+class BusStats(object):
+    """
+    Counters and latency histograms for one I2CBus.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.by_operation = {}
+        self.by_address = {}
+        self.latency = {}
+        self.lock_wait = Histogram(I2C_LATENCY_BUCKETS_MS)
+
+    def add(self, operation, addr, nbytes, seconds, waited, failed):
+        self.transactions += 1
+        self.bytes += nbytes
+        self.busy += seconds
+        if failed:
+            self.errors += 1
+        self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+        self.by_address[addr] = self.by_address.get(addr, 0) + 1
+        histogram = self.latency.get(operation)
+        if histogram is None:
+            histogram = self.latency[operation] = Histogram(I2C_LATENCY_BUCKETS_MS)
+        histogram.add(seconds * 1000.0)
+        self.lock_wait.add(waited * 1000.0)
+
+    def utilization(self):
+        """
+        Fraction of the time since the last reset spent in transactions.
+        """
+
+        elapsed = time.monotonic() - self.started
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+
+class I2CBus(object):
+    """
+    SMBus-compatible wrapper around handle that serializes and measures
+    every transaction. Offers i2c_rdwr() only if handle does, so callers
+    can keep checking hasattr(bus, 'i2c_rdwr') for combined transactions.
+    """
+
+    def __init__(self, handle, number=None):
+        self.handle = handle
+        self.number = number
+        self.lock = threading.RLock()
+        self.stats = BusStats()
+        if hasattr(handle, "i2c_rdwr"):
+            self.i2c_rdwr = self._i2c_rdwr
+
+    def _call(self, operation, addr, nbytes, function, *args):
+        requested = time.perf_counter()
+        with self.lock:
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args)
+                failed = False
+                return result
+            finally:
+                self.stats.add(operation, addr, nbytes, time.perf_counter() - started, started - requested, failed)
+
+    # Byte counts are address + register + payload, as on the wire
+
+    def read_byte(self, addr):
+        return self._call("read_byte", addr, 2, self.handle.read_byte, addr)
+
+    def read_byte_data(self, addr, register):
+        return self._call("read_byte_data", addr, 3, self.handle.read_byte_data, addr, register)
+
+    def read_i2c_block_data(self, addr, register, length):
+        return self._call("read_block", addr, length + 2, self.handle.read_i2c_block_data, addr, register, length)
+
+    def write_byte(self, addr, value):
+        return self._call("write_byte", addr, 2, self.handle.write_byte, addr, value)
+
+    def write_byte_data(self, addr, register, value):
+        return self._call("write_byte_data", addr, 3, self.handle.write_byte_data, addr, register, value)
+
+    def write_i2c_block_data(self, addr, register, values):
+        return self._call("write_block", addr, len(values) + 2, self.handle.write_i2c_block_data, addr, register, values)
+
+    def _i2c_rdwr(self, *messages):
+        addr = getattr(messages[0], "addr", None) if messages else None
+        return self._call("i2c_rdwr", addr, _message_bytes(messages), self.handle.i2c_rdwr, *messages)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.reset()
+
+    def report(self):
+        """
+        Transaction counts, utilization and latency percentiles since the
+        last reset, one line per operation.
+        """
+
+        stats = self.stats
+        lines = [
+            f"I2C bus {self.number}: {stats.transactions} transactions, {stats.bytes} bytes,"
+            f" {stats.errors} errors, {stats.utilization() * 100:.1f}% busy"
+        ]
+        for operation in sorted(stats.latency):
+            lines.append(f"  {operation:<16} {stats.latency[operation].summary_line()}")
+        lines.append(f"  {'lock wait':<16} {stats.lock_wait.summary_line()}")
+        addresses = sorted(addr for addr in stats.by_address if addr is not None)
+        if addresses:
+            counts = ", ".join(f"0x{addr:02X}: {stats.by_address[addr]}" for addr in addresses)
+            lines.append(f"  {'by address':<16} {counts}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self.lock:
+            close = getattr(self.handle, "close", None)
+            if close is not None:
+                close()
+
+
+# Bus number -> I2CBus, shared by every driver in the process
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(number=DEFAULT_BUS):
+    """
+    The shared I2CBus for bus number, opening the SMBus on first use.
+    """
+
+    with _buses_lock:
+        bus = _buses.get(number)
+        if bus is None:
+            bus = _buses[number] = I2CBus(_open_smbus(number), number)
+        return bus
+
+
+def use_bus(number, handle):
+    """
+    Put handle (an SMBus-like object) behind bus number from now on, and
+    return its I2CBus. Drivers already holding the old bus keep it.
+    """
+
+    with _buses_lock:
+        bus = _buses[number] = I2CBus(handle, number)
+        return bus
+
+
+def close_all():
+    with _buses_lock:
+        buses = list(_buses.values())
+        _buses.clear()
+    for bus in buses:
+        bus.close()
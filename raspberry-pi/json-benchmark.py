@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Payload build + serialize microbenchmark for ms430-dual-mqtt.py.
+
+Times one publish cycle's worth of work from a read_all() snapshot to the
+two JSON payload strings (legacy nested and Home Assistant flat), for:
+
+- stdlib-dicts:  what ms430-dual-mqtt.py used to do - round every value,
+                 build both payload dicts, a datetime-based last_update,
+                 then json.dumps twice
+- orjson-dicts / ujson-dicts: the same dicts through orjson / ujson, if
+                 installed
+- templates:     json_codec.ObjectTemplate from the MS430 schema, as
+                 ms430_publisher.py builds them: legacy values at full
+                 resolution, HA values formatted once at their declared
+                 precision, with json_codec.iso_timestamp
+
+and prints microseconds per cycle, plus the share of one CPU it would take
+at the MS430's fastest (3 s) cycle. Run it on the Pi itself for real
+numbers; a Pi Zero is many times slower than a desktop core.
+
+Usage:
+    python3 json-benchmark.py [cycles]
+"""
+
+import argparse
+import datetime as dt
+import json
+import time
+
+import json_codec
+from json_codec import ObjectTemplate, iso_timestamp
+from sensor_schema import ms430_schema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+CYCLE_PERIOD_S = 3
+
+WRAP = ("upstairs", "office", "ms430")
+
+# One MS430 read_all() snapshot, values at the sensor's full precision
+SNAPSHOT = {
+    "air": {"T": 21.4372, "H_pc": 45.2166, "P_Pa": 100956.3, "G_ohm": 200013.0},
+    "air_quality": {"AQI": 42.318, "AQI_accuracy": 3, "bVOC": 0.62147, "CO2e": 543.27},
+    "light": {"illum_lux": 300.517},
+    "sound": {"peak_amp_mPa": 12.4318, "SPL_dBA": 38.4127},
+}
+
+
+def make_dict_cycle(schema, dumps):
+    def cycle():
+        values = schema.extract(SNAPSHOT)
+        legacy = {WRAP[0]: {WRAP[1]: {WRAP[2]: schema.legacy_fields(values)}}}
+        ha = dict(values)
+        ha["last_update"] = dt.datetime.now().astimezone().isoformat(timespec="seconds")
+        return dumps(legacy), dumps(ha)
+    return cycle
+
+
+def make_template_cycle(schema):
+    legacy_json = ObjectTemplate([(key, name, None) for key, name, digits in schema.fields_named("legacy")], wrap=WRAP)
+    ha_json = ObjectTemplate(schema.fields_named("key"))
+
+    def cycle():
+        values = schema.extract(SNAPSHOT, rounded=False)
+        extras = {"last_update": iso_timestamp()}
+        return legacy_json.encode(values), ha_json.encode(values, extras=extras)
+    return cycle
+
+
+def time_cycles(cycle, cycles):
+    cycle()
+    start = time.perf_counter()
+    for _ in range(cycles):
+        cycle()
+    return (time.perf_counter() - start) / cycles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time MS430 payload build + serialize per publish cycle.")
+    parser.add_argument("cycles", nargs="?", type=int, default=20000)
+    args = parser.parse_args()
+
+    schema = ms430_schema()
+
+    paths = [("stdlib-dicts", make_dict_cycle(schema, json.dumps))]
+    if orjson is not None:
+        paths.append(("orjson-dicts", make_dict_cycle(schema, lambda obj: orjson.dumps(obj).decode())))
+    if ujson is not None:
+        paths.append(("ujson-dicts", make_dict_cycle(schema, ujson.dumps)))
+    paths.append(("templates", make_template_cycle(schema)))
+
+    print(f"json_codec.dumps backend: {json_codec.BACKEND}")
+    print(f"{args.cycles} cycles each\n")
+    print(f"{'path':<14} {'us/cycle':>10} {'bytes':>7} {'CPU at 3 s':>11}")
+
+    for name, cycle in paths:
+        seconds = time_cycles(cycle, args.cycles)
+        size = sum(len(payload) for payload in cycle())
+        print(f"{name:<14} {seconds * 1e6:>10.1f} {size:>7} {seconds / CYCLE_PERIOD_S * 100:>10.4f}%")
+
+    print()
+    for name, cycle in paths:
+        legacy, ha = cycle()
+        print(f"{name}:\n  {legacy}\n  {ha}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+JSON serialization for the publish hot path.
+
+- dumps(obj): compact JSON text using orjson or ujson when installed, else
+  a prebuilt stdlib JSONEncoder. BACKEND names the one in use.
+- ObjectTemplate: encodes a fixed set of keys (e.g. a sensor_schema.Schema's
+  fields), optionally nested inside fixed outer keys. The '"key":' fragments
+  and each value's "%.Nf" precision are built into one format string once,
+  so per reading the values are formatted at their declared precision in a
+  single step, instead of rounding each one and then running the generic
+  encoder. See json-benchmark.py for timings against the dict + dumps
+  path.
+- iso_timestamp(t): local ISO 8601 time with UTC offset, like
+  datetime.now().astimezone().isoformat(timespec="seconds") but cheaper.
+
+Floats formatted at a precision keep their trailing zeros ("21.40"), and
+precision 0 gives an integer ("543"); JSON readers (Telegraf, Home
+Assistant) treat both as the same number.
+"""
+
+import json
+import time
+from json.encoder import encode_basestring_ascii
+
+from sensor_schema import _tuple_getter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+_stdlib_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+
+elif ujson is not None:
+    BACKEND = "ujson"
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=True, escape_forward_slashes=False)
+
+else:
+    BACKEND = "json"
+    dumps = _stdlib_encode
+
+
+_INFINITY = float("inf")
+
+
+def encode_value(value):
+    """
+    JSON text for one value. NaN and infinity become null.
+    """
+
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    value_type = type(value)
+    if value_type is float:
+        return repr(value) if -_INFINITY < value < _INFINITY else "null"
+    if value_type is str:
+        return encode_basestring_ascii(value)
+    if value_type is int:
+        return str(value)
+    return dumps(value)
+
+
+class ObjectTemplate(object):
+    """
+    Encoder for objects with known keys.
+
+    fields is a list of (key in values, name in the output, digits); digits
+    None writes the value with encode_value(). wrap is a list of outer
+    object keys, e.g. ("upstairs", "office", "ms430") for the legacy nested
+    payload.
+
+    When every field is present and every field with digits holds a finite
+    number, all of them are written by a single %-format of one prebuilt
+    format string; otherwise field by field.
+    """
+
+    def __init__(self, fields, wrap=()):
+        fields = list(fields)
+        self.fields = tuple(
+            (
+                encode_basestring_ascii(name) + ":",
+                key,
+                f"%.{digits}f" if digits is not None else None,
+            )
+            for key, name, digits in fields
+        )
+        self.prefix = "".join("{" + encode_basestring_ascii(name) + ":" for name in wrap) + "{"
+        self.suffix = "}" * len(wrap)
+
+        self._format = ",".join(
+            prefix.replace("%", "%%") + (float_format or "%s")
+            for prefix, key, float_format in self.fields
+        )
+        self._getter = _tuple_getter([key for key, name, digits in fields])
+        self._number_getter = _tuple_getter([key for key, name, digits in fields if digits is not None])
+        self._text_indexes = tuple(index for index, (key, name, digits) in enumerate(fields) if digits is None)
+
+    def _encode_all(self, values):
+        try:
+            total = sum(self._number_getter(values))
+            if total - total != 0:
+                # NaN or infinity somewhere
+                return None
+            arguments = list(self._getter(values))
+        except (KeyError, TypeError):
+            return None
+
+        for index in self._text_indexes:
+            arguments[index] = encode_value(arguments[index])
+        return self._format % tuple(arguments)
+
+    def _encode_fields(self, values, only):
+        parts = []
+        append = parts.append
+
+        for prefix, key, float_format in self.fields:
+            if only is not None and key not in only:
+                continue
+            try:
+                value = values[key]
+            except KeyError:
+                continue
+            if float_format is not None and type(value) in (float, int) and -_INFINITY < value < _INFINITY:
+                append(prefix + float_format % value)
+            else:
+                append(prefix + encode_value(value))
+
+        return ",".join(parts)
+
+    def encode(self, values, only=None, extras=None, outer=None):
+        """
+        values: dict holding the field keys (missing keys are skipped).
+        only: if given, the set of keys to include.
+        extras: more {name: value} for the innermost object.
+        outer: more {name: value} for the outermost object (with wrap).
+        """
+
+        body = None
+        if only is None:
+            body = self._encode_all(values)
+        if body is None:
+            body = self._encode_fields(values, only)
+
+        if extras:
+            extra_text = ",".join(encode_basestring_ascii(name) + ":" + encode_value(value) for name, value in extras.items())
+            body = body + "," + extra_text if body else extra_text
+
+        text = self.prefix + body + "}"
+        if not outer:
+            return text + self.suffix
+
+        outer_text = ",".join(encode_basestring_ascii(name) + ":" + encode_value(value) for name, value in outer.items())
+        if self.suffix:
+            return text + self.suffix[:-1] + "," + outer_text + "}"
+        return text[:-1] + ("," if body else "") + outer_text + "}"
+
+
+def iso_timestamp(t=None):
+    """
+    Local time t (default now) as e.g. "2024-05-01T14:03:21+01:00".
+    """
+
+    if t is None:
+        t = time.time()
+    local = time.localtime(t)
+    offset = local.tm_gmtoff
+    sign = "+" if offset >= 0 else "-"
+    offset = abs(offset)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", local) + "%s%02d:%02d" % (sign, offset // 3600, offset % 3600 // 60)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Line protocol publish benchmark.
+
+Compares the three ways a capture script can send one MS430 read cycle
+(eleven values) to the "sensors" topic:
+
+- per-metric:   the old layout, one MQTT publish per value
+- compat:       the same lines, newline-joined into one publish
+- multi-field:  one "ms430,..." line with eleven fields, one publish
+
+For each it reports MQTT packets and bytes on the wire per cycle (PUBLISH
+fixed header, topic and payload at QoS 0) and the time to build the
+payloads.
+
+With --broker, the cycles are also published to a real broker and the
+publish rate is reported. To compare Telegraf CPU use, run the Docker stack
+in Docker/ with an inputs.mqtt_consumer on "sensors" using
+data_format = "influx", point --broker at it and watch
+"docker stats telegraf" while each layout runs.
+
+Usage:
+    python3 line-protocol-benchmark.py [cycles] [--broker HOST] [--port PORT]
+"""
+
+import argparse
+import time
+
+from line_protocol import (
+    LINE_FORMAT_COMPAT,
+    LINE_FORMAT_MULTI_FIELD,
+    build_payload,
+    format_metric_lines,
+    timestamp_ns,
+)
+
+TOPIC = "sensors"
+
+TAGS = {"room": "office-ms430", "floor": "upstairs"}
+
+# One MS430 cycle, with the names and rounding ms430-capture.py uses
+FIELDS = {
+    "temperature": 21.4,
+    "humidity": 45.2,
+    "pressure": 1009.56,
+    "lux": 300.52,
+    "airquality": 42.0,
+    "airquality-accuracy": 3,
+    "bvoc": 0.62,
+    "co2": 543.0,
+    "gas-resistance": 200000,
+    "sound-peak-amp": 12.43,
+    "sound-decibels": 38.4,
+}
+
+
+def per_metric_payloads():
+    # What the capture scripts used to send: one line per publish, no timestamp
+    return format_metric_lines(TAGS, FIELDS)
+
+
+def compat_payloads():
+    return [build_payload(LINE_FORMAT_COMPAT, "ms430", TAGS, FIELDS, timestamp_ns())]
+
+
+def multi_field_payloads():
+    return [build_payload(LINE_FORMAT_MULTI_FIELD, "ms430", TAGS, FIELDS, timestamp_ns())]
+
+
+LAYOUTS = [
+    ("per-metric", per_metric_payloads),
+    ("compat", compat_payloads),
+    ("multi-field", multi_field_payloads),
+]
+
+
+def publish_packet_size(topic, payload):
+    # MQTT 3.1.1 PUBLISH at QoS 0: fixed header byte, remaining length
+    # (1-4 bytes), 2-byte topic length, topic, payload
+    remaining = 2 + len(topic.encode()) + len(payload.encode())
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes:
+        length_bytes += 1
+    return 1 + length_bytes + remaining
+
+
+def offline(cycles):
+    print(f"Line protocol layouts, {cycles} cycles of {len(FIELDS)} values", flush=True)
+    for label, build in LAYOUTS:
+        start = time.perf_counter()
+        for _ in range(cycles):
+            payloads = build()
+        elapsed = time.perf_counter() - start
+
+        wire_bytes = sum(publish_packet_size(TOPIC, payload) for payload in payloads)
+        print(
+            f"{label:<12} {len(payloads):>3} packets/cycle  {wire_bytes:>5} bytes/cycle"
+            f"  {elapsed * 1e6 / cycles:>7.1f} us/cycle to build",
+            flush=True,
+        )
+
+
+def online(cycles, host, port):
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client("line-protocol-benchmark")
+    client.connect(host, port)
+    client.loop_start()
+
+    print(f"Publishing {cycles} cycles per layout to {host}:{port}", flush=True)
+    try:
+        for label, build in LAYOUTS:
+            packets = 0
+            start = time.perf_counter()
+            for _ in range(cycles):
+                for payload in build():
+                    client.publish(TOPIC, payload).wait_for_publish()
+                    packets += 1
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<12} {packets / elapsed:>8.0f} packets/s  {cycles / elapsed:>8.0f} cycles/s",
+                flush=True,
+            )
+            # Let Telegraf drain before the next layout
+            time.sleep(2)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare line protocol publish layouts.")
+    parser.add_argument("cycles", nargs="?", type=int, default=10000)
+    parser.add_argument("--broker", help="also publish to this MQTT broker")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    offline(args.cycles)
+    if args.broker:
+        online(args.cycles, args.broker, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+InfluxDB line protocol payloads for the *-capture.py scripts.
+
+The capture scripts used to publish one MQTT message per metric, e.g.
+
+    temperature,room=office-ms430,floor=upstairs value=21.4
+
+which costs one MQTT packet, and one Telegraf parse, per value. This module
+builds all of a read cycle's values as one payload instead, in one of two
+layouts:
+
+- LINE_FORMAT_COMPAT: the same one-measurement-per-metric lines as before,
+  newline-joined, so existing InfluxDB series and Grafana queries keep
+  working unchanged
+- LINE_FORMAT_MULTI_FIELD: a single line with every value as a field of one
+  measurement, e.g.
+
+    ms430,room=office-ms430,floor=upstairs temperature=21.4,humidity=45.2
+
+Both carry an explicit timestamp (nanoseconds since the epoch, the InfluxDB
+default precision) taken when the sensor was read, so points are not
+re-timed by Telegraf when a publish is delayed.
+
+Numbers are written without the integer suffix, as the old scripts did, so
+the field types already stored in InfluxDB (float) do not change.
+"""
+
+import math
+import time
+
+
+LINE_FORMAT_COMPAT = "compat"
+LINE_FORMAT_MULTI_FIELD = "multi-field"
+
+LINE_FORMATS = (LINE_FORMAT_COMPAT, LINE_FORMAT_MULTI_FIELD)
+
+
+def _escape(value, characters):
+    value = str(value)
+    for character in characters:
+        value = value.replace(character, "\\" + character)
+    return value
+
+
+def escape_measurement(name):
+    return _escape(name, "\\, ")
+
+
+def escape_key(key):
+    # Tag keys, tag values and field keys
+    return _escape(key, "\\,= ")
+
+
+def format_field_value(value):
+    """
+    Line protocol text for a field value, or None if it cannot be written
+    (None or NaN, e.g. a failed read).
+    """
+
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return None
+        return str(value)
+    return '"' + _escape(value, '\\"') + '"'
+
+
+def timestamp_ns(now=None):
+    if now is None:
+        return time.time_ns()
+    return int(now * 1e9)
+
+
+def format_line(measurement, tags, fields, timestamp=None):
+    """
+    One line: measurement,tag=..,tag=.. field=..,field=.. [timestamp].
+    Fields that cannot be written are left out; returns None if none are left.
+    """
+
+    field_text = []
+    for key, value in fields.items():
+        text = format_field_value(value)
+        if text is not None:
+            field_text.append(escape_key(key) + "=" + text)
+
+    if not field_text:
+        return None
+
+    line = escape_measurement(measurement)
+    for key, value in tags.items():
+        line += "," + escape_key(key) + "=" + escape_key(value)
+    line += " " + ",".join(field_text)
+    if timestamp is not None:
+        line += " " + str(timestamp)
+    return line
+
+
+def format_metric_lines(tags, fields, timestamp=None, field_key="value"):
+    """
+    The old layout: one line per field, using the field name as the
+    measurement and field_key ("value") as the only field.
+    """
+
+    lines = []
+    for name, value in fields.items():
+        line = format_line(name, tags, {field_key: value}, timestamp)
+        if line is not None:
+            lines.append(line)
+    return lines
+
+
+def build_payload(line_format, measurement, tags, fields, timestamp=None):
+    """
+    All of fields as one MQTT payload in line_format. measurement is only
+    used by LINE_FORMAT_MULTI_FIELD. Returns "" if there is nothing to send.
+    """
+
+    if line_format == LINE_FORMAT_COMPAT:
+        lines = format_metric_lines(tags, fields, timestamp)
+    elif line_format == LINE_FORMAT_MULTI_FIELD:
+        line = format_line(measurement, tags, fields, timestamp)
+        lines = [line] if line is not None else []
+    else:
+        raise ValueError(f"Unknown line format {line_format!r}, expected one of {LINE_FORMATS}")
+    return "\n".join(lines)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+On-device history of sensor readings in SQLite.
+
+LocalStore keeps every numeric reading on the Pi, independently of MQTT
+and InfluxDB, so there is local history through NAS outages and a cheap
+source for on-device displays:
+
+- raw:        every (series, timestamp, value), kept for raw_days
+- rollup_1m:  count, sum, minimum and maximum per series and minute, kept
+              for minute_days
+- rollup_1h:  the same per hour, kept for hour_days (None: forever)
+
+A series is one (sensor, field) pair, e.g. ("bme280", "temperature"),
+stored once in the series table so raw rows are just three numbers.
+
+The database is in WAL mode with synchronous=NORMAL, and add() only queues
+rows: they are written in one transaction once batch_size rows are waiting
+or flush_interval seconds have passed (checked on add()), and on flush(),
+query() and close(). A power cut loses at most that batch, never the file.
+If the transaction fails (e.g. the disk is full) the error is raised and the
+rows stay queued for the next flush.
+The rollups are updated from each batch as it is written (merging into
+buckets that already exist, so readings that arrive late, e.g. from a
+catch-up after an outage, still count). A reading whose series and
+timestamp are already stored, e.g. one replayed from the offline buffer, is
+ignored: the first value is kept and the rollups count it once. Old rows
+are pruned at most once per PRUNE_INTERVAL.
+
+query() returns a field's readings over a time range from whichever table
+suits the range; latest() returns the newest value of every field, e.g.
+for a display.
+
+Typical use:
+
+    store = LocalStore("/home/pi/readings.db")
+    store.add({"temperature": 21.4, "humidity": 45.2}, sensor="bme280")
+    store.query("temperature", start=time.time() - 3600, sensor="bme280")
+    store.close()
+
+Strings, flags and None are skipped; only numbers are stored.
+"""
+
+import math
+import threading
+import time
+
+from aggregation import is_number
+
+
+DEFAULT_RAW_DAYS = 7
+DEFAULT_MINUTE_DAYS = 90
+DEFAULT_HOUR_DAYS = None
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 60.0
+
+# How often old rows are deleted (seconds)
+PRUNE_INTERVAL = 3600
+
+# query(resolution="auto") reads raw rows for ranges up to this long, then
+# minute rollups up to ROLLUP_MINUTE_SPAN, then hour rollups (seconds)
+RAW_SPAN = 6 * 3600
+ROLLUP_MINUTE_SPAN = 7 * 86400
+
+ROLLUPS = (
+    ("rollup_1m", 60),
+    ("rollup_1h", 3600),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    sensor TEXT NOT NULL,
+    field TEXT NOT NULL,
+    UNIQUE (sensor, field)
+);
+CREATE TABLE IF NOT EXISTS raw (
+    series INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    series INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1h (
+    series INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series, bucket)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO {table} (series, bucket, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (series, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max)
+"""
+
+
+class LocalStore(object):
+    """
+    path is the database file; raw_days, minute_days and hour_days are how
+    long each table keeps rows (None: forever). Safe to use from several
+    threads.
+    """
+
+    def __init__(
+        self,
+        path,
+        raw_days=DEFAULT_RAW_DAYS,
+        minute_days=DEFAULT_MINUTE_DAYS,
+        hour_days=DEFAULT_HOUR_DAYS,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.retention = {
+            "raw": raw_days,
+            "rollup_1m": minute_days,
+            "rollup_1h": hour_days,
+        }
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        # Imported here so the publisher scripts don't load sqlite3 at start-up unless a store is configured
+        import sqlite3
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.executescript(SCHEMA)
+        self._load_series()
+
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.last_prune = 0.0
+        self.rows_written = 0
+
+    def _load_series(self):
+        self.series = {
+            (sensor, field): series_id
+            for series_id, sensor, field in self.db.execute("SELECT id, sensor, field FROM series")
+        }
+
+    def _series_id(self, sensor, field):
+        series_id = self.series.get((sensor, field))
+        if series_id is None:
+            series_id = self.db.execute(
+                "INSERT INTO series (sensor, field) VALUES (?, ?)", (sensor, field)
+            ).lastrowid
+            self.series[(sensor, field)] = series_id
+        return series_id
+
+    def add(self, values, timestamp=None, sensor=""):
+        """
+        Queue every numeric value in the flat dict values, taken at
+        timestamp (Unix time, default now), for sensor.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            for field, value in values.items():
+                if is_number(value) and math.isfinite(value):
+                    self.pending.append((sensor, field, timestamp, float(value)))
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if self.pending:
+            try:
+                with self.db:
+                    raw = []
+                    for sensor, field, ts, value in self.pending:
+                        row = (self._series_id(sensor, field), ts, value)
+                        # Only rows actually inserted go into the rollups, or a repeated timestamp would count twice
+                        if self.db.execute("INSERT OR IGNORE INTO raw (series, ts, value) VALUES (?, ?, ?)", row).rowcount == 1:
+                            raw.append(row)
+                    for table, width in ROLLUPS:
+                        self.db.executemany(ROLLUP_UPSERT.format(table=table), _rollup(raw, width))
+            except Exception:
+                # Rolled back: the rows stay pending for the next flush, and
+                # series inserted in the transaction are gone again
+                self._load_series()
+                raise
+            self.pending = []
+            self.rows_written += len(raw)
+
+        if self.last_flush - self.last_prune >= PRUNE_INTERVAL:
+            self.last_prune = self.last_flush
+            self._prune()
+
+    def _prune(self):
+        now = time.time()
+        with self.db:
+            for table, days in self.retention.items():
+                if days is None:
+                    continue
+                column = "ts" if table == "raw" else "bucket"
+                for series_id in self.series.values():
+                    self.db.execute(
+                        f"DELETE FROM {table} WHERE series = ? AND {column} < ?",
+                        (series_id, now - days * 86400),
+                    )
+
+    def query(self, field, start=None, end=None, sensor="", resolution="auto"):
+        """
+        A field's readings from start to end (Unix times; default the last
+        hour up to now), oldest first.
+
+        resolution "raw" returns [(timestamp, value)]; "1m" and "1h" return
+        [(bucket start, mean, minimum, maximum, count)] from the rollups;
+        "auto" picks raw, 1m or 1h from the length of the range, and the
+        shape of the result follows. Returns [] for an unknown series.
+        """
+
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - 3600
+        if resolution == "auto":
+            span = end - start
+            resolution = "raw" if span <= RAW_SPAN else "1m" if span <= ROLLUP_MINUTE_SPAN else "1h"
+
+        with self.lock:
+            self._flush()
+            series_id = self.series.get((sensor, field))
+            if series_id is None:
+                return []
+            if resolution == "raw":
+                return self.db.execute(
+                    "SELECT ts, value FROM raw WHERE series = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                    (series_id, start, end),
+                ).fetchall()
+            if resolution not in ("1m", "1h"):
+                raise ValueError(f"Unknown resolution {resolution!r}, expected raw, 1m, 1h or auto")
+            table, width = ROLLUPS[0] if resolution == "1m" else ROLLUPS[1]
+            return self.db.execute(
+                f"SELECT bucket, sum / count, min, max, count FROM {table} "
+                "WHERE series = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket",
+                (series_id, start - start % width, end),
+            ).fetchall()
+
+    def latest(self, sensor=""):
+        """
+        {field: (timestamp, value)} with the newest reading of each of
+        sensor's fields.
+        """
+
+        with self.lock:
+            self._flush()
+            result = {}
+            for (series_sensor, field), series_id in self.series.items():
+                if series_sensor != sensor:
+                    continue
+                row = self.db.execute(
+                    "SELECT ts, value FROM raw WHERE series = ? ORDER BY ts DESC LIMIT 1", (series_id,)
+                ).fetchone()
+                if row:
+                    result[field] = row
+            return result
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.close()
+
+
+def _rollup(raw, width):
+    # [(series, timestamp, value)] -> [(series, bucket, count, sum, min, max)]
+    buckets = {}
+    for series_id, ts, value in raw:
+        key = (series_id, int(ts // width) * width)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, value, value, value]
+        else:
+            bucket[0] += 1
+            bucket[1] += value
+            if value < bucket[2]:
+                bucket[2] = value
+            if value > bucket[3]:
+                bucket[3] = value
+    return [(series_id, start, *bucket) for (series_id, start), bucket in buckets.items()]
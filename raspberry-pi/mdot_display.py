@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro Dot pHAT display rotation on its own thread.
+
+The BME280 Micro Dot scripts used to read the sensor, publish, and then
+spend the rest of the minute in three time.sleep(20) display steps, so the
+display set the sample rate and a slow publish froze the display. Now:
+
+- the sampling loop puts each reading in a LatestValues cache and carries
+  on with its own schedule
+- MicroDotDisplay runs in a daemon thread, rotating through its pages
+  every page_seconds and redrawing the current page every refresh seconds
+  from whatever the cache holds (so the clock page keeps time), but only
+  writing to the display when the text has changed
+
+Pages are names from PAGES ("time", "temperature", "humidity",
+"pressure"). A page whose value is missing, or older than stale_after
+seconds, shows "----" so a stuck sensor is visible.
+"""
+
+import datetime
+import threading
+import time
+
+
+def _format_time(values):
+    return datetime.datetime.now().strftime("%H:%M")
+
+
+def _formatter(key, template):
+    def format_value(values):
+        value = values.get(key)
+        return None if value is None else template % value
+    return format_value
+
+
+# Page name -> function(values) returning the text to show, or None
+PAGES = {
+    "time": _format_time,
+    "temperature": _formatter("temperature", "%.1fC"),
+    "humidity": _formatter("humidity", "%.0f%% RH"),
+    "pressure": _formatter("pressure", "%.0fhPa"),
+}
+
+# Pages that don't depend on a reading, and are shown even without one
+CLOCK_PAGES = ("time",)
+
+NO_VALUE = "----"
+
+
+class LatestValues(object):
+    """
+    The most recent reading, shared between the sampling loop and the
+    display thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.updated = None
+
+    def update(self, values):
+        with self.lock:
+            self.values = dict(values)
+            self.updated = time.monotonic()
+
+    def get(self):
+        """
+        (values, seconds since they were updated, or None if never).
+        """
+
+        with self.lock:
+            if self.updated is None:
+                return {}, None
+            return self.values, time.monotonic() - self.updated
+
+
+class MicroDotDisplay(object):
+    """
+    Shows pages of latest's values on the Micro Dot pHAT. Call start() once;
+    stop() blanks the display.
+    """
+
+    def __init__(
+        self,
+        latest,
+        pages=("time", "temperature", "humidity"),
+        page_seconds=20,
+        refresh=1.0,
+        stale_after=None,
+        brightness=0.25,
+    ):
+        unknown = [page for page in pages if page not in PAGES]
+        if unknown:
+            raise ValueError(f"Unknown display pages {unknown}, expected some of {sorted(PAGES)}")
+
+        import microdotphat
+
+        self.display = microdotphat
+        self.latest = latest
+        self.pages = list(pages)
+        self.page_seconds = page_seconds
+        self.refresh = refresh
+        self.stale_after = stale_after
+        self.brightness = brightness
+        self.shown = None
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def text(self, page):
+        values, age = self.latest.get()
+        if page not in CLOCK_PAGES and (age is None or (self.stale_after is not None and age > self.stale_after)):
+            return NO_VALUE
+        text = PAGES[page](values)
+        return NO_VALUE if text is None else text
+
+    def draw(self, text):
+        if text == self.shown:
+            return
+        self.display.clear()
+        self.display.write_string(text, kerning=False)
+        self.display.show()
+        self.shown = text
+
+    def _run(self):
+        self.display.set_brightness(self.brightness)
+        page_index = 0
+        page_started = time.monotonic()
+        while not self.stopping.is_set():
+            if time.monotonic() - page_started >= self.page_seconds:
+                page_index = (page_index + 1) % len(self.pages)
+                page_started = time.monotonic()
+            try:
+                self.draw(self.text(self.pages[page_index]))
+            except Exception as exc:
+                print(f"Display error: {exc}", flush=True)
+            # Wake for the next refresh, or the next page if that is sooner
+            next_page = page_started + self.page_seconds - time.monotonic()
+            self.stopping.wait(max(0.0, min(self.refresh, next_page)))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="mdot-display", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(self.refresh + 1)
+        self.display.clear()
+        self.display.show()
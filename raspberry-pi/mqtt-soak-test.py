@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MQTT connection soak test.
+
+Publishes a small line protocol payload for many cycles against a local
+broker (e.g. mosquitto from the Docker/ stack, or "mosquitto -p 1883") and
+tracks, every --report cycles:
+
+- open sockets held by this process (from /proc/self/fd)
+- CONNECT packets sent (counted from paho's debug log)
+- successful connections and unexpected disconnects
+
+Modes:
+
+- shared:     one mqtt_connection.MQTTConnection for the whole run, as the
+              publisher scripts now do. Sockets and CONNECT packets should
+              stay at 1 for the whole run (unless the broker is restarted,
+              which this test can be used to check too).
+- per-cycle:  what bme280-capture.py used to do - a new client and
+              connect() every cycle, never disconnected. Sockets and
+              CONNECT packets grow by one per cycle.
+
+Exits with status 1 if the shared mode ends with more than one socket open.
+
+Usage:
+    python3 mqtt-soak-test.py [--host localhost] [--port 1883] [--cycles 5000]
+                              [--interval 0] [--mode shared|per-cycle]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+
+from line_protocol import LINE_FORMAT_COMPAT, build_payload, timestamp_ns
+from mqtt_connection import MQTTConnection
+
+TOPIC = "soak-test"
+
+
+def open_sockets():
+    count = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+class ConnectCounter(object):
+    """
+    paho on_log callback counting CONNECT packets sent.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, client, userdata, level, buf):
+        if buf.startswith("Sending CONNECT"):
+            self.count += 1
+
+
+def payload(cycle):
+    fields = {"temperature": 21.4, "humidity": 45.2, "cycle": cycle}
+    return build_payload(LINE_FORMAT_COMPAT, "soak", {"room": "test"}, fields, timestamp_ns())
+
+
+def report(cycle, baseline, connect_packets, connection=None):
+    line = f"cycle {cycle:>7}  sockets {open_sockets() - baseline:>5}  CONNECT packets {connect_packets:>5}"
+    if connection is not None:
+        line += f"  connects {connection.connects:>3}  disconnects {connection.disconnects:>3}"
+    print(line, flush=True)
+
+
+def soak_shared(args, baseline):
+    counter = ConnectCounter()
+    connection = MQTTConnection(args.host, "mqtt-soak-test", port=args.port)
+    connection.client.on_log = counter
+    connection.start()
+    if not connection.wait_connected(10):
+        sys.exit(f"Could not connect to {args.host}:{args.port}")
+
+    try:
+        for cycle in range(1, args.cycles + 1):
+            connection.publish(TOPIC, payload(cycle))
+            if cycle % args.report == 0:
+                report(cycle, baseline, counter.count, connection)
+            time.sleep(args.interval)
+    finally:
+        sockets = open_sockets() - baseline
+        connection.stop()
+
+    return sockets
+
+
+def soak_per_cycle(args, baseline):
+    counter = ConnectCounter()
+    clients = []
+
+    for cycle in range(1, args.cycles + 1):
+        try:
+            client = mqtt.Client("mqtt-soak-test")
+            client.on_log = counter
+            client.connect(args.host, args.port)
+            client.publish(TOPIC, payload(cycle))
+            clients.append(client)
+        except OSError as exc:
+            print(f"cycle {cycle}: {exc}", flush=True)
+            break
+        if cycle % args.report == 0:
+            report(cycle, baseline, counter.count)
+        time.sleep(args.interval)
+
+    sockets = open_sockets() - baseline
+    for client in clients:
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+    return sockets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test MQTT connection handling.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--cycles", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between cycles")
+    parser.add_argument("--report", type=int, default=500, help="print counters every N cycles")
+    parser.add_argument("--mode", choices=["shared", "per-cycle"], default="shared")
+    args = parser.parse_args()
+
+    baseline = open_sockets()
+    print(f"Soak test, {args.mode} connection, {args.cycles} cycles against {args.host}:{args.port}", flush=True)
+
+    if args.mode == "shared":
+        sockets = soak_shared(args, baseline)
+    else:
+        sockets = soak_per_cycle(args, baseline)
+
+    print(f"Sockets open at the end: {sockets}", flush=True)
+    sys.exit(1 if args.mode == "shared" and sockets > 1 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+One long-lived MQTT connection per broker for the publisher scripts.
+
+The scripts used to set up their own paho client and spin on
+"while not client.connected_flag: time.sleep(1)" forever if the broker was
+down at start-up (and bme280-capture.py opened a new connection every
+period without closing the old one). MQTTConnection instead:
+
+- creates a single client and starts paho's network thread (loop_start)
+- makes the first connection from that thread (connect_async), so a broker
+  that is down at start-up is retried like any later disconnect
+- reconnects with exponential backoff, from RECONNECT_MIN_DELAY doubling up
+  to RECONNECT_MAX_DELAY seconds (paho's reconnect_delay_set)
+- offers wait_connected(timeout), which blocks on an Event rather than
+  polling, and gives up after the timeout so readings still get taken
+
+Typical use:
+
+    connection = MQTTConnection(brokerAddress, clientName)
+    connection.start()
+    connection.wait_connected()
+    client = connection.client
+"""
+
+import threading
+
+import paho.mqtt.client as mqtt
+
+
+DEFAULT_PORT = 1883
+DEFAULT_KEEPALIVE = 60
+
+# Backoff between reconnect attempts (seconds)
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 120
+
+# How long wait_connected() blocks by default (seconds)
+CONNECT_TIMEOUT = 30
+
+
+class MQTTConnection(object):
+    """
+    A paho client that stays connected.
+
+    on_connect / on_disconnect, if given, are called with paho's usual
+    arguments after the connection state has been updated, e.g. to publish
+    discovery or availability messages on every (re)connect.
+    """
+
+    def __init__(
+        self,
+        host,
+        client_id,
+        port=DEFAULT_PORT,
+        keepalive=DEFAULT_KEEPALIVE,
+        username=None,
+        password=None,
+        label="MQTT",
+        on_connect=None,
+        on_disconnect=None,
+    ):
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.label = label
+        self.user_on_connect = on_connect
+        self.user_on_disconnect = on_disconnect
+
+        self.connected = threading.Event()
+        self.connects = 0
+        self.disconnects = 0
+
+        self.client = mqtt.Client(client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connects += 1
+            self.connected.set()
+            print(f"Connected to {self.label} broker at {self.host}:{self.port}", flush=True)
+        else:
+            print(f"{self.label} broker at {self.host}:{self.port} refused the connection. Result code: {rc}", flush=True)
+
+        if self.user_on_connect:
+            self.user_on_connect(client, userdata, flags, rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            self.disconnects += 1
+            print(f"{self.label} broker disconnected unexpectedly, reconnecting...", flush=True)
+
+        if self.user_on_disconnect:
+            self.user_on_disconnect(client, userdata, rc)
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        # Must be called before start()
+        self.client.will_set(topic, payload=payload, qos=qos, retain=retain)
+
+    def start(self):
+        """
+        Start the network thread; it connects, and keeps reconnecting, in
+        the background.
+        """
+
+        self.client.connect_async(self.host, self.port, keepalive=self.keepalive)
+        self.client.loop_start()
+
+    def wait_connected(self, timeout=CONNECT_TIMEOUT):
+        """
+        Block until connected or timeout seconds have passed. Returns True
+        if connected.
+        """
+
+        if self.connected.is_set():
+            return True
+
+        print(f"Connecting to {self.label} broker at {self.host}:{self.port}...", flush=True)
+        if self.connected.wait(timeout):
+            return True
+
+        print(f"Not connected to {self.label} broker after {timeout} seconds, still retrying in the background", flush=True)
+        return False
+
+    @property
+    def is_connected(self):
+        return self.connected.is_set()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+
+    def stop(self):
+        try:
+            self.client.disconnect()
+            self.client.loop_stop()
+        except Exception:
+            pass
+        self.connected.clear()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MS430 asyncio MQTT publisher.
+
+Publishes the same payloads as ms430-dual-mqtt.py (the settings and payload
+code are in ms430_publisher.py, shared by both), but runs everything as
+asyncio tasks on one event loop:
+
+- READY falling edges are handed from the GPIO callback thread to the loop
+- I2C reads run in a single-thread executor, so a slow read never blocks
+  the loop
+- every broker has its own publish task and bounded queue, and each publish
+  awaits the broker's PUBACK as a future resolved from paho's on_publish,
+  so a slow or hung broker only holds up its own queue, never the sampling
+  or the other brokers. When a queue is full the oldest reading is dropped.
+
+The brokers are the MQTT sinks of SINKS_CONFIG, or the NAS / HA brokers in
+ms430_publisher.py, each on an mqtt_connection.MQTTConnection; their
+offline_buffer_dir and retries are not used here. Other sinks (files,
+SQLite) go through sinks.SinkSet as in ms430-dual-mqtt.py. For each broker a
+histogram of the latency from the READY edge to the broker's PUBACK is
+printed every STATS_PERIOD seconds and on exit.
+
+Readings are published every PUBLISH_PERIOD seconds ("publish-only"
+sampling); the other sampling policies are only in ms430-dual-mqtt.py.
+"""
+
+import asyncio
+import concurrent.futures
+import signal
+import time
+
+import paho.mqtt.client as mqtt
+
+from new_sensor_functions import *
+import ms430_publisher as ms430
+from aggregation import Histogram
+from mqtt_connection import MQTTConnection
+from raw_capture import RawCaptureWriter
+from sinks import SinkSet, load_sink_configs
+
+
+# ---------------------------------------------------------------------------
+# Settings
+# ---------------------------------------------------------------------------
+
+# Readings waiting per broker before the oldest is dropped
+QUEUE_SIZE = 10
+
+# Give up waiting for a PUBACK after this many seconds. The reading is not
+# published again: paho still holds it and resends it after a reconnect.
+ACK_TIMEOUT = 30
+
+# How often to print the latency histograms (seconds)
+STATS_PERIOD = 15 * 60
+
+
+def sink_configs():
+    """
+    (MQTT sink configs, other sink configs) from SINKS_CONFIG or the
+    ms430_publisher.py settings.
+    """
+
+    configs = load_sink_configs(ms430.SINKS_CONFIG) if ms430.SINKS_CONFIG else ms430.default_sink_configs()
+    brokers = [config for config in configs if config.get("type") == "mqtt"]
+    others = [config for config in configs if config.get("type") != "mqtt"]
+    return brokers, others
+
+
+# ---------------------------------------------------------------------------
+# Brokers
+# ---------------------------------------------------------------------------
+
+class AsyncBroker(object):
+    """
+    One MQTT sink config published to from the event loop: an
+    MQTTConnection (which connects and reconnects in the background) and a
+    queue of (READY edge time, payload) for publish_loop().
+    """
+
+    def __init__(self, loop, config, on_connect=None):
+        on_connect = on_connect or {}
+        if config.get("serializer") not in ms430.SERIALIZERS:
+            raise ValueError(f"Sink {config.get('name')!r}: unknown serializer {config.get('serializer')!r}")
+        if config.get("on_connect") and config["on_connect"] not in on_connect:
+            raise ValueError(f"Sink {config.get('name')!r}: unknown on_connect {config['on_connect']!r}")
+
+        self.loop = loop
+        self.config = config
+        self.label = config["name"]
+        self.serializer = ms430.SERIALIZERS[config["serializer"]]
+        self.topic = config["topic"]
+        self.qos = config.get("qos", ms430.MQTT_QOS)
+        self.retain = config.get("retain", False)
+        self.availability_topic = config.get("availability_topic")
+        self.retain_availability = config.get("retain_availability", True)
+        self.extra_on_connect = on_connect.get(config.get("on_connect"))
+
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.connected = asyncio.Event()
+        self.histogram = Histogram()
+        self.acks = {}
+        self.dropped = 0
+        self.timeouts = 0
+
+        self.connection = MQTTConnection(
+            config["host"],
+            f"{ms430.DEVICE_ID}_{self.label}".lower().replace(" ", "_"),
+            port=config.get("port", 1883),
+            username=config.get("username"),
+            password=config.get("password"),
+            label=self.label,
+            on_connect=self.on_connect,
+            on_disconnect=self.on_disconnect,
+        )
+        self.connection.client.on_publish = self.on_publish
+        if self.availability_topic:
+            self.connection.will_set(self.availability_topic, payload="offline", qos=self.qos, retain=self.retain_availability)
+
+    # -- paho callbacks (network thread) -----------------------------------
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            return
+        self.loop.call_soon_threadsafe(self.connected.set)
+        if self.extra_on_connect:
+            self.extra_on_connect(client, userdata, flags, rc)
+        if self.availability_topic:
+            client.publish(self.availability_topic, payload="online", qos=self.qos, retain=self.retain_availability)
+
+    def on_disconnect(self, client, userdata, rc):
+        self.loop.call_soon_threadsafe(self.connected.clear)
+
+    def on_publish(self, client, userdata, mid):
+        self.loop.call_soon_threadsafe(self.acked, mid, time.monotonic())
+
+    # -- event loop ---------------------------------------------------------
+
+    def acked(self, mid, acked_time):
+        # Discovery and availability messages are acked too; nothing awaits those
+        future = self.acks.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(acked_time)
+
+    def start(self):
+        self.connection.start()
+
+    def offer(self, ready_time, reading):
+        payload = self.serializer(reading, self.config)
+        if payload is None:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((ready_time, payload))
+
+    async def publish_loop(self):
+        while True:
+            ready_time, payload = await self.queue.get()
+            await self.connected.wait()
+
+            info = self.connection.publish(self.topic, payload, qos=self.qos, retain=self.retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                print(f"{self.label} publish failed. MQTT result code: {info.rc}", flush=True)
+                continue
+
+            # on_publish is handed to the loop, so the ack cannot be seen before the future is registered
+            future = self.loop.create_future()
+            self.acks[info.mid] = future
+            try:
+                acked_time = await asyncio.wait_for(future, ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.acks.pop(info.mid, None)
+                self.timeouts += 1
+                print(f"{self.label} did not acknowledge within {ACK_TIMEOUT} s", flush=True)
+                continue
+
+            self.histogram.add((acked_time - ready_time) * 1000)
+
+    def report(self):
+        print(
+            f"{self.label:<8} READY->PUBACK {self.histogram.summary_line()}"
+            f"  dropped {self.dropped}  timeouts {self.timeouts}",
+            flush=True,
+        )
+
+    def stop(self):
+        if self.availability_topic and self.connection.is_connected:
+            info = self.connection.publish(self.availability_topic, payload="offline", qos=self.qos, retain=self.retain_availability)
+            info.wait_for_publish(1.0)
+        # The event loop is about to close; late acks have nowhere to go
+        self.connection.client.on_publish = None
+        self.connection.stop()
+
+
+# ---------------------------------------------------------------------------
+# Sampling
+# ---------------------------------------------------------------------------
+
+def watch_ready_edges(loop, gpio, maxsize=16):
+    """
+    asyncio.Queue of monotonic READY falling edge times, fed from the GPIO
+    library's callback thread.
+    """
+
+    edges = asyncio.Queue(maxsize)
+
+    def put_edge(edge_time):
+        if not edges.full():
+            edges.put_nowait(edge_time)
+
+    gpio.add_event_callback(READY_pin, lambda channel: loop.call_soon_threadsafe(put_edge, time.monotonic()))
+    return edges
+
+
+def read_values(i2c_bus, capture):
+    values = ms430.read_sensor_values(i2c_bus)
+    if capture:
+        capture.flush()
+    return values
+
+
+async def sample_loop(i2c_bus, edges, brokers, sinks, executor, capture):
+    loop = asyncio.get_running_loop()
+    ready_timeout = 2 * CYCLE_PERIOD_SECONDS[ms430.CYCLE_PERIOD] + 1
+    last_publish = 0.0
+
+    while True:
+        try:
+            ready_time = await asyncio.wait_for(edges.get(), ready_timeout)
+        except asyncio.TimeoutError:
+            print(f"No data from the MS430 for {ready_timeout} seconds, still waiting...", flush=True)
+            continue
+
+        # Device keeps cycling for calibration; only publish every PUBLISH_PERIOD
+        if ready_time - last_publish < ms430.PUBLISH_PERIOD:
+            continue
+        last_publish = ready_time
+
+        try:
+            values = await loop.run_in_executor(executor, read_values, i2c_bus, capture)
+        except Exception as exc:
+            print(f"Error reading the MS430: {exc}", flush=True)
+            continue
+
+        reading = ms430.build_reading(values)
+        if reading is None:
+            continue
+
+        for broker in brokers:
+            broker.offer(ready_time, reading)
+        sinks.publish(reading)
+
+
+async def stats_loop(brokers, sinks):
+    while True:
+        await asyncio.sleep(STATS_PERIOD)
+        for broker in brokers:
+            broker.report()
+        sinks.report()
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+async def run():
+    loop = asyncio.get_running_loop()
+
+    # Connect while the MS430 is set up; the connections reconnect in the background
+    ha_discovery = ms430.HADiscovery(ms430.HA_DISCOVERY_HASH_FILE)
+    on_connect = ms430.on_connect_callbacks(ha_discovery)
+    broker_configs, other_configs = sink_configs()
+    brokers = [AsyncBroker(loop, config, on_connect) for config in broker_configs]
+    sinks = SinkSet(other_configs, ms430.SERIALIZERS, on_connect)
+    for broker in brokers:
+        broker.start()
+    sinks.start()
+
+    print("Setting up MS430 hardware...", flush=True)
+    gpio, i2c_bus = SensorHardwareSetup()
+    i2c_bus.write_i2c_block_data(i2c_7bit_address, PARTICLE_SENSOR_SELECT_REG, [ms430.PARTICLE_SENSOR])
+    i2c_bus.write_i2c_block_data(i2c_7bit_address, CYCLE_TIME_PERIOD_REG, [ms430.CYCLE_PERIOD])
+
+    capture = None
+    if ms430.RAW_CAPTURE_FILE:
+        capture = RawCaptureWriter(ms430.RAW_CAPTURE_FILE)
+        setRawCapture(capture, ms430.PARTICLE_SENSOR)
+        print(f"Recording raw sensor data to {ms430.RAW_CAPTURE_FILE}", flush=True)
+
+    print("Entering cycle mode. Press Ctrl+C to exit.", flush=True)
+    i2c_bus.write_byte(i2c_7bit_address, CYCLE_MODE_CMD)
+    edges = watch_ready_edges(loop, gpio)
+
+    # One thread for the I2C bus
+    i2c_executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="i2c")
+
+    tasks = [loop.create_task(sample_loop(i2c_bus, edges, brokers, sinks, i2c_executor, capture))]
+    tasks.append(loop.create_task(stats_loop(brokers, sinks)))
+    for broker in brokers:
+        tasks.append(loop.create_task(broker.publish_loop()))
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await stopping.wait()
+
+    print("Stopping.", flush=True)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    for broker in brokers:
+        broker.stop()
+        broker.report()
+    sinks.stop()
+    sinks.report()
+
+    i2c_executor.shutdown(wait=False)
+    gpio.cleanup()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MS430 snapshot read benchmark.
+
+Compares the time to read a full data snapshot from a simulated MS430 (see
+fake_hardware.py) with:
+
+- four calls: get_air_data(), get_air_quality_data(), get_light_data() and
+  get_sound_data(), one I2C transaction each
+- read_all(): the same four block reads back-to-back under the bus lock,
+  as one consistent snapshot
+
+Both are four transactions; read_all() buys consistency, not speed.
+
+Usage: python3 ms430-benchmark.py [snapshots]
+"""
+
+import sys
+import time
+
+import new_sensor_functions as ms430
+from fake_hardware import FakeMS430Bus
+
+
+def four_calls(i2c_bus):
+    ms430.get_air_data(i2c_bus)
+    ms430.get_air_quality_data(i2c_bus)
+    ms430.get_light_data(i2c_bus)
+    ms430.get_sound_data(i2c_bus)
+
+
+def report(label, i2c_bus, elapsed, snapshots):
+    print(
+        f"{label:<12} {i2c_bus.transactions / snapshots:>4.1f} transactions"
+        f"  {i2c_bus.bytes_transferred / snapshots:>5.1f} bytes"
+        f"  {elapsed * 1000 / snapshots:>6.3f} ms/snapshot",
+        flush=True,
+    )
+
+
+def main():
+    snapshots = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"MS430 snapshot benchmark, {snapshots} snapshots per path", flush=True)
+
+    i2c_bus = FakeMS430Bus(ms430.i2c_7bit_address, simulate_timing=True)
+    start = time.perf_counter()
+    for _ in range(snapshots):
+        four_calls(i2c_bus)
+    report("four calls", i2c_bus, time.perf_counter() - start, snapshots)
+
+    i2c_bus = FakeMS430Bus(ms430.i2c_7bit_address, simulate_timing=True)
+    start = time.perf_counter()
+    for _ in range(snapshots):
+        ms430.read_all(i2c_bus)
+    report("read_all", i2c_bus, time.perf_counter() - start, snapshots)
+
+
+if __name__ == "__main__":
+    main()
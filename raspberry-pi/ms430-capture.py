@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from new_sensor_functions import *
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from line_protocol import LINE_FORMAT_COMPAT, LINE_FORMAT_MULTI_FIELD, build_payload, timestamp_ns
 import time
 import datetime
 import signal
 import sys
+from sensor_schema import ms430_schema
 
 #########################################################
 # USER-EDITABLE SETTINGS
@@ -31,9 +33,20 @@ zone = "upstairs"               # Update accordingly
 # How often to read sensors and publish to MQTT (seconds). Independent of cycle_period.
 period = 60
 
+# All values are sent in one MQTT publish per cycle. LINE_FORMAT_COMPAT keeps the
+# old "temperature,room=..,floor=.. value=.." measurements (one line each);
+# LINE_FORMAT_MULTI_FIELD sends a single "ms430,room=..,floor=.. temperature=..,..." line.
+line_format = LINE_FORMAT_COMPAT
+measurement = "ms430"
+
 # END OF USER-EDITABLE SETTINGS
 #########################################################
 
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background.
+# It is started first so it comes up while the MS430 resets.
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+
 # Set up the GPIO and I2C communications bus
 (GPIO, I2C_bus) = SensorHardwareSetup()
 
@@ -48,6 +61,9 @@ SDS011_CONC_SYMBOL = "\u00B5g/m\u00B3" # micrograms per cubic meter
 SUBSCRIPT_2 = "\u2082"
 OHM_SYMBOL = "\u03A9"
 
+# Line protocol field names for each value
+MS430 = ms430_schema()
+
 #########################################################
 
 print("Entering cycle mode and waiting for data. Press ctrl-c to exit.")
@@ -57,52 +73,34 @@ I2C_bus.write_byte(i2c_7bit_address, CYCLE_MODE_CMD)
 def cleanup_and_exit(signum=None, frame=None):
     print("Stopping.")
     sys.stdout.flush()
-    try:
-        client.loop_stop()
-        client.disconnect()
-    except Exception:
-        pass
+    connection.stop()
     try:
         GPIO.cleanup()
     except Exception:
         pass
     sys.exit(0)
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
-
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+# Wait for the connection started before the hardware setup
+connection.wait_connected()
+client = connection.client
 
 signal.signal(signal.SIGTERM, cleanup_and_exit)
 signal.signal(signal.SIGINT, cleanup_and_exit)
 
 last_publish = 0.0
 
+# Block on READY falling edges instead of polling for them. Stop waiting 
+# after two missed cycles so a stalled sensor shows up in the log.
+ready = ReadyMonitor(GPIO)
+ready_timeout = 2 * CYCLE_PERIOD_SECONDS[cycle_period] + 1
+
 while (True):
   try:
     # Wait for the next new data release, indicated by a falling edge on READY
-    while (not GPIO.event_detected(READY_pin)):
-      sleep(0.05)
+    if (ready.wait(ready_timeout) is None):
+      print("No data from the MS430 for " + str(ready_timeout) + " seconds, still waiting...")
+      sys.stdout.flush()
+      continue
 
     # Device keeps cycling for calibration; only read and publish every `period` seconds
     now_mono = time.monotonic()
@@ -112,41 +110,31 @@ while (True):
     last_publish = now_mono
     now = datetime.datetime.now()
 
-    # Temperature and humidity data
-    air_data = get_air_data(I2C_bus)
+    # Read all the data categories in one go
+    snapshot = read_all(I2C_bus)
+    air_data = snapshot['air']
+    air_quality_data = snapshot['air_quality']
+    light_data = snapshot['light']
+    sound_data = snapshot['sound']
 
-    # Get air quality data
-    air_quality_data = get_air_quality_data(I2C_bus)
+    timestamp = timestamp_ns()
 
-    # Get light data
-    light_data = get_light_data(I2C_bus)
-
-    # Get sound data
-    sound_data = get_sound_data(I2C_bus)
-
-    # Send data to MQTT
     print("Temperature = {:.1f} ".format(air_data['T_C']) + air_data['C_unit'])
-    client.publish("sensors", "temperature,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.1f}".format(air_data['T']))
     print("Humidity = {:.1f} %".format(air_data['H_pc']))
-    client.publish("sensors", "humidity,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.1f}".format(air_data['H_pc']))
     print("Pressure = " + str(air_data['P_Pa']/100) + " hPa")
-    client.publish("sensors", "pressure,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(air_data['P_Pa']/100))
     print("Lux = {:.2f} lux".format(light_data['illum_lux']))
-    client.publish("sensors", "lux,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.2f}".format(light_data['illum_lux']))
     print("Air quality index = {:.1f}".format(air_quality_data['AQI']))
-    client.publish("sensors", "airquality,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.1f}".format(air_quality_data['AQI']))
     print("Air quality accuracy = " + str(air_quality_data['AQI_accuracy']) + "/3")
-    client.publish("sensors", "airquality-accuracy,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(air_quality_data['AQI_accuracy']))
     print("Breath VOC = {:.2f} ppm".format(air_quality_data['bVOC']))
-    client.publish("sensors", "bvoc,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.2f}".format(air_quality_data['bVOC']))
     print("Estimated CO" + SUBSCRIPT_2 + " = {:.1f} ppm".format(air_quality_data['CO2e']))
-    client.publish("sensors", "co2,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.1f}".format(air_quality_data['CO2e']))
     print("Gas sensor resistance = " + str(air_data['G_ohm']) + " " + OHM_SYMBOL)
-    client.publish("sensors", "gas-resistance,room=" + str(room) + ",floor=" + str(zone) + " value=" + str(air_data['G_ohm']))
     print("Peak amplitude = {:.2f} mPa".format(sound_data['peak_amp_mPa']))
-    client.publish("sensors", "sound-peak-amp,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.2f}".format(sound_data['peak_amp_mPa']))
     print("A-weighted sound pressure = {:.1f} dBA".format(sound_data['SPL_dBA']))
-    client.publish("sensors", "sound-decibels,room=" + str(room) + ",floor=" + str(zone) + " value=" + "{:.1f}".format(sound_data['SPL_dBA']))
+
+    # Send data to MQTT - the old measurement names, all in one publish, at the sensor's full resolution
+    fields = MS430.line_fields(MS430.extract(snapshot, rounded=False))
+    tags = {"room": room, "floor": zone}
+    client.publish("sensors", build_payload(line_format, measurement, tags, fields, timestamp))
     print("Data sent to MQTT broker " + str(brokerAddress) + " at " + (now.strftime("%H:%M:%S on %d/%m/%Y")))
 
     if (particleSensor != PARTICLE_SENSOR_OFF):
@@ -10,529 +10,60 @@ Publishes:
 3. Home Assistant MQTT Discovery config to Home Assistant MQTT broker.
 4. Home Assistant availability status to Home Assistant MQTT broker.
 
-This version hard-codes MQTT settings for local-only use.
-Do not commit this version to GitHub with credentials included.
+Or, with SINKS_CONFIG, to any list of brokers and files (see sinks.py).
+
+The settings are in ms430_publisher.py, shared with ms430-async-mqtt.py.
 """
 
-import json
 import signal
 import sys
 import time
-import datetime as dt
-
-import paho.mqtt.client as mqtt
 
 from new_sensor_functions import *
+from aggregation import WindowAggregator
+from deadband import DeadbandFilter
+from ms430_publisher import *
+from raw_capture import RawCaptureWriter
+from sinks import SinkSet, load_sink_configs
 
 
 # ---------------------------------------------------------------------------
-# Sensor settings
-# ---------------------------------------------------------------------------
-
-# MS430 measurement cycle (every 3, 100, or 300 seconds). Use 3s for air-quality calibration.
-CYCLE_PERIOD = CYCLE_PERIOD_3_S
-PARTICLE_SENSOR = PARTICLE_SENSOR_OFF
-
-
-# ---------------------------------------------------------------------------
-# NAS / legacy MQTT broker settings
-# ---------------------------------------------------------------------------
-
-NAS_MQTT_HOST = "REPLACE_ME"
-NAS_MQTT_PORT = 1883
-NAS_MQTT_USERNAME = None
-NAS_MQTT_PASSWORD = None
-
-LEGACY_MQTT_TOPIC = "homedev"
-PUBLISH_LEGACY_PAYLOAD = True
-
-RETAIN_LEGACY_STATE = False
-
-
-# ---------------------------------------------------------------------------
-# Home Assistant MQTT broker settings
+# Publishing
 # ---------------------------------------------------------------------------
 
-HA_MQTT_HOST = "REPLACE_ME"
-HA_MQTT_PORT = 1883
-HA_MQTT_USERNAME = "REPLACE_ME"
-HA_MQTT_PASSWORD = "REPLACE_ME"
-
-PUBLISH_HA_PAYLOAD = True
-
-LOCATION_ZONE = "upstairs"
-LOCATION_ROOM = "office"
-SENSOR_NAME = "ms430"
-
-DEVICE_ID = f"{SENSOR_NAME}_{LOCATION_ROOM}".lower().replace(" ", "_")
-DEVICE_NAME = f"MS430 {LOCATION_ROOM.title()}"
-
-HA_BASE_TOPIC = f"home/{LOCATION_ZONE}/{LOCATION_ROOM}/{SENSOR_NAME}"
-HA_STATE_TOPIC = f"{HA_BASE_TOPIC}/state"
-HA_AVAILABILITY_TOPIC = f"{HA_BASE_TOPIC}/status"
-
-DISCOVERY_PREFIX = "homeassistant"
-
-RETAIN_DISCOVERY = True
-RETAIN_HA_STATE = False
-RETAIN_AVAILABILITY = True
-
-
-# ---------------------------------------------------------------------------
-# General publish settings
-# ---------------------------------------------------------------------------
-
-MQTT_QOS = 1
-# How often to read sensors and publish to MQTT (seconds). Independent of CYCLE_PERIOD.
-PUBLISH_PERIOD = 60
-EXPIRE_AFTER = PUBLISH_PERIOD * 3
-
-
-# ---------------------------------------------------------------------------
-# Helper functions
-# ---------------------------------------------------------------------------
-
-def safe_round(value, digits=2):
-    if value is None:
-        return None
-
-    try:
-        return round(float(value), digits)
-    except (TypeError, ValueError):
-        return None
-
-
-def now_iso():
-    return dt.datetime.now().astimezone().isoformat(timespec="seconds")
-
-
-def now_display():
-    return dt.datetime.now().strftime("%H:%M:%S on %d/%m/%Y")
-
-
-def build_payloads(i2c_bus):
+def publish_values(
+    sinks,
+    values,
+    ha_extras=None,
+    legacy_extras=None,
+    legacy_fields=None,
+):
     """
-    Read the sensor once, then build both payload formats:
-    - legacy nested JSON for NAS / InfluxDB / Grafana (field names must match ms430-json-mqtt.py)
-    - flat JSON for Home Assistant (descriptive field names)
+    Queue values for every sink, with any extra summary fields for the HA
+    and legacy payloads. legacy_fields limits the legacy payload to those
+    (HA named) fields and their summary fields; None sends them all.
+    Returns False if the values were incomplete.
     """
 
-    air_data = get_air_data(i2c_bus)
-    air_quality_data = get_air_quality_data(i2c_bus)
-    light_data = get_light_data(i2c_bus)
-    sound_data = get_sound_data(i2c_bus)
-
-    temperature = safe_round(air_data.get("T"), 2)
-    humidity = safe_round(air_data.get("H_pc"), 2)
-
-    pressure = None
-    if air_data.get("P_Pa") is not None:
-        pressure = safe_round(air_data.get("P_Pa") / 100, 2)
-
-    illuminance = safe_round(light_data.get("illum_lux"), 2)
-
-    aqi_accuracy_code = air_quality_data.get("AQI_accuracy")
-    if aqi_accuracy_code is not None:
-        aqi_accuracy_code = int(aqi_accuracy_code)
-
-    raw_aqi = air_quality_data.get("AQI")
-    air_quality_index = safe_round(raw_aqi, 0)
-    air_quality_accuracy = safe_round(aqi_accuracy_code, 0)
-    air_quality_valid = aqi_accuracy_code is not None and aqi_accuracy_code > 0
-    air_quality_accuracy_label = (
-        interpret_AQI_accuracy(aqi_accuracy_code)
-        if aqi_accuracy_code is not None
-        else None
-    )
-    if air_quality_valid and raw_aqi is not None:
-        air_quality_label = interpret_AQI_value(float(raw_aqi))
-    else:
-        air_quality_label = None
-
-    breath_voc = safe_round(air_quality_data.get("bVOC"), 3)
-    estimated_co2 = safe_round(air_quality_data.get("CO2e"), 0)
-    gas_resistance = safe_round(air_data.get("G_ohm"), 0)
-    peak_amplitude = safe_round(sound_data.get("peak_amp_mPa"), 2)
-    sound_pressure = safe_round(sound_data.get("SPL_dBA"), 2)
-
-    last_update = now_iso()
-
-    # Field names must match ms430-json-mqtt.py so existing Grafana/InfluxDB queries keep working.
-    legacy_payload = {
-        LOCATION_ZONE: {
-            LOCATION_ROOM: {
-                SENSOR_NAME: {
-                    "temperature": temperature,
-                    "humidity": humidity,
-                    "pressure": pressure,
-                    "lux": illuminance,
-                    "airquality": air_quality_index,
-                    "airqual_accuracy": air_quality_accuracy,
-                    "breath_voc": breath_voc,
-                    "est_co2": estimated_co2,
-                    "gas_resistance": gas_resistance,
-                    "peak_amplitude": peak_amplitude,
-                    "dba": sound_pressure,
-                }
-            }
-        }
-    }
-
-    ha_payload = {
-        "temperature": temperature,
-        "humidity": humidity,
-        "pressure": pressure,
-        "illuminance": illuminance,
-        "air_quality_index": air_quality_index,
-        "air_quality_accuracy": air_quality_accuracy,
-        "air_quality_accuracy_label": air_quality_accuracy_label,
-        "air_quality_label": air_quality_label,
-        "air_quality_valid": air_quality_valid,
-        "breath_voc": breath_voc,
-        "estimated_co2": estimated_co2,
-        "gas_resistance": gas_resistance,
-        "peak_amplitude": peak_amplitude,
-        "sound_pressure": sound_pressure,
-        "last_update": last_update,
-    }
-
-    return legacy_payload, ha_payload
-
-
-def payload_has_required_values(payload):
-    required_keys = [
-        "temperature",
-        "humidity",
-        "pressure",
-        "illuminance",
-        "air_quality_index",
-        "air_quality_accuracy",
-        "air_quality_accuracy_label",
-        "air_quality_valid",
-        "breath_voc",
-        "estimated_co2",
-        "gas_resistance",
-        "peak_amplitude",
-        "sound_pressure",
-    ]
-
-    return all(payload.get(key) is not None for key in required_keys)
-
-
-# ---------------------------------------------------------------------------
-# MQTT callbacks
-# ---------------------------------------------------------------------------
-
-def on_nas_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print(f"Connected to NAS MQTT broker at {NAS_MQTT_HOST}:{NAS_MQTT_PORT}", flush=True)
-    else:
-        print(f"NAS MQTT connection failed. Result code: {rc}", flush=True)
-
-
-def on_nas_disconnect(client, userdata, rc):
-    if rc != 0:
-        print("NAS MQTT disconnected unexpectedly.", flush=True)
-
-
-def on_ha_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print(f"Connected to HA MQTT broker at {HA_MQTT_HOST}:{HA_MQTT_PORT}", flush=True)
-
-        if PUBLISH_HA_PAYLOAD:
-            publish_ha_discovery(client)
-
-            client.publish(
-                HA_AVAILABILITY_TOPIC,
-                payload="online",
-                qos=MQTT_QOS,
-                retain=RETAIN_AVAILABILITY,
-            )
-
-            print(f"Published HA availability: {HA_AVAILABILITY_TOPIC}", flush=True)
-    else:
-        print(f"HA MQTT connection failed. Result code: {rc}", flush=True)
-
-
-def on_ha_disconnect(client, userdata, rc):
-    if rc != 0:
-        print("HA MQTT disconnected unexpectedly.", flush=True)
-
-
-def connect_mqtt_client(client, host, port, label):
-    """
-    Connect one MQTT client.
-    If connection fails, log it and continue.
-    """
-
-    try:
-        client.connect(host, port, keepalive=60)
-        client.loop_start()
-        return True
-    except Exception as exc:
-        print(f"Could not connect to {label} MQTT broker at {host}:{port}: {exc}", flush=True)
-        return False
-
-
-def safe_publish(client, topic, payload, label, retain=False):
-    """
-    Publish without letting one failed broker kill the whole script.
-    """
-
-    try:
-        result = client.publish(
-            topic,
-            payload=payload,
-            qos=MQTT_QOS,
-            retain=retain,
-        )
-
-        if result.rc != mqtt.MQTT_ERR_SUCCESS:
-            print(f"{label} publish failed for topic {topic}. MQTT result code: {result.rc}", flush=True)
-            return False
-
-        return True
-
-    except Exception as exc:
-        print(f"{label} publish error for topic {topic}: {exc}", flush=True)
+    reading = build_reading(values, ha_extras, legacy_extras, legacy_fields)
+    if reading is None:
         return False
 
-
-# ---------------------------------------------------------------------------
-# Home Assistant MQTT Discovery
-# ---------------------------------------------------------------------------
-
-def publish_ha_discovery(client):
-    device = {
-        "identifiers": [DEVICE_ID],
-        "name": DEVICE_NAME,
-        "manufacturer": "Raspberry Pi / MS430",
-        "model": "MS430 Environmental Sensor",
-        "suggested_area": LOCATION_ROOM.title(),
-    }
-
-    origin = {
-        "name": "mqtt-home-data",
-        "sw": "1.1",
-        "url": "https://github.com/raspberrycoulis/mqtt-home-data",
-    }
-
-    sensors = [
-        {
-            "key": "temperature",
-            "name": "Temperature",
-            "device_class": "temperature",
-            "state_class": "measurement",
-            "unit": "°C",
-            "icon": None,
-            "precision": 1,
-        },
-        {
-            "key": "humidity",
-            "name": "Humidity",
-            "device_class": "humidity",
-            "state_class": "measurement",
-            "unit": "%",
-            "icon": None,
-            "precision": 1,
-        },
-        {
-            "key": "pressure",
-            "name": "Pressure",
-            "device_class": "pressure",
-            "state_class": "measurement",
-            "unit": "hPa",
-            "icon": None,
-            "precision": 1,
-        },
-        {
-            "key": "illuminance",
-            "name": "Illuminance",
-            "device_class": "illuminance",
-            "state_class": "measurement",
-            "unit": "lx",
-            "icon": None,
-            "precision": 0,
-        },
-        {
-            "key": "air_quality_index",
-            "name": "Air Quality Index",
-            "device_class": None,
-            "state_class": "measurement",
-            "unit": None,
-            "icon": "mdi:air-filter",
-            "precision": 0,
-        },
-        {
-            "key": "air_quality_accuracy",
-            "name": "Air Quality Accuracy",
-            "device_class": None,
-            "state_class": "measurement",
-            "unit": None,
-            "icon": "mdi:check-decagram-outline",
-            "precision": 0,
-        },
-        {
-            "key": "air_quality_accuracy_label",
-            "name": "Air Quality Accuracy Status",
-            "device_class": None,
-            "state_class": None,
-            "unit": None,
-            "icon": "mdi:information-outline",
-            "precision": None,
-        },
-        {
-            "key": "air_quality_label",
-            "name": "Air Quality Rating",
-            "device_class": None,
-            "state_class": None,
-            "unit": None,
-            "icon": "mdi:air-filter",
-            "precision": None,
-        },
-        {
-            "key": "air_quality_valid",
-            "name": "Air Quality Valid",
-            "component": "binary_sensor",
-            "device_class": None,
-            "state_class": None,
-            "unit": None,
-            "icon": "mdi:check-circle-outline",
-            "precision": None,
-            "value_template": "{% if value_json.air_quality_valid %}on{% else %}off{% endif %}",
-            "payload_on": "on",
-            "payload_off": "off",
-        },
-        {
-            "key": "breath_voc",
-            "name": "Breath VOC",
-            "device_class": "volatile_organic_compounds_parts",
-            "state_class": "measurement",
-            "unit": "ppm",
-            "icon": None,
-            "precision": 2,
-        },
-        {
-            "key": "estimated_co2",
-            "name": "Estimated CO2",
-            "device_class": "carbon_dioxide",
-            "state_class": "measurement",
-            "unit": "ppm",
-            "icon": None,
-            "precision": 0,
-        },
-        {
-            "key": "gas_resistance",
-            "name": "Gas Resistance",
-            "device_class": None,
-            "state_class": "measurement",
-            "unit": "Ω",
-            "icon": "mdi:resistor",
-            "precision": 0,
-        },
-        {
-            "key": "peak_amplitude",
-            "name": "Peak Amplitude",
-            "device_class": None,
-            "state_class": "measurement",
-            "unit": "mPa",
-            "icon": "mdi:waveform",
-            "precision": 2,
-        },
-        {
-            "key": "sound_pressure",
-            "name": "Sound Pressure",
-            "device_class": "sound_pressure",
-            "state_class": "measurement",
-            "unit": "dB",
-            "icon": None,
-            "precision": 1,
-        },
-    ]
-
-    for sensor_def in sensors:
-        component = sensor_def.get("component", "sensor")
-        object_id = f"{DEVICE_ID}_{sensor_def['key']}"
-        unique_id = object_id
-        config_topic = f"{DISCOVERY_PREFIX}/{component}/{object_id}/config"
-
-        if "value_template" in sensor_def:
-            value_template = sensor_def["value_template"]
-        else:
-            value_template = "{{ value_json['" + sensor_def["key"] + "'] }}"
-
-        payload = {
-            "name": sensor_def["name"],
-            "unique_id": unique_id,
-            "object_id": object_id,
-            "state_topic": HA_STATE_TOPIC,
-            "availability_topic": HA_AVAILABILITY_TOPIC,
-            "payload_available": "online",
-            "payload_not_available": "offline",
-            "value_template": value_template,
-            "device": device,
-            "origin": origin,
-            "expire_after": EXPIRE_AFTER,
-            "qos": MQTT_QOS,
-        }
-
-        if sensor_def.get("precision") is not None:
-            payload["suggested_display_precision"] = sensor_def["precision"]
-
-        if sensor_def["device_class"]:
-            payload["device_class"] = sensor_def["device_class"]
-
-        if sensor_def["state_class"]:
-            payload["state_class"] = sensor_def["state_class"]
-
-        if sensor_def["unit"]:
-            payload["unit_of_measurement"] = sensor_def["unit"]
-
-        if sensor_def["icon"]:
-            payload["icon"] = sensor_def["icon"]
-
-        if component == "binary_sensor":
-            payload["payload_on"] = sensor_def["payload_on"]
-            payload["payload_off"] = sensor_def["payload_off"]
-
-        safe_publish(
-            client=client,
-            topic=config_topic,
-            payload=json.dumps(payload),
-            label="HA discovery",
-            retain=RETAIN_DISCOVERY,
-        )
-
-        print(f"Published HA discovery config: {config_topic}", flush=True)
+    sinks.publish(reading)
+    return True
 
 
 # ---------------------------------------------------------------------------
 # Shutdown handling
 # ---------------------------------------------------------------------------
 
-def cleanup_and_exit(nas_client=None, ha_client=None, gpio=None):
+def cleanup_and_exit(sinks=None, gpio=None):
     print("Stopping.", flush=True)
 
-    if ha_client and PUBLISH_HA_PAYLOAD:
-        print("Publishing HA offline status.", flush=True)
-
-        safe_publish(
-            client=ha_client,
-            topic=HA_AVAILABILITY_TOPIC,
-            payload="offline",
-            label="HA availability",
-            retain=RETAIN_AVAILABILITY,
-        )
-
-        time.sleep(0.5)
-
-    for client in [nas_client, ha_client]:
-        if client:
-            try:
-                client.loop_stop()
-                client.disconnect()
-            except Exception:
-                pass
+    if sinks:
+        # Sends what is still queued, then HA offline availability
+        sinks.stop()
+        sinks.report()
 
     try:
         if gpio:
@@ -548,6 +79,12 @@ def cleanup_and_exit(nas_client=None, ha_client=None, gpio=None):
 # ---------------------------------------------------------------------------
 
 def main():
+    # One long-lived connection and worker per sink; brokers reconnect in the background
+    ha_discovery = HADiscovery(HA_DISCOVERY_HASH_FILE)
+    sink_configs = load_sink_configs(SINKS_CONFIG) if SINKS_CONFIG else default_sink_configs()
+    sinks = SinkSet(sink_configs, SERIALIZERS, on_connect_callbacks(ha_discovery), client_prefix=f"{DEVICE_ID}_")
+    sinks.start()
+
     print("Setting up MS430 hardware...", flush=True)
 
     gpio, i2c_bus = SensorHardwareSetup()
@@ -564,106 +101,89 @@ def main():
         [CYCLE_PERIOD],
     )
 
+    capture = None
+    if RAW_CAPTURE_FILE:
+        capture = RawCaptureWriter(RAW_CAPTURE_FILE)
+        setRawCapture(capture, PARTICLE_SENSOR)
+        print(f"Recording raw sensor data to {RAW_CAPTURE_FILE}", flush=True)
+
     print("Entering cycle mode. Press Ctrl+C to exit.", flush=True)
     i2c_bus.write_byte(i2c_7bit_address, CYCLE_MODE_CMD)
 
-    nas_client = None
-    ha_client = None
-
-    if PUBLISH_LEGACY_PAYLOAD:
-        nas_client = mqtt.Client(client_id=f"{DEVICE_ID}_nas")
-        nas_client.on_connect = on_nas_connect
-        nas_client.on_disconnect = on_nas_disconnect
-
-        if NAS_MQTT_USERNAME and NAS_MQTT_PASSWORD:
-            nas_client.username_pw_set(NAS_MQTT_USERNAME, NAS_MQTT_PASSWORD)
-
-        connect_mqtt_client(
-            client=nas_client,
-            host=NAS_MQTT_HOST,
-            port=NAS_MQTT_PORT,
-            label="NAS",
-        )
-
-    if PUBLISH_HA_PAYLOAD:
-        ha_client = mqtt.Client(client_id=f"{DEVICE_ID}_ha")
-        ha_client.on_connect = on_ha_connect
-        ha_client.on_disconnect = on_ha_disconnect
-
-        ha_client.username_pw_set(HA_MQTT_USERNAME, HA_MQTT_PASSWORD)
-
-        ha_client.will_set(
-            HA_AVAILABILITY_TOPIC,
-            payload="offline",
-            qos=MQTT_QOS,
-            retain=RETAIN_AVAILABILITY,
-        )
-
-        connect_mqtt_client(
-            client=ha_client,
-            host=HA_MQTT_HOST,
-            port=HA_MQTT_PORT,
-            label="HA",
-        )
+    # Started before the hardware setup, so the brokers connect while the MS430 resets
+    sinks.wait_connected()
 
     signal.signal(
         signal.SIGTERM,
-        lambda signum, frame: cleanup_and_exit(nas_client, ha_client, gpio),
+        lambda signum, frame: cleanup_and_exit(sinks, gpio),
     )
 
     signal.signal(
         signal.SIGINT,
-        lambda signum, frame: cleanup_and_exit(nas_client, ha_client, gpio),
+        lambda signum, frame: cleanup_and_exit(sinks, gpio),
     )
 
     last_publish = 0.0
+    last_stats = time.monotonic()
+    deadband = DeadbandFilter(DEADBANDS, HEARTBEAT_PERIOD)
+    aggregator = WindowAggregator(keys=AGGREGATE_FIELDS, percentiles=AGGREGATE_PERCENTILES)
+
+    # Block on READY falling edges instead of polling for them. Stop waiting
+    # after two missed cycles so a stalled sensor shows up in the log.
+    ready = ReadyMonitor(gpio)
+    ready_timeout = 2 * CYCLE_PERIOD_SECONDS[CYCLE_PERIOD] + 1
 
     while True:
         try:
-            while not gpio.event_detected(READY_pin):
-                time.sleep(0.05)
+            if ready.wait(ready_timeout) is None:
+                print(f"No data from the MS430 for {ready_timeout} seconds, still waiting...", flush=True)
+                continue
 
-            # Device keeps cycling for calibration; only read and publish every PUBLISH_PERIOD seconds
+            # Device keeps cycling for calibration; only publish every PUBLISH_PERIOD
+            # seconds, unless "on-change" sees a big enough change
             now_mono = time.monotonic()
-            if now_mono - last_publish < PUBLISH_PERIOD:
+            publish_due = now_mono - last_publish >= PUBLISH_PERIOD
+
+            if SAMPLING_POLICY == SAMPLING_PUBLISH_ONLY and not publish_due:
                 continue
 
-            last_publish = now_mono
+            values = read_sensor_values(i2c_bus)
+            ha_extras = legacy_extras = None
 
-            legacy_payload, ha_payload = build_payloads(i2c_bus)
+            if capture:
+                capture.flush()
 
-            if not payload_has_required_values(ha_payload):
-                print(f"Skipping publish because payload has missing values: {ha_payload}", flush=True)
-                continue
+            if SAMPLING_POLICY == SAMPLING_AGGREGATE:
+                aggregator.add(values)
+                if not publish_due:
+                    continue
+                values, ha_extras, legacy_extras = aggregated_values(aggregator)
+                aggregator.reset()
 
-            if PUBLISH_LEGACY_PAYLOAD and nas_client:
-                legacy_ok = safe_publish(
-                    client=nas_client,
-                    topic=LEGACY_MQTT_TOPIC,
-                    payload=json.dumps(legacy_payload),
-                    label="NAS legacy",
-                    retain=RETAIN_LEGACY_STATE,
-                )
-
-                if legacy_ok:
-                    print(f"Published legacy payload to NAS topic: {LEGACY_MQTT_TOPIC}", flush=True)
-
-            if PUBLISH_HA_PAYLOAD and ha_client:
-                ha_ok = safe_publish(
-                    client=ha_client,
-                    topic=HA_STATE_TOPIC,
-                    payload=json.dumps(ha_payload),
-                    label="HA state",
-                    retain=RETAIN_HA_STATE,
-                )
-
-                if ha_ok:
-                    print(f"Published HA payload to topic: {HA_STATE_TOPIC}", flush=True)
+            elif SAMPLING_POLICY == SAMPLING_ON_CHANGE:
+                if not publish_due and not deadband.changed(values):
+                    continue
+
+            last_publish = now_mono
+
+            legacy_fields = None
+            if REPORT_BY_EXCEPTION:
+                legacy_fields = deadband.due(values)
+                if not legacy_fields:
+                    print("No field moved beyond its deadband, skipping publish", flush=True)
+                    continue
+
+            if publish_values(sinks, values, ha_extras, legacy_extras, legacy_fields):
+                deadband.record(values if legacy_fields is None else legacy_fields)
 
             print(f"Publish cycle complete at {now_display()}", flush=True)
 
+            if now_mono - last_stats >= SINK_STATS_PERIOD:
+                sinks.report()
+                last_stats = now_mono
+
         except KeyboardInterrupt:
-            cleanup_and_exit(nas_client, ha_client, gpio)
+            cleanup_and_exit(sinks, gpio)
 
         except Exception as exc:
             print(f"Error during sensor read/publish cycle: {exc}", flush=True)
@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from new_sensor_functions import *
-import paho.mqtt.client as mqtt
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+from local_store import LocalStore
 import time
 import datetime
 import json
+import compact_codec
 import signal
 import sys
+from raw_capture import RawCaptureWriter
+from sensor_schema import ms430_schema
 
 #########################################################
 # USER-EDITABLE SETTINGS
@@ -34,9 +39,30 @@ sensor = "ms430"                # Update accordingly
 # How often to read sensors and publish to MQTT (seconds). Independent of cycle_period.
 period = 60
 
+# Optionally keep readings on disk while the broker is unreachable and send them once it is back -
+# i.e. "/home/pi/mqtt-buffer". Payloads then also carry a top-level "timestamp" (Unix time of the
+# reading) so Telegraf can store late ones at the right time (json_time_key = "timestamp").
+offline_buffer_dir = None
+
+# "cbor" publishes compact CBOR payloads on <channel>/cbor instead of JSON, for nodes on weak Wi-Fi.
+# Run cbor-bridge.py next to the broker to republish them as the usual JSON on channel.
+payload_encoding = "json"
+
+# Optionally keep every reading in an SQLite file on the Pi, rolled up per minute and per hour, for local
+# history while the NAS is down - i.e. "/home/pi/readings.db" (see local_store.py)
+local_store_file = None
+
+# Optionally record the raw sensor data to a file for raw-replay.py - i.e. "/home/pi/ms430.rawcap"
+raw_capture_file = None
+
 # END OF USER-EDITABLE SETTINGS
 #########################################################
 
+# Connect to the MQTT broker once; the connection is kept open and re-established in the background.
+# It is started first so it comes up while the MS430 resets.
+connection = MQTTConnection(brokerAddress, clientName)
+connection.start()
+
 # Set up the GPIO and I2C communications bus
 (GPIO, I2C_bus) = SensorHardwareSetup()
 
@@ -51,8 +77,17 @@ SDS011_CONC_SYMBOL = "\u00B5g/m\u00B3" # micrograms per cubic meter
 SUBSCRIPT_2 = "\u2082"
 OHM_SYMBOL = "\u03A9"
 
+# Payload field names and which values must be present to publish
+MS430 = ms430_schema()
+
 #########################################################
 
+# Start recording raw data if enabled
+capture = None
+if raw_capture_file:
+  capture = RawCaptureWriter(raw_capture_file)
+  setRawCapture(capture, particleSensor)
+
 print("Entering cycle mode and waiting for data. Press ctrl-c to exit.")
 
 I2C_bus.write_byte(i2c_7bit_address, CYCLE_MODE_CMD)
@@ -60,52 +95,43 @@ I2C_bus.write_byte(i2c_7bit_address, CYCLE_MODE_CMD)
 def cleanup_and_exit(signum=None, frame=None):
     print("Stopping.")
     sys.stdout.flush()
-    try:
-        client.loop_stop()
-        client.disconnect()
-    except Exception:
-        pass
+    publisher.stop()
+    if store:
+        store.close()
+    connection.stop()
     try:
         GPIO.cleanup()
     except Exception:
         pass
     sys.exit(0)
 
-# For MQTT connections
-def on_disconnect(client, userdata, rc):
-    if rc!=0:
-      print("MQTT disconnected. Will auto-reconnect...")
-      sys.stdout.flush()
+# Wait for the connection started before the hardware setup
+connection.wait_connected()
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        client.connected_flag = True
-        print("Connected to MQTT broker as {}.".format(clientName))
-        sys.stdout.flush()
-    else:
-        print("Connection error! Result code: {}".format(rc))
-        sys.stdout.flush()
-
-mqtt.Client.connected_flag = False
-client = mqtt.Client(clientName)
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.loop_start()
-client.connect(brokerAddress)
-while not client.connected_flag:
-    print("Connecting...")
-    time.sleep(1)
+# Readings go through the offline buffer when one is configured
+publisher = BufferedPublisher(connection, offline_buffer_dir)
+publisher.start()
+
+# Local history when a store file is set
+store = LocalStore(local_store_file) if local_store_file else None
 
 signal.signal(signal.SIGTERM, cleanup_and_exit)
 signal.signal(signal.SIGINT, cleanup_and_exit)
 
 last_publish = 0.0
 
+# Block on READY falling edges instead of polling for them. Stop waiting 
+# after two missed cycles so a stalled sensor shows up in the log.
+ready = ReadyMonitor(GPIO)
+ready_timeout = 2 * CYCLE_PERIOD_SECONDS[cycle_period] + 1
+
 while (True):
   try:
     # Wait for the next new data release, indicated by a falling edge on READY
-    while (not GPIO.event_detected(READY_pin)):
-      sleep(0.05)
+    if (ready.wait(ready_timeout) is None):
+      print("No data from the MS430 for " + str(ready_timeout) + " seconds, still waiting...")
+      sys.stdout.flush()
+      continue
 
     # Device keeps cycling for calibration; only read and publish every `period` seconds
     now_mono = time.monotonic()
@@ -114,58 +140,35 @@ while (True):
 
     last_publish = now_mono
 
-    # Temperature and humidity data
-    air_data = get_air_data(I2C_bus)
+    # Read all the data categories, particle data included, in one go
+    snapshot = read_all(I2C_bus, particleSensor)
+    if capture:
+      capture.flush()
 
-    # Get air quality data
-    air_quality_data = get_air_quality_data(I2C_bus)
-
-    # Get light data
-    light_data = get_light_data(I2C_bus)
-
-    # Get sound data
-    sound_data = get_sound_data(I2C_bus)
-
-    # Formatting for JSON
-    temperature_data = air_data['T']
-    humidity_data = air_data['H_pc']
-    pressure_data = air_data['P_Pa']/100
-    lux_data = light_data['illum_lux']
-    aq_index = air_quality_data['AQI']
-    aq_accuracy = air_quality_data['AQI_accuracy']
-    bvoc_data = air_quality_data['bVOC']
-    co2_data = air_quality_data['CO2e']
-    gas_data = air_data['G_ohm']
-    peak_amp_data = sound_data['peak_amp_mPa']
-    dba_data = sound_data['SPL_dBA']
-
-    # Sort the data for JSON - variables set earlier used here
+    # Sort the data for JSON - field names come from the MS430 schema; values are sent at the
+    # sensor's full resolution and with their own types, as they always have been
+    values = MS430.extract(snapshot, rounded=False)
+    if store:
+      store.add(MS430.legacy_fields(values), sensor=sensor)
     raw_mqtt_data = {
         zone : {
             room : {
-                sensor : {
-                    "temperature" : temperature_data,
-                    "humidity" : humidity_data,
-                    "pressure" : pressure_data,
-                    "lux" : lux_data,
-                    "airquality" : aq_index,
-                    "airqual_accuracy" : aq_accuracy,
-                    "breath_voc" : bvoc_data,
-                    "est_co2" : co2_data,
-                    "gas_resistance" : gas_data,
-                    "peak_amplitude" : peak_amp_data,
-                    "dba" : dba_data
-                },
+                sensor : MS430.legacy_fields(values),
             },
         },
     }
-    JSON_mqtt_data = json.dumps(raw_mqtt_data)
+    if offline_buffer_dir:
+        raw_mqtt_data["timestamp"] = round(time.time(), 3)
+    if payload_encoding == "cbor":
+        topic, mqtt_data = channel + "/cbor", compact_codec.encode(raw_mqtt_data)
+    else:
+        topic, mqtt_data = channel, json.dumps(raw_mqtt_data)
     # Now try sending the data to MQTT broker
-    if temperature_data is not None and humidity_data is not None and pressure_data is not None and lux_data is not None and aq_index is not None and aq_accuracy is not None and bvoc_data is not None and co2_data is not None and gas_data is not None and peak_amp_data is not None and dba_data is not None:
+    if MS430.is_complete(values):
           try:
             # Send data to MQTT
             now = datetime.datetime.now()
-            client.publish(channel, JSON_mqtt_data,1,True)
+            publisher.publish(topic, mqtt_data, qos=1, retain=True)
             sys.stdout.flush()
           except Exception:
             # Error
@@ -177,9 +180,7 @@ while (True):
             sys.stdout.flush()
 
     if (particleSensor != PARTICLE_SENSOR_OFF):
-      raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, PARTICLE_DATA_READ, PARTICLE_DATA_BYTES)
-      particle_data = extractParticleData(raw_data, particleSensor)
-      writeParticleData(None, particle_data, print_data_as_columns)
+      writeParticleData(None, snapshot['particle'], print_data_as_columns)
 
     if print_data_as_columns:
       print("")
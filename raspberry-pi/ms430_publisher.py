@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Settings and payloads shared by the MS430 publishers, ms430-dual-mqtt.py
+and ms430-async-mqtt.py: edit the settings here.
+
+Also builds the readings the scripts hand to their sinks (build_reading()),
+the sink serializers and default sink configs, and the Home Assistant
+discovery configs (HADiscovery). Nothing is read from disk or the sensor on
+import; the scripts create the HADiscovery and set up the hardware.
+
+This version hard-codes MQTT settings for local-only use.
+Do not commit this version to GitHub with credentials included.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import datetime as dt
+
+import paho.mqtt.client as mqtt
+
+from new_sensor_functions import CYCLE_PERIOD_3_S, PARTICLE_SENSOR_OFF, read_all
+from json_codec import ObjectTemplate, iso_timestamp
+from line_protocol import LINE_FORMAT_MULTI_FIELD, build_payload, timestamp_ns
+from sensor_schema import ms430_schema
+
+
+# ---------------------------------------------------------------------------
+# Sensor settings
+# ---------------------------------------------------------------------------
+
+# MS430 measurement cycle (every 3, 100, or 300 seconds). Use 3s for air-quality calibration.
+CYCLE_PERIOD = CYCLE_PERIOD_3_S
+PARTICLE_SENSOR = PARTICLE_SENSOR_OFF
+
+# Optionally record the raw MS430 data blocks to a file for raw-replay.py,
+# e.g. "/home/pi/ms430.rawcap". None disables capture.
+RAW_CAPTURE_FILE = None
+
+
+# ---------------------------------------------------------------------------
+# NAS / legacy MQTT broker settings
+# ---------------------------------------------------------------------------
+
+NAS_MQTT_HOST = "REPLACE_ME"
+NAS_MQTT_PORT = 1883
+NAS_MQTT_USERNAME = None
+NAS_MQTT_PASSWORD = None
+
+LEGACY_MQTT_TOPIC = "homedev"
+PUBLISH_LEGACY_PAYLOAD = True
+
+RETAIN_LEGACY_STATE = False
+
+# Optionally keep legacy payloads on disk while the NAS broker is unreachable
+# and send them once it is back, e.g. "/home/pi/ms430-buffer". The legacy
+# payload then also carries a top-level "timestamp" (Unix time of the reading)
+# for Telegraf's json_time_key. HA state is never replayed; HA only wants the
+# current reading.
+OFFLINE_BUFFER_DIR = None
+
+
+# ---------------------------------------------------------------------------
+# Home Assistant MQTT broker settings
+# ---------------------------------------------------------------------------
+
+HA_MQTT_HOST = "REPLACE_ME"
+HA_MQTT_PORT = 1883
+HA_MQTT_USERNAME = "REPLACE_ME"
+HA_MQTT_PASSWORD = "REPLACE_ME"
+
+PUBLISH_HA_PAYLOAD = True
+
+LOCATION_ZONE = "upstairs"
+LOCATION_ROOM = "office"
+SENSOR_NAME = "ms430"
+
+DEVICE_ID = f"{SENSOR_NAME}_{LOCATION_ROOM}".lower().replace(" ", "_")
+DEVICE_NAME = f"MS430 {LOCATION_ROOM.title()}"
+
+HA_BASE_TOPIC = f"home/{LOCATION_ZONE}/{LOCATION_ROOM}/{SENSOR_NAME}"
+HA_STATE_TOPIC = f"{HA_BASE_TOPIC}/state"
+HA_AVAILABILITY_TOPIC = f"{HA_BASE_TOPIC}/status"
+
+DISCOVERY_PREFIX = "homeassistant"
+
+RETAIN_DISCOVERY = True
+
+# HA publishes "online" here when it starts; discovery is then sent again
+HA_STATUS_TOPIC = f"{DISCOVERY_PREFIX}/status"
+
+# Hash of the last discovery configs published, so a restart only resends
+# them if they changed. None resends them once on every start.
+HA_DISCOVERY_HASH_FILE = os.path.expanduser(f"~/.{DEVICE_ID}-ha-discovery")
+RETAIN_HA_STATE = False
+RETAIN_AVAILABILITY = True
+
+
+# ---------------------------------------------------------------------------
+# General publish settings
+# ---------------------------------------------------------------------------
+
+MQTT_QOS = 1
+# How often to read sensors and publish to MQTT (seconds). Independent of CYCLE_PERIOD.
+PUBLISH_PERIOD = 60
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+# Optional JSON file listing where to publish (see sinks.py and
+# sinks.example.json), e.g. "/home/pi/ms430-sinks.json". Serializers:
+# "legacy-json", "ha-json", "line-protocol" and "fields" (for "sqlite"
+# sinks); on_connect: "ha-discovery". None publishes to the NAS and HA
+# brokers configured above.
+SINKS_CONFIG = None
+
+# Optionally also keep every reading in an SQLite file on the Pi, rolled up
+# into 1-minute and 1-hour tables (see local_store.py), e.g.
+# "/home/pi/ms430.db". Used when SINKS_CONFIG is None.
+LOCAL_STORE_FILE = None
+
+# How often to print per-sink queued or sent / dropped counts (seconds)
+SINK_STATS_PERIOD = 60 * 60
+
+
+# ---------------------------------------------------------------------------
+# Sampling policy
+# ---------------------------------------------------------------------------
+
+# What to do on the READY cycles between publishes:
+# - "publish-only": no I2C reads; read once every PUBLISH_PERIOD and publish it
+# - "aggregate":    read every cycle and publish the mean over the period, with
+#                   <field>_min / <field>_max (and any AGGREGATE_PERCENTILES as
+#                   <field>_p50 etc.) added to both payloads
+# - "on-change":    read every cycle and publish straight away when a field moves
+#                   more than its DEADBANDS value since it was last
+#                   sent, otherwise every PUBLISH_PERIOD
+SAMPLING_PUBLISH_ONLY = "publish-only"
+SAMPLING_AGGREGATE = "aggregate"
+SAMPLING_ON_CHANGE = "on-change"
+
+SAMPLING_POLICY = SAMPLING_PUBLISH_ONLY
+
+# Numeric fields averaged in "aggregate" mode, and the decimal places to round to
+AGGREGATE_FIELDS = {
+    "temperature": 2,
+    "humidity": 2,
+    "pressure": 2,
+    "illuminance": 2,
+    "air_quality_index": 0,
+    "breath_voc": 3,
+    "estimated_co2": 0,
+    "gas_resistance": 0,
+    "peak_amplitude": 2,
+    "sound_pressure": 2,
+}
+
+# Streaming percentile estimates added in "aggregate" mode, so short sound
+# spikes show up even though only one point per period is published
+AGGREGATE_PERCENTILES = {
+    "sound_pressure": [0.5, 0.95],
+    "peak_amplitude": [0.95],
+}
+
+# Change in a field that triggers an immediate publish in "on-change" mode, and
+# that a field must move by to be re-sent with REPORT_BY_EXCEPTION
+DEADBANDS = {
+    "temperature": 0.3,
+    "humidity": 2.0,
+    "pressure": 1.0,
+    "illuminance": 50.0,
+    "air_quality_index": 25.0,
+    "estimated_co2": 100.0,
+    "sound_pressure": 10.0,
+}
+
+
+# ---------------------------------------------------------------------------
+# Report by exception
+# ---------------------------------------------------------------------------
+
+# When enabled, a publish is skipped unless some field moved more than its
+# DEADBANDS value (fields without one: any change) since it was last sent, or
+# has not been sent for HEARTBEAT_PERIOD seconds. The legacy payload then only
+# carries those fields; the HA payload is always complete because every HA
+# sensor reads the same state topic.
+REPORT_BY_EXCEPTION = False
+HEARTBEAT_PERIOD = 15 * 60
+
+# HA marks the sensors unavailable if no state arrives for this long, so it
+# must cover the longest gap between publishes
+EXPIRE_AFTER = (HEARTBEAT_PERIOD if REPORT_BY_EXCEPTION else PUBLISH_PERIOD) * 3
+
+
+# ---------------------------------------------------------------------------
+# Helper functions
+# ---------------------------------------------------------------------------
+
+# Every MS430 field's payload names, HA discovery details and validity rules
+# (see sensor_schema.py)
+MS430 = ms430_schema()
+
+
+def now_display():
+    return dt.datetime.now().strftime("%H:%M:%S on %d/%m/%Y")
+
+
+def read_sensor_values(i2c_bus):
+    """
+    Read the sensor once (a single read_all() snapshot) and return the values
+    as a flat dict keyed by the Home Assistant field names. Values are at
+    full precision, as the NAS-bound payloads send them; only the HA payload
+    is formatted at the schema's digits.
+    """
+
+    return MS430.extract(read_all(i2c_bus), rounded=False)
+
+
+# HA field name -> legacy field name, in legacy payload order
+LEGACY_FIELD_NAMES = MS430.legacy_names
+
+# Payload encoders, built once (see json_codec.py). Field names must match
+# ms430-json-mqtt.py so existing Grafana/InfluxDB queries keep working, and
+# like it the legacy payload is at full resolution (digits None)
+LEGACY_JSON = ObjectTemplate(
+    [(key, name, None) for key, name, digits in MS430.fields_named("legacy")],
+    wrap=(LOCATION_ZONE, LOCATION_ROOM, SENSOR_NAME),
+)
+HA_JSON = ObjectTemplate(MS430.fields_named("key"))
+
+
+def aggregated_values(aggregator):
+    """
+    Values for an "aggregate" publish: the window mean of each AGGREGATE_FIELDS
+    field and the latest value of everything else, plus the summary fields
+    (<field>_min, <field>_max, <field>_pNN) named for the HA and legacy payloads.
+    """
+
+    values = dict(aggregator.latest)
+    values.update(aggregator.means(digits=AGGREGATE_FIELDS))
+
+    ha_extras = aggregator.summary_fields(digits=AGGREGATE_FIELDS)
+    legacy_extras = aggregator.summary_fields(digits=AGGREGATE_FIELDS, names=LEGACY_FIELD_NAMES)
+
+    return values, ha_extras, legacy_extras
+
+
+# ---------------------------------------------------------------------------
+# MQTT helpers
+# ---------------------------------------------------------------------------
+
+def safe_publish(client, topic, payload, label, retain=False):
+    """
+    Publish without letting one failed broker kill the whole script.
+    """
+
+    try:
+        result = client.publish(
+            topic,
+            payload=payload,
+            qos=MQTT_QOS,
+            retain=retain,
+        )
+
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            print(f"{label} publish failed for topic {topic}. MQTT result code: {result.rc}", flush=True)
+            return False
+
+        return True
+
+    except Exception as exc:
+        print(f"{label} publish error for topic {topic}: {exc}", flush=True)
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Home Assistant MQTT Discovery
+# ---------------------------------------------------------------------------
+
+def build_ha_discovery_messages():
+    """
+    (config topic, JSON payload) for every HA discovery config.
+    """
+
+    messages = []
+
+    device = {
+        "identifiers": [DEVICE_ID],
+        "name": DEVICE_NAME,
+        "manufacturer": "Raspberry Pi / MS430",
+        "model": "MS430 Environmental Sensor",
+        "suggested_area": LOCATION_ROOM.title(),
+    }
+
+    origin = {
+        "name": "mqtt-home-data",
+        "sw": "1.1",
+        "url": "https://github.com/raspberrycoulis/mqtt-home-data",
+    }
+
+    for key, sensor_def in MS430.discovery_fields():
+        component = sensor_def.get("component", "sensor")
+        object_id = f"{DEVICE_ID}_{key}"
+        unique_id = object_id
+        config_topic = f"{DISCOVERY_PREFIX}/{component}/{object_id}/config"
+
+        if "value_template" in sensor_def:
+            value_template = sensor_def["value_template"]
+        else:
+            value_template = "{{ value_json['" + key + "'] }}"
+
+        payload = {
+            "name": sensor_def["name"],
+            "unique_id": unique_id,
+            "object_id": object_id,
+            "state_topic": HA_STATE_TOPIC,
+            "availability_topic": HA_AVAILABILITY_TOPIC,
+            "payload_available": "online",
+            "payload_not_available": "offline",
+            "value_template": value_template,
+            "device": device,
+            "origin": origin,
+            "expire_after": EXPIRE_AFTER,
+            "qos": MQTT_QOS,
+        }
+
+        if sensor_def.get("precision") is not None:
+            payload["suggested_display_precision"] = sensor_def["precision"]
+
+        if sensor_def.get("device_class"):
+            payload["device_class"] = sensor_def["device_class"]
+
+        if sensor_def.get("state_class"):
+            payload["state_class"] = sensor_def["state_class"]
+
+        if sensor_def.get("unit"):
+            payload["unit_of_measurement"] = sensor_def["unit"]
+
+        if sensor_def.get("icon"):
+            payload["icon"] = sensor_def["icon"]
+
+        if component == "binary_sensor":
+            payload["payload_on"] = sensor_def["payload_on"]
+            payload["payload_off"] = sensor_def["payload_off"]
+
+        messages.append((config_topic, json.dumps(payload, sort_keys=True)))
+
+    return messages
+
+
+class HADiscovery(object):
+    """
+    The discovery configs, built and serialized once, with a hash of them.
+
+    publish() sends them only if that hash differs from the one last
+    published (kept in hash_file across restarts), unless forced. They are
+    forced out again when HA announces on HA_STATUS_TOPIC that it has
+    (re)started, since it may have lost them; a plain reconnect to the
+    broker does not resend them, as the broker still holds them retained.
+    """
+
+    def __init__(self, hash_file=None):
+        self.messages = build_ha_discovery_messages()
+        self.hash_file = hash_file
+        self.lock = threading.Lock()
+
+        digest = hashlib.sha256()
+        for topic, payload in self.messages:
+            digest.update(topic.encode() + b"\0" + payload.encode() + b"\0")
+        self.digest = digest.hexdigest()
+
+        self.published_digest = None
+        if hash_file:
+            try:
+                with open(hash_file) as digest_file:
+                    self.published_digest = digest_file.read().strip()
+            except OSError:
+                pass
+
+    def publish(self, client, force=False):
+        with self.lock:
+            if not force and self.published_digest == self.digest:
+                return
+
+            published = 0
+            for topic, payload in self.messages:
+                if safe_publish(client, topic, payload, "HA discovery", retain=RETAIN_DISCOVERY):
+                    published += 1
+
+            print(f"Published {published} HA discovery configs (hash {self.digest[:12]})", flush=True)
+            if published < len(self.messages):
+                return
+
+            self.published_digest = self.digest
+            if self.hash_file:
+                try:
+                    with open(self.hash_file, "w") as digest_file:
+                        digest_file.write(self.digest + "\n")
+                except OSError as exc:
+                    print(f"Could not save the HA discovery hash to {self.hash_file}: {exc}", flush=True)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            return
+
+        # Subscriptions do not survive a reconnect with a clean session
+        client.message_callback_add(HA_STATUS_TOPIC, self.on_ha_status)
+        client.subscribe(HA_STATUS_TOPIC, qos=MQTT_QOS)
+        self.publish(client)
+
+    def on_ha_status(self, client, userdata, message):
+        # A retained status is old news, not a restart
+        if message.payload == b"online" and not message.retain:
+            print("Home Assistant restarted, republishing discovery", flush=True)
+            self.publish(client, force=True)
+
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+def default_sink_configs():
+    """
+    The NAS (legacy payload), HA and local store sinks from the settings
+    above, used when SINKS_CONFIG is not set.
+    """
+
+    configs = []
+
+    if PUBLISH_LEGACY_PAYLOAD:
+        configs.append({
+            "name": "NAS",
+            "type": "mqtt",
+            "host": NAS_MQTT_HOST,
+            "port": NAS_MQTT_PORT,
+            "username": NAS_MQTT_USERNAME if NAS_MQTT_PASSWORD else None,
+            "password": NAS_MQTT_PASSWORD,
+            "topic": LEGACY_MQTT_TOPIC,
+            "serializer": "legacy-json",
+            "qos": MQTT_QOS,
+            "retain": RETAIN_LEGACY_STATE,
+            "offline_buffer_dir": OFFLINE_BUFFER_DIR,
+        })
+
+    if PUBLISH_HA_PAYLOAD:
+        configs.append({
+            "name": "HA",
+            "type": "mqtt",
+            "host": HA_MQTT_HOST,
+            "port": HA_MQTT_PORT,
+            "username": HA_MQTT_USERNAME,
+            "password": HA_MQTT_PASSWORD,
+            "topic": HA_STATE_TOPIC,
+            "serializer": "ha-json",
+            "qos": MQTT_QOS,
+            "retain": RETAIN_HA_STATE,
+            "availability_topic": HA_AVAILABILITY_TOPIC,
+            "retain_availability": RETAIN_AVAILABILITY,
+            "on_connect": "ha-discovery",
+            # HA only wants the current reading; don't retry stale ones for long
+            "retries": 1,
+        })
+
+    if LOCAL_STORE_FILE:
+        configs.append({
+            "name": "Store",
+            "type": "sqlite",
+            "path": LOCAL_STORE_FILE,
+            "sensor": SENSOR_NAME,
+            "serializer": "fields",
+            "queue_size": 1000,
+        })
+
+    return configs
+
+
+def serialize_legacy(reading, config):
+    only = reading["legacy_fields"]
+    if only is not None and not (only & LEGACY_FIELD_NAMES.keys()) and not reading["legacy_extras"]:
+        return None
+
+    outer = None
+    if config.get("offline_buffer_dir"):
+        # Replayed readings need their own time for Telegraf's json_time_key
+        outer = {"timestamp": round(reading["timestamp"], 3)}
+
+    return LEGACY_JSON.encode(reading["values"], only, reading["legacy_extras"], outer)
+
+
+def serialize_ha(reading, config):
+    extras = dict(reading["ha_extras"] or ())
+    extras["last_update"] = iso_timestamp(reading["timestamp"])
+    return HA_JSON.encode(reading["values"], extras=extras)
+
+
+def serialize_line_protocol(reading, config):
+    fields = MS430.line_fields(reading["values"])
+    fields.update(reading["ha_extras"] or {})
+    tags = {"room": f"{LOCATION_ROOM}-{SENSOR_NAME}", "floor": LOCATION_ZONE}
+
+    return build_payload(
+        config.get("line_format", LINE_FORMAT_MULTI_FIELD),
+        SENSOR_NAME,
+        tags,
+        fields,
+        timestamp_ns(reading["timestamp"]),
+    ) or None
+
+
+def serialize_fields(reading, config):
+    fields = dict(reading["values"])
+    fields.update(reading["ha_extras"] or {})
+    fields["timestamp"] = reading["timestamp"]
+    return fields
+
+
+SERIALIZERS = {
+    "legacy-json": serialize_legacy,
+    "ha-json": serialize_ha,
+    "line-protocol": serialize_line_protocol,
+    "fields": serialize_fields,
+}
+
+
+def on_connect_callbacks(ha_discovery):
+    """
+    The extra MQTT connect callbacks sink configs can name in "on_connect".
+    """
+
+    return {
+        "ha-discovery": ha_discovery.on_connect,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Publishing
+# ---------------------------------------------------------------------------
+
+def build_reading(values, ha_extras=None, legacy_extras=None, legacy_fields=None, timestamp=None):
+    """
+    The reading passed to the sinks' serializers, or None (and a log line)
+    if values is incomplete.
+    """
+
+    if not MS430.is_complete(values):
+        print(f"Skipping publish because payload has missing values: {values}", flush=True)
+        return None
+
+    if legacy_fields is not None:
+        legacy_fields = set(legacy_fields)
+        if legacy_extras:
+            # Summary fields are named <legacy name>_min, _max, _p95, ...
+            names = {LEGACY_FIELD_NAMES[key] for key in legacy_fields if key in LEGACY_FIELD_NAMES}
+            legacy_extras = {
+                name: value
+                for name, value in legacy_extras.items()
+                if name.rsplit("_", 1)[0] in names
+            }
+
+    return {
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "values": values,
+        "ha_extras": ha_extras,
+        "legacy_extras": legacy_extras,
+        "legacy_fields": legacy_fields,
+    }
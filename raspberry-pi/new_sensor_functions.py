@@ -13,11 +13,13 @@
 #  https://github.com/metriful/sensor
 
 import sys
+import contextlib
+import time
 from time import sleep
 import datetime
-import RPi.GPIO as GPIO
-import smbus
 import os
+import queue
+import i2c_manager
 from sensor_constants import *
 
 ##########################################################################################
@@ -73,33 +75,96 @@ OHM_SYMBOL = "\u03A9"
 
 ##########################################################################################
 
-def SensorHardwareSetup():
+# Longest time to block waiting for a READY edge during setup before 
+# re-checking the pin level (covers an edge that happens just before the wait)
+READY_SETUP_TIMEOUT_MS = 100
+
+def wait_for_ready_low(gpio):
+  # Block until READY is low, sleeping in the kernel until the falling edge 
+  # instead of polling the pin
+  while (gpio.input(READY_pin) == 1):
+    gpio.wait_for_edge(READY_pin, gpio.FALLING, timeout=READY_SETUP_TIMEOUT_MS)
+
+# gpio and I2C_bus can be supplied to use something other than RPi.GPIO and 
+# the shared bus 1, e.g. fake_hardware.FakeGPIO / FakeSMBus when there is no sensor.
+#
+# RPi.GPIO is only imported here, when no gpio is supplied, so importing 
+# this module (e.g. for its constants or read_all()) needs no Pi hardware 
+# and costs nothing at start-up.
+def SensorHardwareSetup(gpio=None, I2C_bus=None):
+  if (gpio is None):
+    import RPi.GPIO as gpio
+
   # Set up the Raspberry Pi GPIO
-  GPIO.setwarnings(False)
-  GPIO.setmode(GPIO.BOARD) 
-  GPIO.setup(READY_pin, GPIO.IN)
-  GPIO.setup(light_int_pin, GPIO.IN)
-  GPIO.setup(sound_int_pin, GPIO.IN)
+  gpio.setwarnings(False)
+  gpio.setmode(gpio.BOARD) 
+  gpio.setup(READY_pin, gpio.IN)
+  gpio.setup(light_int_pin, gpio.IN)
+  gpio.setup(sound_int_pin, gpio.IN)
 
-  # Initialize the I2C communications bus object
-  I2C_bus = smbus.SMBus(1) # Port 1 is the default for I2C on Raspberry Pi    
+  # Use the shared, locked I2C bus handle (see i2c_manager.py)
+  if (I2C_bus is None):
+    I2C_bus = i2c_manager.get_bus(1) # Port 1 is the default for I2C on Raspberry Pi    
 
   # Wait for the MS430 to finish power-on initialization:
-  while (GPIO.input(READY_pin) == 1):
-    sleep(0.05)
+  wait_for_ready_low(gpio)
     
   # Reset MS430 to clear any previous state:
   I2C_bus.write_byte(i2c_7bit_address, RESET_CMD)
   sleep(0.005)
   
   # Wait for reset completion and entry to standby mode
-  while (GPIO.input(READY_pin) == 1):
-    sleep(0.05)
+  wait_for_ready_low(gpio)
   
   # Tell the Pi to monitor READY for a falling edge event (high-to-low voltage change)
-  GPIO.add_event_detect(READY_pin, GPIO.FALLING) 
+  gpio.add_event_detect(READY_pin, gpio.FALLING) 
   
-  return (GPIO, I2C_bus)
+  return (gpio, I2C_bus)
+
+##########################################################################################
+
+# Wait for new data without polling: a GPIO edge callback puts the time of 
+# every READY falling edge into a queue and wait() blocks on that queue.
+#
+# Usage:
+#   ready = ReadyMonitor(GPIO)
+#   while True:
+#     edge_time = ready.wait(timeout_s)   # None on timeout
+#     ...
+
+# Cycle period setting -> seconds between READY edges
+CYCLE_PERIOD_SECONDS = {CYCLE_PERIOD_3_S:3, CYCLE_PERIOD_100_S:100, CYCLE_PERIOD_300_S:300}
+
+class ReadyMonitor:
+  def __init__(self, gpio, pin=READY_pin, maxsize=16):
+    self.edges = queue.Queue(maxsize)
+    self.missed = 0
+    # SensorHardwareSetup() has already enabled falling edge detection
+    gpio.add_event_callback(pin, self._on_edge)
+
+  def _on_edge(self, channel):
+    # Runs in the GPIO library's thread
+    try:
+      self.edges.put_nowait(time.time())
+    except queue.Full:
+      self.missed += 1
+
+  def wait(self, timeout=None):
+    # Return the time of the next READY edge, or None after timeout seconds
+    try:
+      return self.edges.get(timeout=timeout)
+    except queue.Empty:
+      return None
+
+  def drain(self):
+    # Discard edges that arrived while the caller was busy; returns the 
+    # latest edge time or None
+    latest = None
+    while True:
+      try:
+        latest = self.edges.get_nowait()
+      except queue.Empty:
+        return latest
 
 ##########################################################################################
 
@@ -186,28 +251,93 @@ def extractParticleData(rawData, particleSensor):
 # and then converts the raw data into a python dictionary, which is 
 # returned from the function
 
+# Optional raw_capture.RawCaptureWriter: when set with setRawCapture(), 
+# every raw category read below is also appended to the capture file.
+raw_capture = None
+
+# setRawCapture() starts the capture with a frame holding the particle 
+# sensor type, as if read from PARTICLE_SENSOR_SELECT_REG, so raw-replay.py 
+# decodes particle frames for the sensor that was fitted.
+def setRawCapture(writer, particleSensor=PARTICLE_SENSOR):
+  global raw_capture
+  raw_capture = writer
+  if (writer is not None):
+    writer.write_frame(i2c_7bit_address, PARTICLE_SENSOR_SELECT_REG, [particleSensor])
+
+def read_category(I2C_bus, register, nbytes):
+  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, register, nbytes)
+  if (raw_capture is not None):
+    raw_capture.write_frame(i2c_7bit_address, register, raw_data)
+  return raw_data
+
 def get_air_data(I2C_bus):
-  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, AIR_DATA_READ, AIR_DATA_BYTES)
+  raw_data = read_category(I2C_bus, AIR_DATA_READ, AIR_DATA_BYTES)
   return extractAirData(raw_data)
   
 def get_air_quality_data(I2C_bus):
-  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, AIR_QUALITY_DATA_READ, AIR_QUALITY_DATA_BYTES)
+  raw_data = read_category(I2C_bus, AIR_QUALITY_DATA_READ, AIR_QUALITY_DATA_BYTES)
   return extractAirQualityData(raw_data)
   
 def get_light_data(I2C_bus):
-  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, LIGHT_DATA_READ, LIGHT_DATA_BYTES)
+  raw_data = read_category(I2C_bus, LIGHT_DATA_READ, LIGHT_DATA_BYTES)
   return extractLightData(raw_data)
   
 def get_sound_data(I2C_bus):
-  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, SOUND_DATA_READ, SOUND_DATA_BYTES)
+  raw_data = read_category(I2C_bus, SOUND_DATA_READ, SOUND_DATA_BYTES)
   return extractSoundData(raw_data)
   
 def get_particle_data(I2C_bus, particleSensor):
-  raw_data = I2C_bus.read_i2c_block_data(i2c_7bit_address, PARTICLE_DATA_READ, PARTICLE_DATA_BYTES)
+  raw_data = read_category(I2C_bus, PARTICLE_DATA_READ, PARTICLE_DATA_BYTES)
   return extractParticleData(raw_data, particleSensor)
 
 ##########################################################################################
 
+# Read every data category as one consistent snapshot.
+#
+# The categories are read back-to-back with read_i2c_block_data() while 
+# holding the bus lock (see i2c_manager.py), so no other thread's 
+# transactions land in between; the lock is what makes the snapshot 
+# consistent. It is still one transaction per category: the Pi's 
+# i2c-bcm2835 driver only accepts a single read message per combined 
+# transfer, so i2c_rdwr() can't merge them, and a register-select write + 
+# read i2c_rdwr() per category was measured slower on the simulated bus 
+# (ms430-benchmark.py, 100 kHz: 61 bytes and 6.49 ms per snapshot, against 
+# 53 bytes and 6.13 ms for the block reads).
+#
+# Returns a dictionary with 'air', 'air_quality', 'light' and 'sound' 
+# (and 'particle' if a particle sensor is selected) holding the usual 
+# extractXXXData() dictionaries, plus 'timestamp', 'read_time_s' and 
+# 'transactions' describing the read.
+
+SNAPSHOT_CATEGORIES = [
+  ('air', AIR_DATA_READ, AIR_DATA_BYTES, extractAirData),
+  ('air_quality', AIR_QUALITY_DATA_READ, AIR_QUALITY_DATA_BYTES, extractAirQualityData),
+  ('light', LIGHT_DATA_READ, LIGHT_DATA_BYTES, extractLightData),
+  ('sound', SOUND_DATA_READ, SOUND_DATA_BYTES, extractSoundData),
+]
+
+def read_all(I2C_bus, particleSensor=PARTICLE_SENSOR_OFF):
+  categories = list(SNAPSHOT_CATEGORIES)
+  if (particleSensor != PARTICLE_SENSOR_OFF):
+    categories.append(('particle', PARTICLE_DATA_READ, PARTICLE_DATA_BYTES,
+                       lambda raw_data: extractParticleData(raw_data, particleSensor)))
+
+  lock = getattr(I2C_bus, 'lock', None) or contextlib.nullcontext()
+  start = time.perf_counter()
+  with lock:
+    raw_blocks = [I2C_bus.read_i2c_block_data(i2c_7bit_address, register, nbytes) 
+                  for (name, register, nbytes, extract) in categories]
+  read_time_s = time.perf_counter() - start
+
+  snapshot = {'timestamp':time.time(), 'read_time_s':read_time_s, 'transactions':len(categories)}
+  for (name, register, nbytes, extract), raw_data in zip(categories, raw_blocks):
+    if (raw_capture is not None):
+      raw_capture.write_frame(i2c_7bit_address, register, raw_data, snapshot['timestamp'])
+    snapshot[name] = extract(raw_data)
+  return snapshot
+
+##########################################################################################
+
 # Function to convert Celsius temperature to Fahrenheit. This is used 
 # just before outputting the temperature value, if the variable
 # USE_FAHRENHEIT is True
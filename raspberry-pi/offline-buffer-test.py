@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Zero-loss test for the offline buffer.
+
+Starts a local mosquitto broker, publishes numbered readings through
+offline_buffer.BufferedPublisher at a steady rate and at the QoS the
+publisher scripts use, kills the broker (SIGKILL) part way through,
+restarts it a few seconds later and waits for the buffer to drain. A
+separate subscriber records every reading it receives. The test passes if
+every reading arrived at least once; duplicates (possible with
+at-least-once delivery) are reported but allowed.
+
+With --freeze the broker is stopped (SIGSTOP) for the outage instead and
+only killed just before the restart, so the publisher keeps writing into a
+connection that still looks up, as with a broker host that lost power or
+network, rather than getting an immediate TCP reset.
+
+Needs the mosquitto binary on the PATH and paho-mqtt.
+
+Usage:
+    python3 offline-buffer-test.py [--readings 600] [--rate 20] [--port 18830]
+                                   [--down 5] [--freeze]
+"""
+
+import argparse
+import json
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+
+TOPIC = "offline-buffer-test"
+
+# The QoS the *-json-mqtt.py scripts publish their readings at
+QOS = 1
+
+
+def start_broker(port):
+    broker = subprocess.Popen(
+        ["mosquitto", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    return broker
+
+
+class Subscriber(object):
+    def __init__(self, port):
+        self.received = []
+        self.lock = threading.Lock()
+        self.client = mqtt.Client("offline-buffer-test-subscriber")
+        # Reconnect quickly so it is back before the publisher starts draining
+        self.client.reconnect_delay_set(1, 1)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect_async("localhost", port)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(TOPIC, qos=1)
+
+    def on_message(self, client, userdata, message):
+        with self.lock:
+            self.received.append(json.loads(message.payload)["reading"])
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill the broker mid-run and check nothing is lost.")
+    parser.add_argument("--readings", type=int, default=600)
+    parser.add_argument("--rate", type=float, default=20.0, help="readings per second")
+    parser.add_argument("--port", type=int, default=18830)
+    parser.add_argument("--down", type=float, default=5.0, help="seconds the broker stays down")
+    parser.add_argument("--freeze", action="store_true", help="freeze the broker for the outage instead of killing it")
+    args = parser.parse_args()
+
+    if shutil.which("mosquitto") is None:
+        sys.exit("mosquitto not found on the PATH")
+
+    buffer_dir = tempfile.mkdtemp(prefix="offline-buffer-test-")
+    broker = start_broker(args.port)
+    subscriber = Subscriber(args.port)
+
+    connection = MQTTConnection("localhost", "offline-buffer-test", port=args.port, label="test")
+    connection.start()
+    if not connection.wait_connected(10):
+        broker.kill()
+        sys.exit("Could not connect to the local broker")
+
+    # Small segments and frequent syncs so the test exercises segment rollover
+    publisher = BufferedPublisher(
+        connection,
+        buffer_dir,
+        drain_rate=200.0,
+        resume_delay=3.0,
+        segment_bytes=4096,
+        sync_every=10,
+    )
+    publisher.start()
+
+    kill_at = args.readings // 3
+    restart_at = kill_at + int(args.down * args.rate)
+    interval = 1.0 / args.rate
+
+    try:
+        for reading in range(1, args.readings + 1):
+            if reading == kill_at:
+                if args.freeze:
+                    print(f"Freezing the broker at reading {reading}", flush=True)
+                    broker.send_signal(signal.SIGSTOP)
+                else:
+                    print(f"Killing the broker at reading {reading}", flush=True)
+                    broker.kill()
+                    broker.wait()
+            if reading == restart_at:
+                if args.freeze:
+                    # Whatever it had not acknowledged is lost with it
+                    broker.kill()
+                    broker.wait()
+                print(f"Restarting the broker at reading {reading}", flush=True)
+                broker = start_broker(args.port)
+
+            payload = json.dumps({"reading": reading, "timestamp": time.time()})
+            publisher.publish(TOPIC, payload, qos=QOS)
+            time.sleep(interval)
+
+        # Wait for the backlog to drain and the last messages to arrive
+        deadline = time.monotonic() + 60
+        while publisher.waiting.is_set() and time.monotonic() < deadline:
+            time.sleep(0.5)
+        time.sleep(2)
+
+    finally:
+        publisher.stop()
+        connection.stop()
+        subscriber.stop()
+        broker.kill()
+        shutil.rmtree(buffer_dir, ignore_errors=True)
+
+    received = subscriber.received
+    missing = sorted(set(range(1, args.readings + 1)) - set(received))
+    duplicates = len(received) - len(set(received))
+
+    print(
+        f"Published {args.readings}, buffered {publisher.buffered} ({publisher.requeued} unacknowledged), "
+        f"drained {publisher.drained}, "
+        f"received {len(received)} ({duplicates} duplicates), missing {len(missing)}",
+        flush=True,
+    )
+    if missing:
+        print(f"Missing readings: {missing[:20]}{' ...' if len(missing) > 20 else ''}", flush=True)
+        sys.exit(1)
+    print("OK - no readings lost", flush=True)
+
+
+if __name__ == "__main__":
+    main()
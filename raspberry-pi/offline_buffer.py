@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Store-and-forward buffering of MQTT publishes while a broker is unreachable.
+
+OfflineBuffer is a bounded, append-only ring buffer on disk. Records are
+written to numbered segment files in a directory:
+
+    00000001.seg, 00000002.seg, ...
+
+each a sequence of frames of
+
+    <I  body length
+    <I  CRC-32 of the body
+        body: <d timestamp, B qos, B retain, H topic length, topic, payload
+
+A new segment is started on every open and whenever the current one reaches
+segment_bytes, and the oldest segments are deleted once the directory holds
+more than max_bytes, so a long outage keeps the newest readings. Frames are
+never rewritten; a frame cut short or corrupted by a crash fails its length
+or CRC check and ends that segment when reading. The read position is kept
+in a small "position" file, replaced atomically after each acknowledged
+batch.
+
+To suit SD cards, appends go through the file object's buffer and are only
+fsync'd every sync_every records or sync_interval seconds (and on close),
+so a power cut loses at most that many buffered readings.
+
+BufferedPublisher puts an mqtt_connection.MQTTConnection in front of a
+buffer: while the connection is down, or while older readings are still
+waiting, publishes go to the buffer; a background thread drains it in
+batches at a limited rate once the broker is back, waiting for each batch
+to be acknowledged (QoS 1) before moving the read position on.
+
+Live readings published at QoS 1 are kept in memory until the broker
+acknowledges them. If the connection drops first (including a socket that
+looked alive but was dead, which paho only notices at the keepalive), they
+are moved into the buffer, ahead of anything published since, and so are
+any still unacknowledged on stop(). Delivery is at-least-once: paho may
+also resend a moved reading after reconnecting, and a crash between a
+batch being acknowledged and the position being saved re-sends that batch.
+QoS 0 readings are never acknowledged, so one sent into a dead socket is
+lost; publish at QoS 1 to avoid that.
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+FRAME_HEADER = struct.Struct("<II")
+RECORD_HEADER = struct.Struct("<dBBH")
+
+SEGMENT_SUFFIX = ".seg"
+POSITION_FILE = "position"
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_SYNC_EVERY = 20
+DEFAULT_SYNC_INTERVAL = 30.0
+
+
+class BufferedRecord(object):
+    __slots__ = ("timestamp", "topic", "payload", "qos", "retain")
+
+    def __init__(self, timestamp, topic, payload, qos=0, retain=False):
+        self.timestamp = timestamp
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+def encode_record(record):
+    topic = record.topic.encode()
+    payload = record.payload
+    if isinstance(payload, str):
+        payload = payload.encode()
+    body = RECORD_HEADER.pack(record.timestamp, record.qos, int(record.retain), len(topic)) + topic + payload
+    return FRAME_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def decode_record(body):
+    timestamp, qos, retain, topic_length = RECORD_HEADER.unpack_from(body)
+    start = RECORD_HEADER.size
+    topic = body[start:start + topic_length].decode()
+    payload = body[start + topic_length:]
+    return BufferedRecord(timestamp, topic, payload, qos, bool(retain))
+
+
+class OfflineBuffer(object):
+    """
+    Disk-backed FIFO of BufferedRecords, bounded to about max_bytes.
+
+    append() adds a record; peek() returns the oldest ones with the position
+    after them, and ack(position) removes them. Safe to use from one writer
+    thread and one reader thread.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=DEFAULT_MAX_BYTES,
+        segment_bytes=DEFAULT_SEGMENT_BYTES,
+        sync_every=DEFAULT_SYNC_EVERY,
+        sync_interval=DEFAULT_SYNC_INTERVAL,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.dropped_segments = 0
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+
+        # Never append after a tail that may have been cut short by a crash
+        self.write_index = (segments[-1] + 1) if segments else 1
+
+        for index in segments:
+            if os.path.getsize(self._segment_path(index)) == 0:
+                os.remove(self._segment_path(index))
+        self.read_position = self._load_position(self._segments())
+
+        self.file = None
+        self._open_segment(self.write_index)
+
+    # -- files -------------------------------------------------------------
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"{index:08d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _open_segment(self, index):
+        if self.file:
+            self._sync()
+            self.file.close()
+        self.write_index = index
+        self.file = open(self._segment_path(index), "ab")
+
+    def _load_position(self, segments):
+        try:
+            with open(os.path.join(self.directory, POSITION_FILE)) as position_file:
+                index, offset = (int(value) for value in position_file.read().split())
+        except (OSError, ValueError):
+            index, offset = 0, 0
+
+        first = segments[0] if segments else self.write_index
+        if index < first:
+            index, offset = first, 0
+        return index, offset
+
+    def _save_position(self):
+        path = os.path.join(self.directory, POSITION_FILE)
+        temporary = path + ".tmp"
+        with open(temporary, "w") as position_file:
+            position_file.write("%d %d\n" % self.read_position)
+            position_file.flush()
+            os.fsync(position_file.fileno())
+        os.replace(temporary, path)
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _enforce_limit(self):
+        segments = self._segments()
+        sizes = {index: os.path.getsize(self._segment_path(index)) for index in segments}
+        total = sum(sizes.values())
+
+        for index in segments:
+            if total <= self.max_bytes or index == self.write_index:
+                break
+            os.remove(self._segment_path(index))
+            total -= sizes[index]
+            self.dropped_segments += 1
+            if self.read_position[0] <= index:
+                self.read_position = (index + 1, 0)
+                self._save_position()
+            print(f"Offline buffer full, dropped oldest segment {index}", flush=True)
+
+    # -- writing -----------------------------------------------------------
+
+    def append(self, topic, payload, qos=0, retain=False, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        frame = encode_record(BufferedRecord(timestamp, topic, payload, qos, retain))
+
+        with self.lock:
+            if self.file.tell() > 0 and self.file.tell() + len(frame) > self.segment_bytes:
+                self._open_segment(self.write_index + 1)
+                self._enforce_limit()
+
+            self.file.write(frame)
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    # -- reading -----------------------------------------------------------
+
+    def _read_frames(self, index, offset, limit):
+        """
+        Up to limit (record, position after it) pairs from one segment,
+        stopping at the end of the file or the first damaged frame.
+        """
+
+        frames = []
+        try:
+            segment = open(self._segment_path(index), "rb")
+        except FileNotFoundError:
+            return frames
+
+        with segment:
+            segment.seek(offset)
+            while len(frames) < limit:
+                header = segment.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                length, crc = FRAME_HEADER.unpack(header)
+                body = segment.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                offset += FRAME_HEADER.size + length
+                frames.append((decode_record(body), (index, offset)))
+        return frames
+
+    def peek(self, limit):
+        """
+        The oldest records not yet acknowledged, at most limit of them, and
+        the position to pass to ack() once they have been sent.
+        """
+
+        with self.lock:
+            self.file.flush()
+            index, offset = self.read_position
+            records = []
+
+            while len(records) < limit and index <= self.write_index:
+                frames = self._read_frames(index, offset, limit - len(records))
+                records.extend(record for record, _ in frames)
+                if frames:
+                    index, offset = frames[-1][1]
+                if len(records) < limit:
+                    if index == self.write_index:
+                        break
+                    # Rest of an older segment is empty or damaged
+                    index, offset = index + 1, 0
+
+            return records, (index, offset)
+
+    def ack(self, position):
+        with self.lock:
+            self.read_position = position
+            self._save_position()
+
+            # Remove segments that have been read completely
+            for index in self._segments():
+                if index >= position[0] or index == self.write_index:
+                    break
+                os.remove(self._segment_path(index))
+
+    def pending(self):
+        records, _ = self.peek(1)
+        return bool(records)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+
+class BufferedPublisher(object):
+    """
+    Publishes through connection (an mqtt_connection.MQTTConnection), or
+    into an OfflineBuffer in directory while that is not possible.
+
+    With directory None this is a plain pass-through to connection.publish.
+    Draining sends at most drain_rate records per second in batches of
+    batch_size, starting resume_delay seconds after a reconnect.
+    """
+
+    def __init__(
+        self,
+        connection,
+        directory=None,
+        batch_size=50,
+        drain_rate=20.0,
+        resume_delay=2.0,
+        ack_timeout=10.0,
+        **buffer_options
+    ):
+        self.connection = connection
+        self.buffer = OfflineBuffer(directory, **buffer_options) if directory else None
+        self.batch_size = batch_size
+        self.drain_rate = drain_rate
+        self.resume_delay = resume_delay
+        self.ack_timeout = ack_timeout
+
+        self.buffered = 0
+        self.drained = 0
+        self.requeued = 0
+        self.acked = 0
+        # (MessageInfo, record) for live QoS 1 publishes not yet acknowledged
+        self.in_flight = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.waiting = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.buffer is None:
+            return
+        if self.buffer.pending():
+            self.waiting.set()
+        self.thread = threading.Thread(target=self._drain_loop, name="offline-buffer-drain", daemon=True)
+        self.thread.start()
+
+    def publish(self, topic, payload, qos=0, retain=False, timestamp=None):
+        """
+        Publish now if possible, otherwise buffer. Returns True if the
+        reading was published or buffered.
+        """
+
+        if self.buffer is None:
+            info = self.connection.publish(topic, payload, qos=qos, retain=retain)
+            if info.rc != 0:
+                return False
+            if qos > 0:
+                # Only to count acknowledgements; paho itself resends after a reconnect
+                with self.lock:
+                    self._check_in_flight()
+                    self.in_flight.append((info, None))
+            return True
+
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            # Readings lost with a dropped connection go into the buffer first, to keep the order
+            self._check_in_flight()
+
+            # Keep readings in order: while older ones are waiting, queue behind them
+            if self.connection.is_connected and not self.waiting.is_set():
+                info = self.connection.publish(topic, payload, qos=qos, retain=retain)
+                if info.rc == 0:
+                    if qos > 0:
+                        self.in_flight.append((info, BufferedRecord(timestamp, topic, payload, qos, retain)))
+                    return True
+
+            self._append(BufferedRecord(timestamp, topic, payload, qos, retain))
+            return True
+
+    def _append(self, record):
+        self.buffer.append(record.topic, record.payload, qos=record.qos, retain=record.retain, timestamp=record.timestamp)
+        self.buffered += 1
+        self.waiting.set()
+
+    def _check_in_flight(self, requeue=False):
+        """
+        Forget live readings the broker has acknowledged, and move the rest
+        into the buffer if the connection has dropped (or requeue is set).
+        """
+
+        requeue = self.buffer is not None and (requeue or not self.connection.is_connected)
+        waiting = []
+        for info, record in self.in_flight:
+            if info.is_published():
+                self.acked += 1
+                continue
+            if requeue:
+                self._append(record)
+                self.requeued += 1
+            else:
+                waiting.append((info, record))
+        self.in_flight = waiting
+
+    def acknowledged(self):
+        """
+        How many live QoS 1 readings the broker has acknowledged so far.
+        """
+
+        with self.lock:
+            self._check_in_flight()
+            return self.acked
+
+    def _send_batch(self, records):
+        infos = []
+        for record in records:
+            # QoS 1 at least, so the broker's PUBACK confirms delivery
+            info = self.connection.publish(record.topic, record.payload, qos=max(record.qos, 1), retain=record.retain)
+            if info.rc != 0:
+                return False
+            infos.append(info)
+
+        deadline = time.monotonic() + self.ack_timeout
+        for info in infos:
+            info.wait_for_publish(max(deadline - time.monotonic(), 0.01))
+            if not info.is_published():
+                return False
+        return True
+
+    def _drain_loop(self):
+        while not self.stopping.is_set():
+            if self.in_flight and not self.connection.is_connected:
+                with self.lock:
+                    self._check_in_flight()
+
+            self.waiting.wait(1.0)
+            if not self.waiting.is_set():
+                continue
+
+            if not self.connection.connected.wait(1.0):
+                continue
+            if self.stopping.wait(self.resume_delay):
+                return
+
+            while self.connection.is_connected and not self.stopping.is_set():
+                records, position = self.buffer.peek(self.batch_size)
+                if not records:
+                    self.waiting.clear()
+                    # A publish may have buffered between peek() and clear()
+                    if self.buffer.pending():
+                        self.waiting.set()
+                        continue
+                    print(f"Offline buffer drained ({self.drained} readings sent)", flush=True)
+                    break
+
+                started = time.monotonic()
+                if not self._send_batch(records):
+                    print("Offline buffer drain interrupted, will retry after reconnecting", flush=True)
+                    break
+                self.buffer.ack(position)
+                self.drained += len(records)
+
+                # Limit the drain rate so live readings and the broker keep up
+                pause = len(records) / self.drain_rate - (time.monotonic() - started)
+                if pause > 0 and self.stopping.wait(pause):
+                    return
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(5)
+        if self.buffer is not None:
+            # Give the broker a moment to acknowledge the last live readings; keep the rest for next time
+            deadline = time.monotonic() + self.ack_timeout
+            with self.lock:
+                for info, _ in self.in_flight:
+                    if not self.connection.is_connected:
+                        break
+                    info.wait_for_publish(max(deadline - time.monotonic(), 0.01))
+                self._check_in_flight(requeue=True)
+            self.buffer.close()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Replay a raw capture file through the sensor decode functions.
+
+Reads the frames recorded by raw_capture.RawCaptureWriter (see the
+raw_capture_file / RAW_CAPTURE_FILE settings in bme280-json-mqtt.py,
+ms430-json-mqtt.py and ms430-dual-mqtt.py) and runs each one back through
+bme280.compensate()/compensateInt() or the MS430 extractXXXData() functions
+as fast as the CPU allows.
+
+MS430 captures start with a frame recording the particle sensor type (see
+new_sensor_functions.setRawCapture()); --particle-sensor overrides it, and
+is needed for particle frames in captures made before it was recorded.
+
+Usage:
+    python3 raw-replay.py capture.rawcap [--engine float|integer] [--print]
+                          [--particle-sensor off|ppd42|sds011]
+
+Without --print only a summary is shown (frames decoded and frames/s), which
+makes this a decode-path benchmark on real data without any hardware.
+"""
+
+import argparse
+import time
+
+import bme280
+from raw_capture import read_frames
+
+
+# Register -> (label, extract function name in new_sensor_functions)
+MS430_EXTRACTORS = {
+    0x10: ("air", "extractAirData"),
+    0x11: ("air_quality", "extractAirQualityData"),
+    0x12: ("light", "extractLightData"),
+    0x13: ("sound", "extractSoundData"),
+}
+MS430_PARTICLE_REGISTER = 0x14
+# Frame written by setRawCapture() holding the particle sensor type
+MS430_PARTICLE_SENSOR_SELECT_REGISTER = 0x07
+
+# --particle-sensor name -> new_sensor_functions PARTICLE_SENSOR_* value
+PARTICLE_SENSORS = {"off": 0, "ppd42": 1, "sds011": 2}
+
+
+class Replayer(object):
+    def __init__(self, engine, particle_sensor=None):
+        self.compensate = bme280.COMPENSATION_ENGINES[engine]
+        # From the command line; otherwise taken from the capture
+        self.particle_sensor_override = particle_sensor
+        self.particle_sensor = particle_sensor
+        self.calibration_blocks = {}
+        self.calibration = {}
+        self.ms430 = None
+        self.counts = {}
+
+    def _ms430(self):
+        # Imported on first use so BME280-only captures replay off the Pi
+        if self.ms430 is None:
+            import new_sensor_functions
+            self.ms430 = new_sensor_functions
+        return self.ms430
+
+    def decode(self, addr, register, data):
+        """
+        Decode one frame. Returns (label, values) or None for frames that only
+        carry calibration or settings.
+        """
+
+        if register == bme280.REG_DATA:
+            pres_raw, temp_raw, hum_raw = bme280.splitRawData(data)
+            values = self.compensate(self.calibration[addr], pres_raw, temp_raw, hum_raw)
+            return "bme280", dict(zip(("temperature", "pressure", "humidity"), values))
+
+        for block_register, _ in bme280.CALIBRATION_BLOCKS:
+            if register == block_register:
+                blocks = self.calibration_blocks.setdefault(addr, {})
+                blocks[register] = data
+                if len(blocks) == len(bme280.CALIBRATION_BLOCKS):
+                    self.calibration[addr] = bme280.decodeCalibration(
+                        *[blocks[reg] for reg, _ in bme280.CALIBRATION_BLOCKS]
+                    )
+                return None
+
+        if register in MS430_EXTRACTORS:
+            label, function_name = MS430_EXTRACTORS[register]
+            return label, getattr(self._ms430(), function_name)(data)
+
+        if register == MS430_PARTICLE_SENSOR_SELECT_REGISTER:
+            if self.particle_sensor_override is None:
+                self.particle_sensor = data[0]
+            return None
+
+        if register == MS430_PARTICLE_REGISTER:
+            if self.particle_sensor is None:
+                raise ValueError("Particle frame but no particle sensor type in the capture - pass --particle-sensor")
+            return "particle", self._ms430().extractParticleData(data, self.particle_sensor)
+
+        raise ValueError(f"Unknown frame: address 0x{addr:02X} register 0x{register:02X}")
+
+    def replay(self, path, print_values=False):
+        for timestamp, addr, register, data in read_frames(path):
+            decoded = self.decode(addr, register, data)
+            if decoded is None:
+                continue
+
+            label, values = decoded
+            self.counts[label] = self.counts.get(label, 0) + 1
+            if print_values:
+                print(f"{timestamp:.3f} {label} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a raw sensor capture file.")
+    parser.add_argument("path", help="capture file written by raw_capture.RawCaptureWriter")
+    parser.add_argument(
+        "--engine",
+        choices=sorted(bme280.COMPENSATION_ENGINES),
+        default=bme280.ENGINE_FLOAT,
+        help="BME280 compensation engine",
+    )
+    parser.add_argument(
+        "--particle-sensor",
+        choices=sorted(PARTICLE_SENSORS),
+        help="MS430 particle sensor the capture was made with (default: as recorded in the capture)",
+    )
+    parser.add_argument("--print", dest="print_values", action="store_true", help="print every decoded frame")
+    args = parser.parse_args()
+
+    particle_sensor = PARTICLE_SENSORS[args.particle_sensor] if args.particle_sensor else None
+    replayer = Replayer(args.engine, particle_sensor)
+    start = time.perf_counter()
+    replayer.replay(args.path, args.print_values)
+    elapsed = time.perf_counter() - start
+
+    total = sum(replayer.counts.values())
+    print(f"Decoded {total} frames in {elapsed:.3f} s ({total / max(elapsed, 1e-9):.0f} frames/s)", flush=True)
+    for label in sorted(replayer.counts):
+        print(f"  {label:<12} {replayer.counts[label]}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Append-only capture of raw I2C data blocks.
+
+Every frame is the bytes returned by one register block read, tagged with a
+timestamp, the I2C address and the register it was read from, so converted
+values can be recomputed later with raw-replay.py when a formula or a
+calibration changes.
+
+File layout: an 8-byte magic header, then frames of
+
+    <d  timestamp (seconds since the epoch)
+    B   I2C address
+    B   register
+    H   payload length
+        payload bytes
+
+all little-endian. A frame cut short by a crash or power loss at the end
+of the file is ignored when reading.
+"""
+
+import os
+import struct
+import time
+
+
+MAGIC = b"RAWCAP1\n"
+
+FRAME_HEADER = struct.Struct("<dBBH")
+
+
+class RawCaptureWriter(object):
+    """
+    Appends frames to a capture file.
+
+    Frames are buffered by the file object; call flush() once per read cycle
+    (the scripts do) so at most one cycle is lost on a crash without paying
+    a write per frame on the SD card.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(MAGIC)
+
+    def write_frame(self, addr, register, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        payload = bytes(bytearray(data))
+        self.file.write(FRAME_HEADER.pack(timestamp, addr, register, len(payload)))
+        self.file.write(payload)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_frames(path):
+    """
+    Yield (timestamp, addr, register, data) for every complete frame in a
+    capture file. data is a list of ints, as returned by smbus.
+    """
+
+    with open(path, "rb") as capture_file:
+        if capture_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a raw capture file")
+
+        while True:
+            header = capture_file.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+
+            timestamp, addr, register, length = FRAME_HEADER.unpack(header)
+            payload = capture_file.read(length)
+            if len(payload) < length:
+                return
+
+            yield timestamp, addr, register, list(payload)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sequential vs overlapped multi-sensor read cycles.
+
+Runs a BME280 and a TSL2561 on a simulated I2C bus (see fake_hardware.py)
+and times a read cycle of both for:
+
+- sequential:  BME280 read (trigger, wait, read), then TSL2561 read - each
+               device waits out its own conversion
+- read_cycle:  read_cycle.ReadCycle - both triggered up front, collected
+               in order of completion
+
+for a few BME280 oversampling and TSL2561 integration settings, then
+prints the phase report of the last overlapped cycle.
+
+Usage: python3 read-cycle-benchmark.py [cycles]
+"""
+
+import sys
+import time
+
+import bme280
+import tsl2561
+from fake_hardware import FakeSMBus, attach_bme280, attach_tsl2561
+from read_cycle import ReadCycle, bme280_stage, tsl2561_stage
+
+
+SETTINGS = [
+    ("BME280 x2, TSL2561 13 ms", bme280.OVERSAMPLE_X2, tsl2561.INTEGRATION_13MS),
+    ("BME280 x16, TSL2561 13 ms", bme280.OVERSAMPLE_X16, tsl2561.INTEGRATION_13MS),
+    ("BME280 x16, TSL2561 101 ms", bme280.OVERSAMPLE_X16, tsl2561.INTEGRATION_101MS),
+    ("BME280 x2, TSL2561 402 ms", bme280.OVERSAMPLE_X2, tsl2561.INTEGRATION_402MS),
+]
+
+
+def devices(oversample, integration):
+    i2c_bus = FakeSMBus(simulate_timing=True)
+    attach_bme280(i2c_bus, bme280.DEVICE)
+    attach_tsl2561(i2c_bus)
+    weather = bme280.BME280(bme280.DEVICE, i2c_bus, osrs_t=oversample, osrs_p=oversample, osrs_h=oversample)
+    light = tsl2561.TSL2561(i2c_bus, integration=integration)
+    return weather, light
+
+
+def time_cycles(cycle, cycles):
+    start = time.perf_counter()
+    for _ in range(cycles):
+        cycle()
+    return (time.perf_counter() - start) / cycles
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"{'settings':<28} {'sequential':>11} {'read_cycle':>11}")
+    read_cycle = None
+    for label, oversample, integration in SETTINGS:
+        weather, light = devices(oversample, integration)
+        sequential = time_cycles(lambda: (weather.read(), light.read()), cycles)
+
+        read_cycle = ReadCycle([bme280_stage(weather), tsl2561_stage(light)])
+        overlapped = time_cycles(read_cycle.run, cycles)
+
+        print(f"{label:<28} {sequential * 1000:>8.1f} ms {overlapped * 1000:>8.1f} ms", flush=True)
+
+    print()
+    print(read_cycle.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+One read cycle across several sensors, with their conversions overlapped.
+
+Reading devices one after another costs the sum of their conversion times.
+A ReadCycle instead splits each device into its phases:
+
+- trigger:  start a conversion; returns when the result should be ready
+- collect:  wait for whatever is left of the conversion and read it
+
+triggers every device up front, then collects them in order of expected
+completion, so a cycle costs roughly the longest conversion rather than
+the sum.
+
+Devices are given as Stages; bme280_stage() and tsl2561_stage() adapt the
+bme280.BME280 and tsl2561.TSL2561 drivers:
+
+    cycle = ReadCycle([bme280_stage(bme280.getDevice()), tsl2561_stage(light)])
+    results = cycle.run()
+    temperature, pressure, humidity = results["bme280"]
+    lux = results["tsl2561"]
+    print(cycle.report())
+
+report() gives each device's phase timings for the last cycle, for
+debugging slow cycles. See read-cycle-benchmark.py for timings on a
+simulated bus.
+
+The MS430 needs no stage: in cycle mode it converts on its own and signals
+READY, and new_sensor_functions.read_all() fetches every category
+(including particle data) in one go.
+"""
+
+import time
+
+
+class Stage(object):
+    """
+    A device's read phases. trigger() starts a conversion and returns the
+    time.monotonic() its result should be ready (None: ready now);
+    collect() returns the result, waiting for the conversion if needed.
+    """
+
+    def __init__(self, name, trigger, collect):
+        self.name = name
+        self.trigger = trigger
+        self.collect = collect
+
+
+def bme280_stage(device, name="bme280"):
+    """
+    A forced-mode bme280.BME280 read, collected as (temperature, pressure,
+    humidity).
+    """
+
+    def trigger():
+        # BME280.trigger() works in time.time(); the cycle in time.monotonic()
+        return time.monotonic() + max(0.0, device.trigger() - time.time())
+
+    return Stage(name, trigger, device.collect)
+
+
+def tsl2561_stage(device, name="tsl2561"):
+    """
+    A tsl2561.TSL2561 read, collected as lux.
+    """
+
+    def trigger():
+        device.start()
+        return time.monotonic() + device.remaining()
+
+    return Stage(name, trigger, device.collect)
+
+
+class StageTiming(object):
+    __slots__ = ("name", "triggered", "trigger_time", "ready", "collect_started", "done", "error")
+
+    def __init__(self, name):
+        self.name = name
+        self.triggered = None
+        self.trigger_time = 0.0
+        self.ready = None
+        self.collect_started = None
+        self.done = None
+        self.error = None
+
+
+class ReadCycle(object):
+    """
+    Runs stages together. A stage whose trigger or collect raises gets None
+    as its result, and the error in its timing, without affecting the
+    others; the error is also printed, so a failing sensor shows in the log
+    even though the cycle carries on.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate stage names in read cycle")
+        self.timings = []
+        self.started = None
+        self.finished = None
+        self.cycles = 0
+
+    def run(self):
+        """
+        One cycle: {stage name: result}.
+        """
+
+        self.started = time.monotonic()
+        timings = []
+        for stage in self.stages:
+            timing = StageTiming(stage.name)
+            timing.triggered = time.monotonic()
+            try:
+                timing.ready = stage.trigger()
+            except Exception as exc:
+                timing.error = exc
+            timing.trigger_time = time.monotonic() - timing.triggered
+            if timing.ready is None:
+                timing.ready = timing.triggered
+            timings.append((stage, timing))
+
+        results = {}
+        for stage, timing in sorted(timings, key=lambda item: item[1].ready):
+            if timing.error is None:
+                delay = timing.ready - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                timing.collect_started = time.monotonic()
+                try:
+                    results[stage.name] = stage.collect()
+                except Exception as exc:
+                    timing.error = exc
+                timing.done = time.monotonic()
+            if timing.error is not None:
+                results[stage.name] = None
+                phase = "collect" if timing.collect_started is not None else "trigger"
+                print(f"{stage.name} {phase} error: {timing.error!r}", flush=True)
+
+        self.finished = time.monotonic()
+        self.timings = [timing for stage, timing in timings]
+        self.cycles += 1
+        return results
+
+    def report(self):
+        """
+        Phase timings of the last cycle, one line per stage plus a total,
+        in ms from the start of the cycle.
+        """
+
+        if self.started is None:
+            return "No read cycle run yet"
+
+        def ms(seconds):
+            return seconds * 1000.0
+
+        lines = []
+        conversions = 0.0
+        for timing in self.timings:
+            expected = timing.ready - timing.triggered
+            conversions += expected
+            if timing.done is None:
+                lines.append(f"{timing.name:<10} failed to trigger: {timing.error}")
+                continue
+            line = (
+                f"{timing.name:<10} trigger {ms(timing.triggered - self.started):>7.1f}"
+                f" (+{ms(timing.trigger_time):.1f})"
+                f"  ready {ms(timing.ready - self.started):>7.1f}"
+                f"  collect {ms(timing.collect_started - self.started):>7.1f}"
+                f" (+{ms(timing.done - timing.collect_started):.1f})"
+                f"  done {ms(timing.done - self.started):>7.1f}"
+            )
+            if timing.error is not None:
+                line += f"  error: {timing.error}"
+            lines.append(line)
+        lines.append(
+            f"{'cycle':<10} {ms(self.finished - self.started):.1f} ms"
+            f" (conversions add up to {ms(conversions):.1f} ms)"
+        )
+        return "\n".join(lines)
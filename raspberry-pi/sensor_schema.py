@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Declarative sensor field tables.
+
+A Schema is a list of Fields, each describing one published value once:
+
+- key:     the flat (Home Assistant) field name, e.g. "illuminance"
+- source:  (category, key) in a read_all() snapshot, e.g. ("light", "illum_lux"),
+           with an optional scale factor and the decimal places to round to;
+           or derive(values, snapshot) for values computed from others
+- legacy:  the name in the legacy nested JSON payload (None: not sent)
+- line:    the field name in line protocol payloads (None: not sent)
+- required: whether a reading without it is incomplete and not published
+- the Home Assistant discovery details: name, unit, device_class,
+  state_class, icon, precision, and for binary sensors component,
+  value_template, payload_on and payload_off
+
+Everything per-field is worked out when the Schema is built, so per reading
+extract(), legacy_fields(), line_fields() and is_complete() only walk
+precomputed tuples, and fields_named() feeds json_codec.ObjectTemplate.
+Adding a value, or a sensor, is a table entry.
+
+MS430 readings use ms430_schema(), shared by ms430-dual-mqtt.py,
+ms430-json-mqtt.py, ms430-capture.py and ms430-async-mqtt.py.
+"""
+
+from operator import itemgetter
+
+
+DISCOVERY_KEYS = (
+    "name",
+    "unit",
+    "device_class",
+    "state_class",
+    "icon",
+    "precision",
+    "component",
+    "value_template",
+    "payload_on",
+    "payload_off",
+)
+
+
+class Field(object):
+    def __init__(
+        self,
+        key,
+        source=None,
+        scale=None,
+        digits=None,
+        derive=None,
+        legacy=None,
+        line=None,
+        required=True,
+        **discovery
+    ):
+        unknown = set(discovery) - set(DISCOVERY_KEYS)
+        if unknown:
+            raise ValueError(f"Field {key!r}: unknown options {sorted(unknown)}")
+        if (source is None) == (derive is None):
+            raise ValueError(f"Field {key!r}: needs exactly one of source or derive")
+
+        self.key = key
+        self.source = source
+        self.scale = scale
+        self.digits = digits
+        self.derive = derive
+        self.legacy = legacy
+        self.line = line
+        self.required = required
+        self.discovery = discovery
+
+    def compile(self, rounded=True):
+        """
+        A function(snapshot, values) returning this field's value, rounded
+        to digits unless rounded is False.
+        """
+
+        if self.derive is not None:
+            derive = self.derive
+            return lambda snapshot, values: derive(values, snapshot)
+
+        category, source_key = self.source
+        scale = self.scale
+        digits = self.digits if rounded else None
+        # A scale like 0.01 is applied as a division by 100, which gives the
+        # same floats the scripts have always sent (P_Pa / 100); multiplying
+        # by 0.01 can differ in the last digit
+        divisor = 1 / scale if scale is not None and (1 / scale).is_integer() else None
+
+        def read(snapshot, values):
+            value = snapshot[category].get(source_key)
+            if value is None:
+                return None
+            # Numbers keep their type, so integer readings stay integers
+            if not isinstance(value, (int, float)):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return None
+            if divisor is not None:
+                value /= divisor
+            elif scale is not None:
+                value *= scale
+            if digits is not None:
+                value = round(value, digits)
+            return value
+
+        return read
+
+
+def _tuple_getter(keys):
+    # itemgetter returns a bare value rather than a 1-tuple for one key
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda values: (values[key],)
+    if not keys:
+        return lambda values: ()
+    return itemgetter(*keys)
+
+
+class Schema(object):
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.keys = [field.key for field in self.fields]
+        if len(set(self.keys)) != len(self.keys):
+            raise ValueError("Duplicate field keys in schema")
+
+        self._steps = tuple((field.key, field.compile()) for field in self.fields)
+        self._raw_steps = tuple((field.key, field.compile(rounded=False)) for field in self.fields)
+        self._rounding = tuple((field.key, field.digits) for field in self.fields if field.digits is not None)
+
+        legacy = [field for field in self.fields if field.legacy]
+        line = [field for field in self.fields if field.line]
+        required = [field.key for field in self.fields if field.required]
+
+        # key -> legacy name, in legacy payload order
+        self.legacy_names = {field.key: field.legacy for field in legacy}
+        self.line_names = {field.key: field.line for field in line}
+        self.required_keys = tuple(required)
+
+        self._legacy_names = tuple(field.legacy for field in legacy)
+        self._legacy_getter = _tuple_getter([field.key for field in legacy])
+        self._line_names = tuple(field.line for field in line)
+        self._line_getter = _tuple_getter([field.key for field in line])
+        self._required_getter = _tuple_getter(required)
+
+    def extract(self, snapshot, rounded=True):
+        """
+        Flat dict of every field's value from a read_all() snapshot, in table
+        order; values that could not be read are None. With rounded False
+        values are left at full precision, for encoders that format them at
+        their digits anyway (json_codec.ObjectTemplate).
+        """
+
+        values = {}
+        for key, read in (self._steps if rounded else self._raw_steps):
+            values[key] = read(snapshot, values)
+        return values
+
+    def rounded(self, values):
+        """
+        Copy of values with each field rounded to its digits.
+        """
+
+        values = dict(values)
+        for key, digits in self._rounding:
+            value = values.get(key)
+            if type(value) is float:
+                values[key] = round(value, digits)
+        return values
+
+    def fields_named(self, attribute):
+        """
+        (key, output name, digits) for every field with a name for attribute
+        ("key", "legacy" or "line"), e.g. for json_codec.ObjectTemplate.
+        """
+
+        return [
+            (field.key, getattr(field, attribute), field.digits)
+            for field in self.fields
+            if getattr(field, attribute)
+        ]
+
+    def legacy_fields(self, values):
+        return dict(zip(self._legacy_names, self._legacy_getter(values)))
+
+    def line_fields(self, values):
+        return dict(zip(self._line_names, self._line_getter(values)))
+
+    def is_complete(self, values):
+        try:
+            return None not in self._required_getter(values)
+        except KeyError:
+            return False
+
+    def discovery_fields(self):
+        """
+        (key, discovery options) for every field with a discovery name.
+        """
+
+        return [(field.key, field.discovery) for field in self.fields if field.discovery.get("name")]
+
+
+def ms430_schema():
+    """
+    The MS430 fields. The HA keys and legacy names match ms430-dual-mqtt.py's
+    payloads; the line names match the measurements ms430-capture.py has
+    always sent.
+    """
+
+    from new_sensor_functions import interpret_AQI_accuracy, interpret_AQI_value
+
+    def aqi_accuracy_label(values, snapshot):
+        accuracy = values["air_quality_accuracy"]
+        return interpret_AQI_accuracy(int(accuracy)) if accuracy is not None else None
+
+    def aqi_label(values, snapshot):
+        raw_aqi = snapshot["air_quality"].get("AQI")
+        if values["air_quality_valid"] and raw_aqi is not None:
+            return interpret_AQI_value(float(raw_aqi))
+        return None
+
+    def aqi_valid(values, snapshot):
+        accuracy = values["air_quality_accuracy"]
+        return accuracy is not None and accuracy > 0
+
+    return Schema([
+        Field(
+            "temperature", ("air", "T"), digits=2, legacy="temperature", line="temperature",
+            name="Temperature", unit="°C", device_class="temperature", state_class="measurement", precision=1,
+        ),
+        Field(
+            "humidity", ("air", "H_pc"), digits=2, legacy="humidity", line="humidity",
+            name="Humidity", unit="%", device_class="humidity", state_class="measurement", precision=1,
+        ),
+        Field(
+            "pressure", ("air", "P_Pa"), scale=0.01, digits=2, legacy="pressure", line="pressure",
+            name="Pressure", unit="hPa", device_class="pressure", state_class="measurement", precision=1,
+        ),
+        Field(
+            "illuminance", ("light", "illum_lux"), digits=2, legacy="lux", line="lux",
+            name="Illuminance", unit="lx", device_class="illuminance", state_class="measurement", precision=0,
+        ),
+        Field(
+            "air_quality_index", ("air_quality", "AQI"), digits=0, legacy="airquality", line="airquality",
+            name="Air Quality Index", state_class="measurement", icon="mdi:air-filter", precision=0,
+        ),
+        Field(
+            "air_quality_accuracy", ("air_quality", "AQI_accuracy"), digits=0,
+            legacy="airqual_accuracy", line="airquality-accuracy",
+            name="Air Quality Accuracy", state_class="measurement", icon="mdi:check-decagram-outline", precision=0,
+        ),
+        Field(
+            "air_quality_valid", derive=aqi_valid,
+            name="Air Quality Valid", component="binary_sensor", icon="mdi:check-circle-outline",
+            value_template="{% if value_json.air_quality_valid %}on{% else %}off{% endif %}",
+            payload_on="on", payload_off="off",
+        ),
+        Field(
+            "air_quality_accuracy_label", derive=aqi_accuracy_label,
+            name="Air Quality Accuracy Status", icon="mdi:information-outline",
+        ),
+        Field(
+            "air_quality_label", derive=aqi_label, required=False,
+            name="Air Quality Rating", icon="mdi:air-filter",
+        ),
+        Field(
+            "breath_voc", ("air_quality", "bVOC"), digits=3, legacy="breath_voc", line="bvoc",
+            name="Breath VOC", unit="ppm", device_class="volatile_organic_compounds_parts",
+            state_class="measurement", precision=2,
+        ),
+        Field(
+            "estimated_co2", ("air_quality", "CO2e"), digits=0, legacy="est_co2", line="co2",
+            name="Estimated CO2", unit="ppm", device_class="carbon_dioxide", state_class="measurement", precision=0,
+        ),
+        Field(
+            "gas_resistance", ("air", "G_ohm"), digits=0, legacy="gas_resistance", line="gas-resistance",
+            name="Gas Resistance", unit="Ω", state_class="measurement", icon="mdi:resistor", precision=0,
+        ),
+        Field(
+            "peak_amplitude", ("sound", "peak_amp_mPa"), digits=2, legacy="peak_amplitude", line="sound-peak-amp",
+            name="Peak Amplitude", unit="mPa", state_class="measurement", icon="mdi:waveform", precision=2,
+        ),
+        Field(
+            "sound_pressure", ("sound", "SPL_dBA"), digits=2, legacy="dba", line="sound-decibels",
+            name="Sound Pressure", unit="dB", device_class="sound_pressure", state_class="measurement", precision=1,
+        ),
+    ])
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Publish destinations ("sinks") for the publisher scripts.
+
+Each sink pairs a destination (an MQTT broker, a local file or a local
+SQLite store) with a serializer that turns a reading into that
+destination's payload, and has its own bounded queue and worker thread:
+
+- publish() only queues the reading, so a slow or unreachable destination
+  never holds up the sensor loop or the other sinks
+- when a queue is full the oldest reading is dropped (and counted)
+- a failed send is retried up to "retries" times, waiting "retry_delay"
+  seconds, doubling up to RETRY_MAX_DELAY, before the reading is given up
+- report() prints each sink's counters; an MQTT sink counts readings as
+  "queued" once paho has accepted them (or the offline buffer has), and at
+  QoS 1 and up also counts the broker's acknowledgements as "acked". A
+  reading paho has accepted is never published again by the sink: paho
+  resends it itself until it is acknowledged
+
+Sinks are described by a list of dicts, usually loaded from a JSON file
+(see sinks.example.json):
+
+    {"sinks": [
+        {"name": "NAS", "type": "mqtt", "host": "192.168.1.10",
+         "topic": "homedev", "serializer": "legacy-json"},
+        {"name": "Log", "type": "file", "path": "/home/pi/ms430.jsonl",
+         "serializer": "ha-json"}
+    ]}
+
+Keys for every sink: name, type ("mqtt", "file" or "sqlite"), serializer, and
+optionally queue_size, retries, retry_delay. MQTT sinks also take host,
+topic, port, username, password, qos, retain, offline_buffer_dir (see
+offline_buffer.py), availability_topic (gets "online" on every connect,
+"offline" on stop and as the last will, retained unless
+retain_availability is false) and on_connect (the name of an extra connect
+callback supplied by the script, e.g. for Home Assistant discovery). File
+sinks take path and write one payload per line. SQLite sinks keep history
+on the device (see local_store.py): they take path, sensor (the series
+name, default the sink's name) and optionally raw_days, minute_days and
+hour_days, and their serializer returns a flat dict of fields, with the
+reading's Unix time under "timestamp"; their "bytes" count fields.
+
+Serializers are supplied by the script as a dict of name to
+serializer(reading, config), returning the payload text, or None to skip
+the reading for that sink; the script decides what a reading is.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from local_store import DEFAULT_HOUR_DAYS, DEFAULT_MINUTE_DAYS, DEFAULT_RAW_DAYS, LocalStore
+from mqtt_connection import MQTTConnection
+from offline_buffer import BufferedPublisher
+
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# How long stop() lets each sink finish what is queued (seconds)
+STOP_TIMEOUT = 5.0
+
+
+class Sink(object):
+    """
+    Base class: a queue, a worker thread and counters. Subclasses implement
+    send(payload, reading) (True if it was sent; False, or an exception,
+    only if nothing was handed on, as the reading is then retried) and
+    optionally open() and close(). sent_label names the sent counter in
+    stats_line().
+    """
+
+    sent_label = "sent"
+
+    def __init__(self, config, serializer):
+        self.config = config
+        self.name = config["name"]
+        self.serializer = serializer
+        self.retries = config.get("retries", DEFAULT_RETRIES)
+        self.retry_delay = config.get("retry_delay", DEFAULT_RETRY_DELAY)
+
+        self.queue = queue.Queue(config.get("queue_size", DEFAULT_QUEUE_SIZE))
+        self.stopping = threading.Event()
+        self.thread = None
+
+        self.offered = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, payload, reading):
+        raise NotImplementedError
+
+    def start(self):
+        self.open()
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._worker, name=f"sink-{self.name}", daemon=True)
+        self.thread.start()
+
+    def offer(self, reading):
+        """
+        Queue a reading, dropping the oldest queued one if the queue is full.
+        """
+
+        self.offered += 1
+        while True:
+            try:
+                self.queue.put_nowait(reading)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    print(f"{self.name} sink queue full, dropped the oldest reading", flush=True)
+                except queue.Empty:
+                    pass
+
+    def _deliver(self, reading):
+        payload = self.serializer(reading, self.config)
+        if payload is None:
+            self.skipped += 1
+            return
+
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                if self.send(payload, reading):
+                    self.sent += 1
+                    self.sent_bytes += len(payload)
+                    return
+            except Exception as exc:
+                print(f"{self.name} sink error: {exc}", flush=True)
+
+            if attempt == self.retries or self.stopping.wait(delay):
+                break
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+        self.failed += 1
+        print(f"{self.name} sink gave up on a reading after {attempt + 1} attempts", flush=True)
+
+    def _worker(self):
+        while True:
+            try:
+                reading = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            self._deliver(reading)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.close()
+
+    def stats_line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"{self.name:<10} {self.sent_label} {self.sent} ({self.sent / elapsed * 60:.1f}/min, {self.sent_bytes} bytes)"
+            f"  dropped {self.dropped}  failed {self.failed}  skipped {self.skipped}"
+            f"  waiting {self.queue.qsize()}"
+        )
+
+
+class MQTTSink(Sink):
+    # send() succeeds once paho has queued the message, which is not proof it reached the broker
+    sent_label = "queued"
+
+    def __init__(self, config, serializer, on_connect=None, client_id=None):
+        super(MQTTSink, self).__init__(config, serializer)
+        self.topic = config["topic"]
+        self.qos = config.get("qos", 1)
+        self.retain = config.get("retain", False)
+        self.availability_topic = config.get("availability_topic")
+        self.retain_availability = config.get("retain_availability", True)
+        self.extra_on_connect = on_connect
+
+        self.connection = MQTTConnection(
+            config["host"],
+            client_id or self.name,
+            port=config.get("port", 1883),
+            username=config.get("username"),
+            password=config.get("password"),
+            label=self.name,
+            on_connect=self._on_connect,
+        )
+        if self.availability_topic:
+            self.connection.will_set(self.availability_topic, payload="offline", qos=self.qos, retain=self.retain_availability)
+
+        self.publisher = BufferedPublisher(self.connection, config.get("offline_buffer_dir"))
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            return
+        if self.extra_on_connect:
+            self.extra_on_connect(client, userdata, flags, rc)
+        if self.availability_topic:
+            client.publish(self.availability_topic, payload="online", qos=self.qos, retain=self.retain_availability)
+
+    def open(self):
+        self.connection.start()
+        self.publisher.start()
+
+    def wait_connected(self):
+        return self.connection.wait_connected()
+
+    def send(self, payload, reading):
+        # With an offline buffer this also succeeds while disconnected
+        if self.publisher.buffer is None and not self.connection.is_connected:
+            return False
+        return self.publisher.publish(self.topic, payload, qos=self.qos, retain=self.retain)
+
+    def stats_line(self):
+        line = super(MQTTSink, self).stats_line()
+        if self.qos > 0:
+            line += f"  acked {self.publisher.acknowledged()}"
+        return line
+
+    def close(self):
+        self.publisher.stop()
+        if self.availability_topic and self.connection.is_connected:
+            info = self.connection.publish(self.availability_topic, payload="offline", qos=self.qos, retain=self.retain_availability)
+            info.wait_for_publish(1.0)
+        self.connection.stop()
+
+
+class FileSink(Sink):
+    def __init__(self, config, serializer, **unused):
+        super(FileSink, self).__init__(config, serializer)
+        self.path = config["path"]
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, "a")
+
+    def send(self, payload, reading):
+        self.file.write(payload + "\n")
+        self.file.flush()
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class StoreSink(Sink):
+    def __init__(self, config, serializer, **unused):
+        super(StoreSink, self).__init__(config, serializer)
+        self.path = config["path"]
+        self.sensor = config.get("sensor", self.name)
+        self.store = None
+
+    def open(self):
+        self.store = LocalStore(
+            self.path,
+            raw_days=self.config.get("raw_days", DEFAULT_RAW_DAYS),
+            minute_days=self.config.get("minute_days", DEFAULT_MINUTE_DAYS),
+            hour_days=self.config.get("hour_days", DEFAULT_HOUR_DAYS),
+        )
+
+    def send(self, payload, reading):
+        fields = dict(payload)
+        timestamp = fields.pop("timestamp", None)
+        self.store.add(fields, timestamp, sensor=self.sensor)
+        return True
+
+    def close(self):
+        if self.store:
+            self.store.close()
+            self.store = None
+
+
+SINK_TYPES = {
+    "mqtt": MQTTSink,
+    "file": FileSink,
+    "sqlite": StoreSink,
+}
+
+
+def load_sink_configs(path):
+    """
+    The list of sink configs from a JSON file of the form {"sinks": [...]}.
+    """
+
+    with open(path) as config_file:
+        return json.load(config_file)["sinks"]
+
+
+class SinkSet(object):
+    """
+    The sinks built from configs. serializers maps serializer names to
+    functions; on_connect maps on_connect names to extra MQTT connect
+    callbacks. client_prefix is prepended to MQTT client ids.
+    """
+
+    def __init__(self, configs, serializers, on_connect=None, client_prefix=""):
+        on_connect = on_connect or {}
+        self.sinks = []
+
+        for config in configs:
+            name = config.get("name")
+            if config.get("type") not in SINK_TYPES:
+                raise ValueError(f"Sink {name!r}: unknown type {config.get('type')!r}, expected one of {sorted(SINK_TYPES)}")
+            if config.get("serializer") not in serializers:
+                raise ValueError(f"Sink {name!r}: unknown serializer {config.get('serializer')!r}, expected one of {sorted(serializers)}")
+            if config.get("on_connect") and config["on_connect"] not in on_connect:
+                raise ValueError(f"Sink {name!r}: unknown on_connect {config['on_connect']!r}")
+
+            options = {}
+            if config["type"] == "mqtt":
+                options["on_connect"] = on_connect.get(config.get("on_connect"))
+                options["client_id"] = f"{client_prefix}{name}".lower().replace(" ", "_")
+
+            self.sinks.append(SINK_TYPES[config["type"]](config, serializers[config["serializer"]], **options))
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+
+    def wait_connected(self):
+        for sink in self.sinks:
+            if isinstance(sink, MQTTSink):
+                sink.wait_connected()
+
+    def publish(self, reading):
+        for sink in self.sinks:
+            sink.offer(reading)
+
+    def report(self):
+        for sink in self.sinks:
+            print(sink.stats_line(), flush=True)
+
+    def stop(self):
+        for sink in self.sinks:
+            sink.stopping.set()
+        for sink in self.sinks:
+            sink.stop()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Start-up cost of the publisher scripts, to catch slow-start regressions.
+
+systemd restarts a script after a crash or reboot, and on a Pi Zero every
+library imported before the first reading delays the first publish. Two
+measurements per entry point:
+
+- imports (default): the modules each script imports at the top, found by
+  parsing the script, imported in a fresh interpreter under
+  "python -X importtime". Reports the interpreter's wall time and the
+  import time, with the slowest modules. Needs no hardware or broker;
+  modules that are not installed are listed as missing.
+
+- publish (--publish): runs each script under -X importtime and times how
+  long it takes until a message from it reaches the broker at --host,
+  then stops it. Needs the sensors attached and each script's
+  brokerAddress pointing at --host, with nothing else publishing there.
+  Retained messages already on the broker are ignored.
+
+--save writes the results as JSON; --compare reads a previous --save and
+exits with status 1 if any entry point got more than --tolerance slower,
+e.g. on the Pi after an upgrade:
+
+    python3 startup-benchmark.py --save startup.json
+    ...
+    python3 startup-benchmark.py --compare startup.json
+
+Usage:
+    python3 startup-benchmark.py [--publish] [--host localhost] [--port 1883]
+                                 [--timeout 120] [--repeat 3] [--top 5]
+                                 [--save FILE] [--compare FILE] [--tolerance 0.2]
+                                 [script ...]
+"""
+
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Every *-mqtt.py and *-capture.py publisher, unless scripts are given
+ENTRY_POINT_PATTERNS = ("*-mqtt.py", "*-capture.py")
+
+
+def entry_points():
+    scripts = set()
+    for pattern in ENTRY_POINT_PATTERNS:
+        scripts.update(os.path.basename(path) for path in glob.glob(os.path.join(HERE, pattern)))
+    return sorted(scripts)
+
+
+def top_level_imports(path):
+    """
+    Modules a script imports at the top level (including inside top-level
+    try and if blocks), in order. Imports inside functions, or after the
+    script has started connecting, are deliberately lazy and not counted.
+    """
+
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+
+    modules = []
+
+    def visit(statements):
+        for node in statements:
+            if isinstance(node, ast.Import):
+                modules.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                modules.append(node.module)
+            elif isinstance(node, ast.Try):
+                visit(node.body)
+            elif isinstance(node, ast.If):
+                visit(node.body)
+                visit(node.orelse)
+            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+                # Docstring
+                continue
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            elif modules and not isinstance(node, (ast.Assign, ast.AnnAssign)):
+                # The script has started doing work; anything imported after this is lazy
+                return
+
+    visit(tree.body)
+    return list(dict.fromkeys(modules))
+
+
+def parse_importtime(stderr):
+    """
+    {module: cumulative microseconds} for the top-level imports in
+    "python -X importtime" output, and the remaining stderr lines.
+    """
+
+    times = {}
+    other = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            other.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        if name.strip() and not name[1:].startswith(" "):
+            # Nested imports are indented; only count each top-level one once
+            times[name.strip()] = int(fields[1])
+    return times, other
+
+
+_startup_modules = None
+
+
+def startup_modules():
+    """
+    Modules the interpreter imports before running any script, which are
+    not the script's doing.
+    """
+
+    global _startup_modules
+    if _startup_modules is None:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "pass"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        _startup_modules = set(parse_importtime(result.stderr)[0])
+    return _startup_modules
+
+
+def own_imports(times):
+    excluded = startup_modules()
+    return {name: us for name, us in times.items() if name not in excluded}
+
+
+IMPORT_RUNNER = """
+import sys
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except Exception as exc:
+        print("missing " + name + ": " + type(exc).__name__ + ": " + str(exc), file=sys.stderr)
+"""
+
+
+def measure_imports(script):
+    modules = top_level_imports(os.path.join(HERE, script))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_RUNNER] + modules,
+        cwd=HERE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall = time.perf_counter() - start
+    times, other = parse_importtime(result.stderr)
+    own = own_imports(times)
+    missing = [line[len("missing "):] for line in other if line.startswith("missing ")]
+    return {
+        "wall_ms": wall * 1000.0,
+        "import_ms": sum(own.values()) / 1000.0,
+        "modules": own,
+        "missing": missing,
+    }
+
+
+def connect_listener(host, port):
+    # Imported here so the default mode runs without paho installed
+    from mqtt_connection import MQTTConnection
+
+    subscribed = threading.Event()
+    listener = {"first": None, "event": threading.Event()}
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("#")
+
+    def on_subscribe(client, userdata, mid, granted_qos):
+        subscribed.set()
+
+    def on_message(client, userdata, message):
+        # Retained messages are delivered straight after subscribing
+        if not message.retain and listener["first"] is None:
+            listener["first"] = time.perf_counter()
+            listener["event"].set()
+
+    connection = MQTTConnection(host, f"startup-benchmark-{os.getpid()}", port=port, on_connect=on_connect)
+    connection.client.on_subscribe = on_subscribe
+    connection.client.on_message = on_message
+    connection.start()
+    if not connection.wait_connected(10) or not subscribed.wait(10):
+        sys.exit(f"Could not subscribe at {host}:{port}")
+    return connection, listener
+
+
+def measure_publish(script, connection, listener, timeout):
+    # Let deliveries from the previous script drain first
+    time.sleep(1)
+    listener["first"] = None
+    listener["event"].clear()
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", script],
+        cwd=HERE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    published = listener["event"].wait(timeout)
+    first = listener["first"]
+    process.terminate()
+    try:
+        _, stderr = process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        _, stderr = process.communicate()
+
+    times, _ = parse_importtime(stderr)
+    own = own_imports(times)
+    return {
+        "first_publish_ms": (first - start) * 1000.0 if published else None,
+        "import_ms": sum(own.values()) / 1000.0,
+        "modules": own,
+    }
+
+
+def best_of(runs):
+    # The fastest run is the least disturbed by the rest of the system
+    key = "first_publish_ms" if "first_publish_ms" in runs[0] else "wall_ms"
+    valid = [run for run in runs if run[key] is not None]
+    return min(valid, key=lambda run: run[key]) if valid else runs[0]
+
+
+def slowest(modules, top):
+    ranked = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return ", ".join(f"{name} {us / 1000.0:.0f}" for name, us in ranked)
+
+
+def print_result(script, result, top):
+    if "first_publish_ms" in result:
+        first = result["first_publish_ms"]
+        headline = f"first publish {first:>8.0f} ms" if first is not None else "no publish before timeout"
+    else:
+        headline = f"wall {result['wall_ms']:>6.0f} ms"
+    print(f"{script:<28} {headline}   imports {result['import_ms']:>6.0f} ms   slowest: {slowest(result['modules'], top)}", flush=True)
+    for line in result.get("missing", []):
+        print(f"{'':<28} missing {line}", flush=True)
+
+
+def compare(results, baseline_file, tolerance):
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for script, result in results.items():
+        before = baseline.get(script)
+        if before is None:
+            continue
+        key = "first_publish_ms" if "first_publish_ms" in result else "wall_ms"
+        if before.get(key) is None or result[key] is None:
+            continue
+        change = result[key] / before[key] - 1
+        marker = "  REGRESSION" if change > tolerance else ""
+        print(f"{script:<28} {before[key]:>8.0f} -> {result[key]:>8.0f} ms ({change * 100:+.0f}%){marker}")
+        if change > tolerance:
+            regressions.append(script)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the publisher scripts' start-up.")
+    parser.add_argument("scripts", nargs="*", help="entry points (default: every *-mqtt.py and *-capture.py)")
+    parser.add_argument("--publish", action="store_true", help="time to first publish instead of imports only")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a script's first publish")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per script; the fastest is reported")
+    parser.add_argument("--top", type=int, default=5, help="slowest modules to list per script")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    scripts = args.scripts or entry_points()
+    results = {}
+
+    connection = listener = None
+    if args.publish:
+        connection, listener = connect_listener(args.host, args.port)
+
+    try:
+        for script in scripts:
+            if args.publish:
+                runs = [measure_publish(script, connection, listener, args.timeout) for _ in range(args.repeat)]
+            else:
+                runs = [measure_imports(script) for _ in range(args.repeat)]
+            results[script] = best_of(runs)
+            print_result(script, results[script], args.top)
+    finally:
+        if connection:
+            connection.stop()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        print()
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            sys.exit(f"Start-up regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BME280 + TSL2561 read cycle latency.
+
+Runs both sensors on a simulated I2C bus (see fake_hardware.py) and times
+one read cycle of bme280-tsl2561-json-mqtt.py for:
+
+- get_light:   what the scripts used to do - BME280 forced read, then power
+               the TSL2561 on, sleep 0.5 s and read raw counts
+- sequential:  tsl2561.TSL2561.read() after the BME280 read, for each
+               integration time
+- overlapped:  light.start(), BME280 read while it integrates,
+               light.collect(), for each integration time
+
+Usage: python3 tsl2561-benchmark.py [cycles]
+"""
+
+import sys
+import time
+
+import bme280
+import tsl2561
+from fake_hardware import FakeSMBus, attach_bme280, attach_tsl2561
+
+
+def get_light(bus):
+    # The old fixed-sleep read, kept here for comparison
+    bus.write_byte_data(0x39, 0x00 | 0x80, 0x03)
+    bus.write_byte_data(0x39, 0x01 | 0x80, 0x02)
+    time.sleep(0.5)
+    full_data = bus.read_i2c_block_data(0x39, 0x0C | 0x80, 2)
+    ir_data = bus.read_i2c_block_data(0x39, 0x0E | 0x80, 2)
+    return (full_data[1] * 256 + full_data[0]) - (ir_data[1] * 256 + ir_data[0])
+
+
+def run(label, cycle, cycles):
+    i2c_bus = FakeSMBus(simulate_timing=True)
+    attach_bme280(i2c_bus, bme280.DEVICE)
+    attach_tsl2561(i2c_bus)
+    weather = bme280.BME280(bme280.DEVICE, i2c_bus)
+    light = tsl2561.TSL2561(i2c_bus)
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        result = cycle(i2c_bus, weather, light)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed * 1000 / cycles:>7.1f} ms/cycle   light = {result:.1f}", flush=True)
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    def old(i2c_bus, weather, light):
+        weather.read()
+        return get_light(i2c_bus)
+
+    run("get_light (counts)", old, cycles)
+
+    for name, integration in (
+        ("402 ms", tsl2561.INTEGRATION_402MS),
+        ("101 ms", tsl2561.INTEGRATION_101MS),
+        ("13 ms", tsl2561.INTEGRATION_13MS),
+    ):
+        def sequential(i2c_bus, weather, light, integration=integration):
+            light.integration = integration
+            weather.read()
+            return light.read()
+
+        def overlapped(i2c_bus, weather, light, integration=integration):
+            light.integration = integration
+            light.start()
+            weather.read()
+            return light.collect()
+
+        run(f"sequential {name}", sequential, cycles)
+        run(f"overlapped {name}", overlapped, cycles)
+
+
+if __name__ == "__main__":
+    main()
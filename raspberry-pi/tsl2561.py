@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TSL2561 ambient light sensor driver.
+
+The scripts used to power the sensor on, sleep half a second and return
+broadband minus infrared counts. TSL2561 instead:
+
+- offers 13.7, 101 and 402 ms integration (INTEGRATION_*) and 1x or 16x
+  gain (GAIN_*)
+- converts the two channels to lux with the datasheet's T/FN/CL package
+  formula, after scaling them to 402 ms and 16x
+- with auto_gain, drops to 1x when a 16x reading saturates (and measures
+  again) and goes back to 16x once the light is low enough for it, with
+  hysteresis so it does not flip between the two
+- splits a reading into start() and collect(), so the caller can do other
+  work - e.g. read the BME280 - while the sensor integrates:
+
+      light = TSL2561(bus)
+      light.start()
+      temperature, pressure, humidity = bme280.readBME280All()
+      lux = light.collect()
+
+  collect() only sleeps for whatever part of the integration time is left.
+  read() is start() and collect() in one call.
+
+The sensor is powered up by start() and powered down again by collect(),
+so it draws almost nothing between readings.
+
+Register numbers and formulas are from the TAOS TSL2560/TSL2561 datasheet
+(TAOS059N).
+"""
+
+import time
+
+import i2c_manager
+
+
+DEFAULT_ADDRESS = 0x39  # ADDR pin floating; 0x29 to GND, 0x49 to VDD
+
+# Command register bits - page 13
+COMMAND = 0x80
+
+# Registers - page 13
+REG_CONTROL = 0x00
+REG_TIMING = 0x01
+REG_ID = 0x0A
+REG_DATA0 = 0x0C  # channel 0: visible + infrared
+REG_DATA1 = 0x0E  # channel 1: infrared
+
+POWER_ON = 0x03
+POWER_OFF = 0x00
+
+# Timing register - page 15
+GAIN_1X = 0x00
+GAIN_16X = 0x10
+
+INTEGRATION_13MS = 0x00
+INTEGRATION_101MS = 0x01
+INTEGRATION_402MS = 0x02
+
+# Nominal integration time, and how long to wait for a conversion to be
+# safely complete (the internal oscillator can run slow), in seconds
+INTEGRATION_TIME = {
+    INTEGRATION_13MS: 0.0137,
+    INTEGRATION_101MS: 0.101,
+    INTEGRATION_402MS: 0.402,
+}
+INTEGRATION_WAIT = {
+    INTEGRATION_13MS: 0.015,
+    INTEGRATION_101MS: 0.120,
+    INTEGRATION_402MS: 0.450,
+}
+
+# Factor scaling counts at each integration time to 402 ms - page 23
+INTEGRATION_SCALE = {
+    INTEGRATION_13MS: 322 / 11,
+    INTEGRATION_101MS: 322 / 81,
+    INTEGRATION_402MS: 1.0,
+}
+
+# Channel 0 counts at which each integration time saturates (the shorter
+# ones are limited by the ADC's count rate, not the 16-bit register)
+SATURATION = {
+    INTEGRATION_13MS: 5047,
+    INTEGRATION_101MS: 37177,
+    INTEGRATION_402MS: 65535,
+}
+
+# Auto-gain: at 16x, readings at or above SATURATION * AUTO_GAIN_HIGH switch
+# to 1x; at 1x, readings below SATURATION * AUTO_GAIN_LOW / 16 switch back.
+# The gap between the two keeps it from switching on every reading.
+AUTO_GAIN_HIGH = 0.95
+AUTO_GAIN_LOW = 0.5
+
+
+def lux(ch0, ch1, gain=GAIN_16X, integration=INTEGRATION_402MS):
+    """
+    Illuminance in lux from raw channel counts taken at gain and
+    integration, using the datasheet's T, FN and CL package formula
+    (page 23). Returns None for a saturated reading, 0.0 for no light.
+    """
+
+    if ch0 >= SATURATION[integration] or ch1 >= SATURATION[integration]:
+        return None
+
+    scale = INTEGRATION_SCALE[integration] * (16 if gain == GAIN_1X else 1)
+    ch0 *= scale
+    ch1 *= scale
+    if ch0 == 0:
+        return 0.0
+
+    ratio = ch1 / ch0
+    if ratio <= 0.50:
+        value = 0.0304 * ch0 - 0.062 * ch0 * ratio ** 1.4
+    elif ratio <= 0.61:
+        value = 0.0224 * ch0 - 0.031 * ch1
+    elif ratio <= 0.80:
+        value = 0.0128 * ch0 - 0.0153 * ch1
+    elif ratio <= 1.30:
+        value = 0.00146 * ch0 - 0.00112 * ch1
+    else:
+        value = 0.0
+    return max(value, 0.0)
+
+
+class TSL2561(object):
+    """
+    A TSL2561 at addr on i2c_bus (default: the shared bus 1 from
+    i2c_manager).
+
+    After each collect(), ch0 and ch1 hold the raw counts the lux came
+    from. gain is the gain the next start() will use.
+    """
+
+    def __init__(
+        self,
+        i2c_bus=None,
+        addr=DEFAULT_ADDRESS,
+        integration=INTEGRATION_402MS,
+        gain=GAIN_16X,
+        auto_gain=True,
+    ):
+        if integration not in INTEGRATION_TIME:
+            raise ValueError(f"Unknown integration setting {integration!r}")
+        self.bus = i2c_bus if i2c_bus is not None else i2c_manager.get_bus()
+        self.addr = addr
+        self.integration = integration
+        self.gain = gain
+        self.auto_gain = auto_gain
+        self.started = None
+        self.ch0 = None
+        self.ch1 = None
+        self.gain_changes = 0
+
+    def read_id(self):
+        # Part number in the high nibble (0x5 for the T/FN/CL TSL2561), revision in the low
+        return self.bus.read_byte_data(self.addr, COMMAND | REG_ID)
+
+    def start(self):
+        """
+        Power up and begin integrating with the current settings.
+        """
+
+        self.bus.write_byte_data(self.addr, COMMAND | REG_CONTROL, POWER_ON)
+        self.bus.write_byte_data(self.addr, COMMAND | REG_TIMING, self.gain | self.integration)
+        self.started = time.monotonic()
+
+    def remaining(self):
+        """
+        Seconds until the conversion started by start() can be collected.
+        """
+
+        if self.started is None:
+            return None
+        return max(0.0, self.started + INTEGRATION_WAIT[self.integration] - time.monotonic())
+
+    def _read_channels(self):
+        data0 = self.bus.read_i2c_block_data(self.addr, COMMAND | REG_DATA0, 2)
+        data1 = self.bus.read_i2c_block_data(self.addr, COMMAND | REG_DATA1, 2)
+        return data0[1] << 8 | data0[0], data1[1] << 8 | data1[0]
+
+    def _wait_and_read(self):
+        delay = self.remaining()
+        if delay:
+            time.sleep(delay)
+        self.ch0, self.ch1 = self._read_channels()
+
+    def _adjust_gain(self):
+        # True if the gain changed
+        saturation = SATURATION[self.integration]
+        if self.gain == GAIN_16X and max(self.ch0, self.ch1) >= saturation * AUTO_GAIN_HIGH:
+            self.gain = GAIN_1X
+        elif self.gain == GAIN_1X and self.ch0 < saturation * AUTO_GAIN_LOW / 16:
+            self.gain = GAIN_16X
+        else:
+            return False
+        self.gain_changes += 1
+        return True
+
+    def collect(self):
+        """
+        Wait for the rest of the integration time, read the result and power
+        down. Returns lux, or None if the sensor is saturated even at 1x.
+
+        With auto_gain, a reading that saturates at 16x is measured again at
+        1x straight away (one more integration time); a low reading at 1x is
+        still returned, and the next start() uses 16x.
+        """
+
+        if self.started is None:
+            self.start()
+        self._wait_and_read()
+        reading_gain = self.gain
+
+        if self.auto_gain and self._adjust_gain() and reading_gain == GAIN_16X:
+            self.start()
+            self._wait_and_read()
+            reading_gain = self.gain
+
+        self.bus.write_byte_data(self.addr, COMMAND | REG_CONTROL, POWER_OFF)
+        self.started = None
+        return lux(self.ch0, self.ch1, reading_gain, self.integration)
+
+    def read(self):
+        self.start()
+        return self.collect()